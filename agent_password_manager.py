@@ -0,0 +1,369 @@
+"""Agent de déverrouillage de Big Key (dans l'esprit de `ssh-agent`).
+
+L'agent déverrouille le coffre une fois (une seule dérivation de clé) puis répond aux
+clients sur une socket Unix réservée à l'utilisateur :
+
+    python -m agent_password_manager --master-stdin &      # affiche BIG_KEY_AGENT_SOCK=...
+    python -m cli_password_manager get exemple.fr alice    # servi par l'agent
+
+Protocole : une requête JSON par ligne, une réponse JSON par ligne, sur une connexion
+que le client peut garder ouverte. Requêtes : `ping`, `status`, `get`, `list`,
+`generate`, `unlock`, `lock`, `stop`. Chaque réponse porte `"ok"` ; en cas d'échec,
+`"error"` (message) et `"code"` (`locked`, `not_found`, `usage` ou `error`).
+
+Après `DELAI_INACTIVITE_S` secondes sans requête, ou sur `lock`, l'agent oublie la
+session (clé et données) et refuse les lectures jusqu'au prochain `unlock`. Les
+modifications faites ailleurs (interface, ligne de commande) sont relues à la
+demande, avec la clé en mémoire, sans jamais écrire dans le coffre.
+"""
+import json
+import os
+import socket
+import struct
+import sys
+
+import core_password_manager as core
+
+
+AGENT_SOCKET_ENV = "BIG_KEY_AGENT_SOCK"
+DELAI_INACTIVITE_S = 15 * 60
+TAILLE_MAX_REQUETE = 64 * 1024
+
+# `asyncio` (plusieurs dizaines de ms à importer) ne sert qu'au serveur : un client
+# lancé depuis un script n'en paie pas le coût.
+asyncio = None
+
+def _charger_asyncio():
+    global asyncio
+    if asyncio is None:
+        import asyncio
+
+
+class ErreurAgent(Exception):
+    """Agent injoignable, ou requête refusée par l'agent (voir `code`)."""
+    def __init__(self, message: str, code: str = "error"):
+        super().__init__(message)
+        self.code = code
+
+
+def chemin_socket_defaut() -> str:
+    """Socket dans un répertoire privé (0700) : `$XDG_RUNTIME_DIR/big-key/` ou `/tmp/big-key-<uid>/`."""
+    if os.environ.get(AGENT_SOCKET_ENV):
+        return os.environ[AGENT_SOCKET_ENV]
+    if os.environ.get("XDG_RUNTIME_DIR"):
+        return os.path.join(os.environ["XDG_RUNTIME_DIR"], "big-key", "agent.sock")
+    return os.path.join("/tmp", f"big-key-{os.getuid()}", "agent.sock")
+
+
+def _uid_pair(sock: socket.socket) -> int:
+    """Uid du processus client (Linux : SO_PEERCRED ; ailleurs, les droits du répertoire suffisent)."""
+    if sock is None or not hasattr(socket, "SO_PEERCRED"):
+        return os.getuid()
+    _pid, uid, _gid = struct.unpack("3i", sock.getsockopt(socket.SOL_SOCKET, socket.SO_PEERCRED, struct.calcsize("3i")))
+    return uid
+
+
+# --- Serveur ---
+
+class AgentCoffre:
+    """Sert un coffre déverrouillé à de nombreux clients concurrents (asyncio)."""
+    def __init__(self, chemin_socket: str, delai_inactivite: float = DELAI_INACTIVITE_S):
+        _charger_asyncio()
+        self.chemin_socket = chemin_socket
+        self.delai_inactivite = delai_inactivite
+        self.session = None
+        self._signature = None
+        self._verrou_lecture = asyncio.Lock()
+        self._derniere_activite = 0.0
+        self._serveur = None
+        self._arret = None
+        self._clients = set() # Écrivains des connexions ouvertes
+
+    @property
+    def verrouille(self) -> bool:
+        return self.session is None
+
+    # Cycle de vie
+
+    async def deverrouiller(self, mot_passe_maitre: str):
+        """Dérive la clé (hors de la boucle d'événements) et charge le coffre."""
+        if not os.path.exists(core.STORAGE_FILENAME):
+            raise ErreurAgent(f"Aucun coffre '{core.STORAGE_FILENAME}' dans '{os.getcwd()}'.")
+        boucle = asyncio.get_running_loop()
+        try:
+            session = await boucle.run_in_executor(None, core.charger_ou_creer_stockage, mot_passe_maitre, False)
+        except ValueError as e:
+            raise ErreurAgent(str(e))
+        self.session, self._signature = session, session._signature # Signature prise sous le verrou du chargement
+        self._derniere_activite = boucle.time()
+        print("Agent : coffre déverrouillé.")
+
+    def verrouiller(self):
+        """Oublie la clé et les données ; seules `generate` et `unlock` restent possibles."""
+        if self.session is not None:
+            self.session = None
+            print("Agent : coffre verrouillé.")
+
+    async def _rafraichir(self):
+        """Relit le coffre si un autre processus l'a modifié depuis le dernier chargement."""
+        async with self._verrou_lecture:
+            signature = core.signature_stockage()
+            if self.session is None or signature == self._signature:
+                return
+            session = self.session
+            try:
+                donnees = await asyncio.get_running_loop().run_in_executor(None, core.relire_stockage, session)
+            except (OSError, ValueError) as e: # Clé changée (rotation) ou fichier illisible
+                print(f"Agent : relecture impossible ({e}), verrouillage.")
+                self.verrouiller()
+                return
+            if self.session is session:
+                session.passwords_data, self._signature = donnees, signature
+                session._index_recherche = None # Reconstruit à la prochaine recherche
+
+    async def _surveiller_inactivite(self):
+        boucle = asyncio.get_running_loop()
+        while True:
+            reste = self._derniere_activite + self.delai_inactivite - boucle.time()
+            if reste <= 0:
+                self.verrouiller()
+                reste = self.delai_inactivite
+            await asyncio.sleep(reste)
+
+    async def servir(self, mot_passe_maitre: str = None):
+        """Ouvre la socket et sert les clients jusqu'à `stop`."""
+        if mot_passe_maitre is not None:
+            await self.deverrouiller(mot_passe_maitre)
+        dossier = os.path.dirname(self.chemin_socket)
+        os.makedirs(dossier, mode=0o700, exist_ok=True)
+        os.chmod(dossier, 0o700)
+        if os.path.exists(self.chemin_socket):
+            os.unlink(self.chemin_socket) # Socket d'un agent précédent
+        ancien_umask = os.umask(0o177)
+        try:
+            self._serveur = await asyncio.start_unix_server(self._servir_client, path=self.chemin_socket, limit=TAILLE_MAX_REQUETE)
+        finally:
+            os.umask(ancien_umask)
+        self._arret = asyncio.Event()
+        surveillance = asyncio.create_task(self._surveiller_inactivite())
+        try:
+            await self._arret.wait()
+        finally:
+            surveillance.cancel()
+            self._serveur.close()
+            for ecrivain in list(self._clients):
+                ecrivain.close() # Les lectures en cours reçoivent une fin de flux
+            await asyncio.sleep(0)
+            await self._serveur.wait_closed()
+            if os.path.exists(self.chemin_socket):
+                os.unlink(self.chemin_socket)
+            self.verrouiller()
+
+    # Clients
+
+    async def _servir_client(self, lecteur: "asyncio.StreamReader", ecrivain: "asyncio.StreamWriter"):
+        if _uid_pair(ecrivain.get_extra_info("socket")) != os.getuid():
+            ecrivain.close()
+            return
+        self._clients.add(ecrivain)
+        try:
+            while True:
+                try:
+                    ligne = await lecteur.readline()
+                except (ValueError, asyncio.LimitOverrunError): # Requête plus longue que TAILLE_MAX_REQUETE
+                    break
+                if not ligne:
+                    break
+                reponse = await self._traiter_ligne(ligne)
+                ecrivain.write(json.dumps(reponse, ensure_ascii=False).encode('utf-8') + b"\n")
+                await ecrivain.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._clients.discard(ecrivain)
+            ecrivain.close()
+
+    async def _traiter_ligne(self, ligne: bytes) -> dict:
+        try:
+            requete = json.loads(ligne)
+            if not isinstance(requete, dict):
+                raise ValueError
+        except ValueError:
+            return {"ok": False, "error": "Requête JSON invalide.", "code": "usage"}
+        operation = requete.get("op")
+        traitement = getattr(self, f"_op_{operation}", None) if isinstance(operation, str) else None
+        if traitement is None:
+            return {"ok": False, "error": f"Opération inconnue : {operation!r}.", "code": "usage"}
+        self._derniere_activite = asyncio.get_running_loop().time()
+        try:
+            resultat = traitement(requete)
+            if asyncio.iscoroutine(resultat):
+                resultat = await resultat
+        except ErreurAgent as e:
+            return {"ok": False, "error": str(e), "code": e.code}
+        except (KeyError, TypeError, ValueError) as e:
+            return {"ok": False, "error": f"Requête invalide : {e}", "code": "usage"}
+        return dict(resultat, ok=True)
+
+    async def _index_recherche(self) -> "core.IndexRecherche":
+        """Index de recherche de la session, construit une seule fois hors de la boucle d'événements."""
+        async with self._verrou_lecture: # Pas de relecture du coffre pendant la construction
+            session = self.session
+            if session is None:
+                raise ErreurAgent("Agent verrouillé.", "locked")
+            if session._index_recherche is None:
+                session._index_recherche = await asyncio.get_running_loop().run_in_executor(
+                    None, core.construire_index_recherche, session.passwords_data)
+            return session._index_recherche
+
+    async def _donnees(self) -> core.PasswordData:
+        await self._rafraichir()
+        if self.session is None:
+            raise ErreurAgent("Agent verrouillé.", "locked")
+        return self.session.passwords_data
+
+    # Opérations (une méthode `_op_<nom>` par requête)
+
+    def _op_ping(self, requete: dict) -> dict:
+        return {"locked": self.verrouille}
+
+    def _op_status(self, requete: dict) -> dict:
+        etat = {"locked": self.verrouille, "idle_timeout": self.delai_inactivite, "vault": os.path.abspath(core.STORAGE_FILENAME)}
+        if self.session is not None:
+            etat["sites"] = len(self.session.passwords_data)
+        return etat
+
+    async def _op_get(self, requete: dict) -> dict:
+        donnees = await self._donnees()
+        site, utilisateur = requete["site"], requete.get("user")
+        if utilisateur is None:
+            utilisateurs = core.recuperer_utilisateurs_pour_site(donnees, site)
+            if len(utilisateurs) != 1:
+                if not utilisateurs:
+                    raise ErreurAgent(f"Site '{site}' introuvable.", "not_found")
+                raise ErreurAgent(f"Plusieurs utilisateurs pour '{site}' : précisez-en un ({', '.join(utilisateurs)}).", "usage")
+            utilisateur = utilisateurs[0]
+        mot_de_passe = core.recuperer_entree(donnees, site, utilisateur)
+        if mot_de_passe is None:
+            raise ErreurAgent(f"Entrée '{utilisateur}' introuvable pour '{site}'.", "not_found")
+        return {"site": site, "username": utilisateur, "password": mot_de_passe}
+
+    async def _op_list(self, requete: dict) -> dict:
+        donnees = await self._donnees()
+        site = requete.get("site")
+        if site is not None:
+            if site not in donnees:
+                raise ErreurAgent(f"Site '{site}' introuvable.", "not_found")
+            return {"site": site, "usernames": core.recuperer_utilisateurs_pour_site(donnees, site)}
+        if requete.get("search"):
+            return {"sites": (await self._index_recherche()).rechercher(requete["search"])}
+        return {"sites": core.lister_sites(donnees)}
+
+    def _op_generate(self, requete: dict) -> dict:
+        nombre = int(requete.get("count", 1))
+        if requete.get("words"):
+            return {"passwords": core.generer_phrases_de_passe(nombre, int(requete["words"]), requete.get("separator", "-"))}
+        options = (int(requete.get("length", 20)), requete.get("upper", True), requete.get("digits", True), requete.get("symbols", True))
+        return {"passwords": core.generer_mots_de_passe(nombre, *options)}
+
+    async def _op_unlock(self, requete: dict) -> dict:
+        if self.session is None:
+            await self.deverrouiller(requete["password"])
+        return {"locked": False}
+
+    def _op_lock(self, requete: dict) -> dict:
+        self.verrouiller()
+        return {"locked": True}
+
+    def _op_stop(self, requete: dict) -> dict:
+        self._arret.set()
+        return {}
+
+
+# --- Client ---
+
+class ClientAgent:
+    """Client bloquant ; la connexion est ouverte au premier appel puis réutilisée."""
+    def __init__(self, chemin_socket: str = None, timeout: float = 30.0):
+        self.chemin_socket = chemin_socket or chemin_socket_defaut()
+        self.timeout = timeout
+        self._socket = None
+        self._flux = None
+
+    def _connecter(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.chemin_socket)
+        except OSError as e:
+            sock.close()
+            raise ErreurAgent(f"Agent injoignable sur '{self.chemin_socket}' : {e}", "unavailable")
+        self._socket, self._flux = sock, sock.makefile("rb")
+
+    def requete(self, operation: str, **parametres) -> dict:
+        """Envoie une requête et retourne la réponse ; lève ErreurAgent si elle échoue."""
+        if self._socket is None:
+            self._connecter()
+        try:
+            self._socket.sendall(json.dumps(dict(parametres, op=operation)).encode('utf-8') + b"\n")
+            ligne = self._flux.readline()
+        except OSError as e:
+            self.fermer()
+            raise ErreurAgent(f"Connexion à l'agent perdue : {e}", "unavailable")
+        if not ligne:
+            self.fermer()
+            raise ErreurAgent("L'agent a fermé la connexion.", "unavailable")
+        reponse = json.loads(ligne)
+        if not reponse.get("ok"):
+            raise ErreurAgent(reponse.get("error", "Erreur de l'agent."), reponse.get("code", "error"))
+        return reponse
+
+    def fermer(self):
+        if self._socket is not None:
+            self._flux.close()
+            self._socket.close()
+            self._socket = self._flux = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+
+def main(argv=None) -> int:
+    import argparse
+    from cli_password_manager import ErreurCli, _ajouter_source_secret, _mot_passe_maitre
+
+    parser = argparse.ArgumentParser(prog="agent_password_manager", description="Agent de déverrouillage de Big Key.")
+    parser.add_argument("--dir", default=os.environ.get("BIG_KEY_DIR"), help="répertoire du coffre")
+    parser.add_argument("--socket", default=None, help="chemin de la socket (défaut : répertoire privé par utilisateur)")
+    parser.add_argument("--idle-timeout", type=float, default=DELAI_INACTIVITE_S, metavar="SECONDES")
+    parser.add_argument("--locked", action="store_true", help="démarrer verrouillé (déverrouillage par requête `unlock`)")
+    _ajouter_source_secret(parser, "master-", "mot de passe maître")
+    args = parser.parse_args(argv)
+
+    if not hasattr(socket, "AF_UNIX"):
+        print("Erreur : les sockets Unix ne sont pas disponibles sur ce système.", file=sys.stderr)
+        return 3
+    if args.dir:
+        os.chdir(args.dir)
+    try:
+        mot_passe_maitre = None if args.locked else _mot_passe_maitre(args)
+    except ErreurCli as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return e.code
+    agent = AgentCoffre(args.socket or chemin_socket_defaut(), args.idle_timeout)
+    print(f"{AGENT_SOCKET_ENV}={agent.chemin_socket}; export {AGENT_SOCKET_ENV};", flush=True)
+    try:
+        asyncio.run(agent.servir(mot_passe_maitre))
+    except ErreurAgent as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 3
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
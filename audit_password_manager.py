@@ -0,0 +1,424 @@
+"""Audit hors ligne des mots de passe du coffre : réutilisation, force et fuites connues.
+
+    python -m cli_password_manager audit --breaches pwned-sha1.bin
+    python -m audit_password_manager pwned-passwords-sha1-ordered-by-hash.txt pwned-sha1.bin   # conversion
+
+- Réutilisation : chaque mot de passe est haché (BLAKE2b avec une clé propre à l'audit,
+  jamais écrite) ; les entrées de même empreinte forment un groupe.
+- Force : entropie estimée d'après l'alphabet employé, les répétitions et les suites
+  comptant pour presque rien (`estimer_force`).
+- Fuites : recherche du SHA-1 (ou du NTLM) de chaque mot de passe dans un fichier local
+  d'empreintes triées, au format binaire de `convertir_hibp`. Le fichier, qui peut peser
+  des dizaines de Go, est projeté en mémoire (mmap) et interrogé par recherche par
+  interpolation : les empreintes étant uniformes, quelques lectures suffisent. Rien ne
+  passe par le réseau.
+
+`AuditCoffre` tient l'audit à jour dans un thread : il écoute les modifications du coffre
+et ne réanalyse que les entrées modifiées.
+"""
+import hashlib
+import math
+import mmap
+import os
+import queue
+import string
+import struct
+import sys
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import core_password_manager as core
+
+
+FUITES_ENV = "BIG_KEY_BREACH_FILE" # Fichier d'empreintes compromises utilisé par défaut
+
+# Fichier binaire des fuites :
+#   MAGIC_FUITES | version (1 octet) | algorithme (1 octet) | taille d'empreinte (1 octet) | 5 octets nuls
+#   puis des enregistrements de taille fixe, triés : empreinte | nombre d'occurrences (u32 BE)
+MAGIC_FUITES = b"BKBREACH"
+VERSION_FUITES = 1
+ALGOS_FUITES = {"sha1": (1, 20), "ntlm": (2, 16)}
+TAILLE_ENTETE_FUITES = 16
+INTERPOLATIONS_MAX = 12 # Ensuite, recherche dichotomique (données non uniformes)
+
+FORCE_FAIBLE = 60 # Bits en dessous desquels un mot de passe est signalé
+NIVEAUX_FORCE = ((28, "très faible"), (36, "faible"), (60, "moyen"), (80, "fort"))
+
+
+# --- Force ---
+
+def estimer_force(mot_de_passe: str) -> float:
+    """Entropie estimée (bits) : alphabet des classes employées ; répétitions et suites valent 1 bit."""
+    if not mot_de_passe:
+        return 0.0
+    alphabet = 0
+    if any(c in string.ascii_lowercase for c in mot_de_passe):
+        alphabet += 26
+    if any(c in string.ascii_uppercase for c in mot_de_passe):
+        alphabet += 26
+    if any(c in string.digits for c in mot_de_passe):
+        alphabet += 10
+    if any(c in string.punctuation or c == " " for c in mot_de_passe):
+        alphabet += 33
+    if any(ord(c) > 127 for c in mot_de_passe):
+        alphabet += 100
+    bits_par_caractere = math.log2(max(alphabet, 2))
+    bits = 0.0
+    precedent = None
+    for caractere in mot_de_passe:
+        if precedent is not None and (caractere == precedent or
+                                      (caractere.isalnum() and precedent.isalnum() and abs(ord(caractere.lower()) - ord(precedent.lower())) == 1)):
+            bits += 1 # "aaaa", "abcd", "4321"
+        else:
+            bits += bits_par_caractere
+        precedent = caractere
+    return bits
+
+def niveau_force(bits: float) -> str:
+    for seuil, niveau in NIVEAUX_FORCE:
+        if bits < seuil:
+            return niveau
+    return "très fort"
+
+
+# --- Corpus de fuites ---
+
+def _md4(donnees: bytes) -> bytes:
+    """MD4 (RFC 1320), pour NTLM quand OpenSSL ne le fournit plus."""
+    masque = 0xFFFFFFFF
+    def rotation(x, n):
+        x &= masque
+        return ((x << n) | (x >> (32 - n))) & masque
+    f = lambda x, y, z: (x & y) | (~x & z)
+    g = lambda x, y, z: (x & y) | (x & z) | (y & z)
+    h = lambda x, y, z: x ^ y ^ z
+    message = donnees + b"\x80" + b"\x00" * ((55 - len(donnees)) % 64) + struct.pack("<Q", len(donnees) * 8)
+    a, b, c, d = 0x67452301, 0xEFCDAB89, 0x98BADCFE, 0x10325476
+    for debut in range(0, len(message), 64):
+        x = struct.unpack("<16I", message[debut:debut + 64])
+        aa, bb, cc, dd = a, b, c, d
+        for k in range(0, 16, 4):
+            a = rotation(a + f(b, c, d) + x[k], 3)
+            d = rotation(d + f(a, b, c) + x[k + 1], 7)
+            c = rotation(c + f(d, a, b) + x[k + 2], 11)
+            b = rotation(b + f(c, d, a) + x[k + 3], 19)
+        for k in range(4):
+            a = rotation(a + g(b, c, d) + x[k] + 0x5A827999, 3)
+            d = rotation(d + g(a, b, c) + x[k + 4] + 0x5A827999, 5)
+            c = rotation(c + g(d, a, b) + x[k + 8] + 0x5A827999, 9)
+            b = rotation(b + g(c, d, a) + x[k + 12] + 0x5A827999, 13)
+        for k in (0, 2, 1, 3):
+            a = rotation(a + h(b, c, d) + x[k] + 0x6ED9EBA1, 3)
+            d = rotation(d + h(a, b, c) + x[k + 8] + 0x6ED9EBA1, 9)
+            c = rotation(c + h(d, a, b) + x[k + 4] + 0x6ED9EBA1, 11)
+            b = rotation(b + h(c, d, a) + x[k + 12] + 0x6ED9EBA1, 15)
+        a, b, c, d = (a + aa) & masque, (b + bb) & masque, (c + cc) & masque, (d + dd) & masque
+    return struct.pack("<4I", a, b, c, d)
+
+def hacher_ntlm(mot_de_passe: str) -> bytes:
+    donnees = mot_de_passe.encode('utf-16-le')
+    try:
+        return hashlib.new("md4", donnees).digest()
+    except ValueError: # OpenSSL 3 sans le fournisseur « legacy »
+        return _md4(donnees)
+
+def hacher_sha1(mot_de_passe: str) -> bytes:
+    return hashlib.sha1(mot_de_passe.encode('utf-8')).digest()
+
+
+class CorpusFuites:
+    """Fichier binaire trié d'empreintes compromises, interrogé sans le charger en mémoire."""
+    def __init__(self, chemin: str):
+        self.chemin = chemin
+        self._fichier = open(chemin, "rb")
+        try:
+            magic, version, code, taille = struct.unpack("<8sBBB5x", self._fichier.read(TAILLE_ENTETE_FUITES))
+        except struct.error:
+            magic = None
+        if magic != MAGIC_FUITES:
+            self._fichier.close()
+            raise ValueError(f"'{chemin}' n'est pas un fichier de fuites Big Key (voir `convertir_hibp`).")
+        if version != VERSION_FUITES:
+            self._fichier.close()
+            raise ValueError(f"Version de fichier de fuites non prise en charge : {version}")
+        self.algo = next(nom for nom, (code_algo, _taille) in ALGOS_FUITES.items() if code_algo == code)
+        self._hacher = hacher_sha1 if self.algo == "sha1" else hacher_ntlm
+        self._taille_empreinte = taille
+        self._taille_enregistrement = taille + 4
+        self.nombre = (os.fstat(self._fichier.fileno()).st_size - TAILLE_ENTETE_FUITES) // self._taille_enregistrement
+        self._carte = mmap.mmap(self._fichier.fileno(), 0, access=mmap.ACCESS_READ) if self.nombre else None
+        self.lectures = 0 # Enregistrements lus, pour les mesures
+
+    def fermer(self):
+        if self._carte is not None:
+            self._carte.close()
+        self._fichier.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fermer()
+
+    def _empreinte(self, indice: int) -> bytes:
+        self.lectures += 1
+        debut = TAILLE_ENTETE_FUITES + indice * self._taille_enregistrement
+        return self._carte[debut:debut + self._taille_empreinte]
+
+    def _occurrences(self, indice: int) -> int:
+        debut = TAILLE_ENTETE_FUITES + indice * self._taille_enregistrement + self._taille_empreinte
+        return max(1, int.from_bytes(self._carte[debut:debut + 4], "big"))
+
+    def rechercher(self, empreinte: bytes) -> int:
+        """Nombre d'occurrences de `empreinte` dans le corpus (0 : absente)."""
+        if not self.nombre:
+            return 0
+        cible = int.from_bytes(empreinte[:8], "big")
+        bas, haut = 0, self.nombre - 1
+        empreinte_bas, empreinte_haut = self._empreinte(bas), self._empreinte(haut)
+        essais = 0
+        while bas <= haut:
+            if empreinte < empreinte_bas or empreinte > empreinte_haut:
+                return 0
+            cle_bas, cle_haut = int.from_bytes(empreinte_bas[:8], "big"), int.from_bytes(empreinte_haut[:8], "big")
+            if essais < INTERPOLATIONS_MAX and cle_haut > cle_bas:
+                milieu = bas + (cible - cle_bas) * (haut - bas) // (cle_haut - cle_bas)
+            else:
+                milieu = (bas + haut) // 2
+            essais += 1
+            courante = self._empreinte(milieu)
+            if courante == empreinte:
+                return self._occurrences(milieu)
+            if courante < empreinte:
+                bas = milieu + 1
+                if bas <= haut:
+                    empreinte_bas = self._empreinte(bas)
+            else:
+                haut = milieu - 1
+                if bas <= haut:
+                    empreinte_haut = self._empreinte(haut)
+        return 0
+
+    def occurrences(self, mot_de_passe: str) -> int:
+        """Nombre de fuites connues pour `mot_de_passe` (0 : absent du corpus)."""
+        return self.rechercher(self._hacher(mot_de_passe))
+
+
+def convertir_hibp(source: str, destination: str, algo: str = "sha1") -> int:
+    """Convertit une liste texte « EMPREINTE:COMPTE » triée par empreinte (Have I Been Pwned,
+    version « ordered by hash ») en fichier binaire pour `CorpusFuites`. Lecture en flux.
+    Retourne le nombre d'empreintes. Lève ValueError si la source n'est pas triée.
+    """
+    code, taille = ALGOS_FUITES[algo]
+    nombre = 0
+    precedente = b""
+    with open(source, "r", encoding="ascii") as f_source, open(destination + ".tmp", "wb") as f_destination:
+        f_destination.write(struct.pack("<8sBBB5x", MAGIC_FUITES, VERSION_FUITES, code, taille))
+        for numero, ligne in enumerate(f_source, start=1):
+            ligne = ligne.strip()
+            if not ligne:
+                continue
+            empreinte_hex, _, compte = ligne.partition(":")
+            empreinte = bytes.fromhex(empreinte_hex)
+            if len(empreinte) != taille:
+                raise ValueError(f"Ligne {numero} : empreinte {algo} attendue ({taille} octets).")
+            if empreinte <= precedente:
+                raise ValueError(f"Ligne {numero} : la source doit être triée par empreinte, sans doublon.")
+            f_destination.write(empreinte + struct.pack(">I", min(int(compte or 1), 0xFFFFFFFF)))
+            precedente = empreinte
+            nombre += 1
+    os.replace(destination + ".tmp", destination)
+    return nombre
+
+
+# --- Audit ---
+
+class RapportAudit:
+    """Résultat d'un audit : entrées faibles, groupes de réutilisation, entrées compromises."""
+    def __init__(self):
+        self.total = 0
+        self.analysees = 0
+        self.faibles: List[Tuple[str, str, float]] = []        # (site, utilisateur, bits)
+        self.reutilises: List[List[Tuple[str, str]]] = []      # Groupes d'entrées au même mot de passe
+        self.compromis: List[Tuple[str, str, int]] = []        # (site, utilisateur, occurrences)
+        self.fuites_verifiees = False
+
+    @property
+    def termine(self) -> bool:
+        return self.analysees >= self.total
+
+    def __str__(self) -> str:
+        lignes = [f"{self.analysees}/{self.total} entrée(s) analysée(s) : {len(self.faibles)} faible(s), "
+                  f"{sum(len(groupe) for groupe in self.reutilises)} dans {len(self.reutilises)} groupe(s) de réutilisation, "
+                  + (f"{len(self.compromis)} compromise(s)." if self.fuites_verifiees else "fuites non vérifiées (aucun corpus).")]
+        for site, utilisateur, occurrences in self.compromis:
+            lignes.append(f"  COMPROMIS   {site} / {utilisateur} (vu {occurrences} fois)")
+        for groupe in self.reutilises:
+            lignes.append("  RÉUTILISÉ   " + ", ".join(f"{site} / {utilisateur}" for site, utilisateur in groupe))
+        for site, utilisateur, bits in self.faibles:
+            lignes.append(f"  FAIBLE      {site} / {utilisateur} ({bits:.0f} bits, {niveau_force(bits)})")
+        return "\n".join(lignes)
+
+
+class _ResultatEntree:
+    __slots__ = ("valeur", "bits", "occurrences", "empreinte")
+
+    def __init__(self, valeur: str, bits: float, occurrences: Optional[int], empreinte: bytes):
+        self.valeur = valeur           # Valeur scellée analysée : inchangée, rien à refaire
+        self.bits = bits
+        self.occurrences = occurrences # None : pas de corpus
+        self.empreinte = empreinte
+
+
+class AuditCoffre:
+    """Audit du coffre tenu à jour dans un thread d'arrière-plan.
+
+    Les messages (entrées à analyser ou à oublier) sont préparés dans le thread qui
+    modifie les données, puis traités par le thread d'audit : celui-ci ne parcourt
+    jamais le dictionnaire lui-même. `generation` augmente à chaque résultat publié ;
+    `rapport()` peut être appelé depuis n'importe quel thread.
+    """
+    def __init__(self, passwords_data: core.PasswordData, corpus: Optional[CorpusFuites] = None):
+        self._donnees = passwords_data
+        self.corpus = corpus
+        self._cle = os.urandom(32) # Empreintes de réutilisation propres à cet audit
+        self._resultats: Dict[Tuple[str, str], _ResultatEntree] = {}
+        self._groupes: Dict[bytes, set] = {}
+        self._verrou = threading.Lock()
+        self._file: "queue.SimpleQueue" = queue.SimpleQueue()
+        self._thread: Optional[threading.Thread] = None
+        self._total = 0
+        self.generation = 0
+
+    # Messages (thread des données)
+
+    def demarrer(self):
+        """Analyse tout le coffre en arrière-plan, puis suit ses modifications."""
+        if isinstance(self._donnees, core.DonneesCoffre):
+            self._donnees.ecouteurs.append(self.ecouter)
+        self._planifier_tout()
+        self._thread = threading.Thread(target=self._boucle, name="bigkey-audit", daemon=True)
+        self._thread.start()
+
+    def arreter(self):
+        if isinstance(self._donnees, core.DonneesCoffre) and self.ecouter in self._donnees.ecouteurs:
+            self._donnees.ecouteurs.remove(self.ecouter)
+        if self._thread is not None:
+            self._file.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def ecouter(self, operation: str, nom_site: str, nom_utilisateur: Optional[str], valeur: Optional[str]):
+        """Écouteur de `DonneesCoffre`."""
+        if operation == "ajout":
+            self._file.put(("entrees", [(nom_site, nom_utilisateur, valeur)]))
+        elif operation == "suppression":
+            self._file.put(("oublier", (nom_site, nom_utilisateur)))
+        else: # "suppression_site", "lot" : on repart de l'état complet
+            self._planifier_tout()
+
+    def _planifier_tout(self):
+        entrees = list(core.entrees_stockees(self._donnees))
+        self._file.put(("tout", entrees))
+
+    # Analyse (thread d'audit)
+
+    def _boucle(self):
+        while True:
+            message = self._file.get()
+            if message is None:
+                return
+            self._traiter(message)
+
+    def _traiter(self, message):
+        type_message, contenu = message
+        if type_message == "oublier":
+            with self._verrou:
+                self._retirer(contenu)
+                self._total = len(self._resultats)
+                self.generation += 1
+            return
+        if type_message == "tout":
+            presentes = {(site, utilisateur) for site, utilisateur, _valeur in contenu}
+            with self._verrou:
+                for cle in [cle for cle in self._resultats if cle not in presentes]:
+                    self._retirer(cle)
+                self._total = len(presentes)
+                self.generation += 1
+        for site, utilisateur, valeur in contenu:
+            with self._verrou:
+                actuel = self._resultats.get((site, utilisateur))
+                if actuel is not None and actuel.valeur == valeur:
+                    continue
+                if type_message == "entrees" and actuel is None:
+                    self._total += 1
+            try:
+                resultat = self._analyser(valeur)
+            except ValueError: # Jeton illisible (clé changée entre-temps) : un message « tout » suivra
+                continue
+            with self._verrou:
+                self._retirer((site, utilisateur))
+                self._resultats[(site, utilisateur)] = resultat
+                self._groupes.setdefault(resultat.empreinte, set()).add((site, utilisateur))
+                self.generation += 1
+
+    def _retirer(self, cle: Tuple[str, str]):
+        ancien = self._resultats.pop(cle, None)
+        if ancien is not None:
+            groupe = self._groupes[ancien.empreinte]
+            groupe.discard(cle)
+            if not groupe:
+                del self._groupes[ancien.empreinte]
+
+    def _analyser(self, valeur: str) -> _ResultatEntree:
+        mot_de_passe = self._donnees.ouvrir(valeur) if isinstance(self._donnees, core.DonneesCoffre) else valeur
+        empreinte = hashlib.blake2b(mot_de_passe.encode('utf-8'), key=self._cle, digest_size=16).digest()
+        occurrences = self.corpus.occurrences(mot_de_passe) if self.corpus is not None else None
+        return _ResultatEntree(valeur, estimer_force(mot_de_passe), occurrences, empreinte)
+
+    def rapport(self) -> RapportAudit:
+        """État actuel de l'audit (partiel tant que l'analyse n'est pas terminée)."""
+        rapport = RapportAudit()
+        rapport.fuites_verifiees = self.corpus is not None
+        with self._verrou:
+            rapport.total = max(self._total, len(self._resultats))
+            rapport.analysees = len(self._resultats)
+            for (site, utilisateur), resultat in self._resultats.items():
+                if resultat.bits < FORCE_FAIBLE:
+                    rapport.faibles.append((site, utilisateur, resultat.bits))
+                if resultat.occurrences:
+                    rapport.compromis.append((site, utilisateur, resultat.occurrences))
+            rapport.reutilises = [sorted(groupe) for groupe in self._groupes.values() if len(groupe) > 1]
+        rapport.faibles.sort(key=lambda faible: faible[2])
+        rapport.compromis.sort(key=lambda compromis: -compromis[2])
+        rapport.reutilises.sort(key=len, reverse=True)
+        return rapport
+
+
+@core.mesurer_operation("audit")
+def auditer(passwords_data: core.PasswordData, corpus: Optional[CorpusFuites] = None) -> RapportAudit:
+    """Audit complet, dans le thread appelant."""
+    audit = AuditCoffre(passwords_data, corpus)
+    audit._planifier_tout()
+    audit._traiter(audit._file.get())
+    return audit.rapport()
+
+
+def main(argv=None) -> int:
+    import argparse
+    parser = argparse.ArgumentParser(description="Convertit une liste Have I Been Pwned (texte trié) au format binaire de l'audit.")
+    parser.add_argument("source", help="fichier texte EMPREINTE:COMPTE trié par empreinte")
+    parser.add_argument("destination")
+    parser.add_argument("--ntlm", action="store_true", help="empreintes NTLM au lieu de SHA-1")
+    args = parser.parse_args(argv)
+    try:
+        nombre = convertir_hibp(args.source, args.destination, "ntlm" if args.ntlm else "sha1")
+    except (OSError, ValueError) as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return 1
+    print(f"{nombre} empreinte(s) écrites dans '{args.destination}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+"""Mesure le temps de démarrage à froid de la ligne de commande.
+
+Compare un interpréteur vide, `generate` (sans coffre) et `get` (déverrouillage
+complet, dominé par la dérivation de clé calibrée), et vérifie que `generate`
+n'importe ni `cryptography` ni la pile graphique.
+
+    python benchmarks/bench_cli.py --repetitions 20
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULES_LOURDS = ("cryptography", "tkinter", "customtkinter", "pyperclip")
+MAITRE = "benchmark-maitre"
+
+
+def _chrono(commande: list, env: dict, repetitions: int) -> list:
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        subprocess.run(commande, env=env, check=True, stdout=subprocess.DEVNULL)
+        durees.append(time.perf_counter() - debut)
+    return durees
+
+
+def modules_importes_par_generate(env: dict) -> list:
+    code = ("import sys, cli_password_manager as c; c.main(['generate']); "
+            f"print(' '.join(sorted({{m.split('.')[0] for m in sys.modules}} & set({MODULES_LOURDS!r}))), file=sys.stderr)")
+    sortie = subprocess.run([sys.executable, "-c", code], env=env, check=True, capture_output=True, text=True)
+    return sortie.stderr.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repetitions", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as dossier:
+        env = dict(os.environ, PYTHONPATH=RACINE, BIG_KEY_DIR=dossier, BIG_KEY_MASTER_PASSWORD=MAITRE)
+        cli = [sys.executable, "-m", "cli_password_manager"]
+        subprocess.run(cli + ["set", "exemple.fr", "alice", "--generate"], env=env, check=True, stdout=subprocess.DEVNULL)
+
+        mesures = [
+            ("python -c pass", [sys.executable, "-c", "pass"]),
+            ("generate", cli + ["generate"]),
+            ("generate -n 1000", cli + ["generate", "-n", "1000"]),
+            ("get (avec dérivation)", cli + ["get", "exemple.fr", "alice"]),
+        ]
+        print(f"{'commande':<24} {'médiane':>10} {'min':>10}")
+        for nom, commande in mesures:
+            durees = _chrono(commande, env, args.repetitions)
+            print(f"{nom:<24} {statistics.median(durees) * 1000:>8.1f}ms {min(durees) * 1000:>8.1f}ms")
+
+        lourds = modules_importes_par_generate(env)
+        print(f"\nModules lourds importés par generate : {', '.join(lourds) if lourds else 'aucun'}")
+        if lourds:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
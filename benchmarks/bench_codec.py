@@ -0,0 +1,86 @@
+"""Compare l'ancien contenu JSON indenté et le codec binaire (avec ou sans compression).
+
+Pour chaque taille de coffre synthétique, mesure la taille sur disque (après Fernet)
+et les temps de sauvegarde (sérialisation + chiffrement) et de chargement
+(déchiffrement + désérialisation).
+
+    python benchmarks/bench_codec.py --tailles 10000 100000 1000000
+"""
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cryptography.fernet import Fernet
+
+import core_password_manager as core
+
+
+def coffre_synthetique(nb_entrees: int, utilisateurs_par_site: int = 2) -> core.PasswordData:
+    """Coffre de `nb_entrees` entrées dont les valeurs ressemblent à des jetons scellés."""
+    donnees: core.PasswordData = {}
+    for i in range(nb_entrees):
+        site = f"site-{i // utilisateurs_par_site:07d}.example.com"
+        jeton = base64.urlsafe_b64encode(os.urandom(90)).decode('ascii') # ~ taille d'un jeton Fernet court
+        donnees.setdefault(site, {})[f"utilisateur{i % utilisateurs_par_site}@example.com"] = jeton
+    return donnees
+
+
+def _chrono(fonction, *args):
+    debut = time.perf_counter()
+    resultat = fonction(*args)
+    return resultat, time.perf_counter() - debut
+
+
+def mesurer(donnees: core.PasswordData, fernet: Fernet) -> list:
+    codecs = [("json indenté (ancien)", lambda d: json.dumps({"format": 2, "sites": d}, indent=4).encode('utf-8'))]
+    for compression in core.COMPRESSIONS:
+        codecs.append((f"binaire {compression}", lambda d, c=compression: core.encoder_contenu(d, {"format": 2}, c)))
+
+    resultats = []
+    for nom, encoder in codecs:
+        contenu, t_serialisation = _chrono(encoder, donnees)
+        jeton, t_chiffrement = _chrono(fernet.encrypt, contenu)
+        clair, t_dechiffrement = _chrono(fernet.decrypt, jeton)
+        (relu, _extras), t_deserialisation = _chrono(core.decoder_contenu, clair)
+        assert relu == donnees, nom
+        resultats.append({
+            "codec": nom,
+            "octets_contenu": len(contenu),
+            "octets_disque": len(jeton),
+            "sauvegarde_s": t_serialisation + t_chiffrement,
+            "chargement_s": t_dechiffrement + t_deserialisation,
+        })
+    return resultats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tailles", type=int, nargs="+", default=[10000, 100000], help="Nombres d'entrées à tester")
+    parser.add_argument("--json", help="Écrit aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    fernet = Fernet(Fernet.generate_key())
+    tous = {}
+    for taille in args.tailles:
+        resultats = mesurer(coffre_synthetique(taille), fernet)
+        tous[taille] = resultats
+        reference = resultats[0]
+        print(f"\n{taille} entrées")
+        print(f"{'codec':<24}{'disque (Mo)':>12}{'gain':>8}{'sauvegarde':>12}{'chargement':>12}")
+        for r in resultats:
+            gain = 1 - r["octets_disque"] / reference["octets_disque"]
+            print(f"{r['codec']:<24}{r['octets_disque'] / 1e6:>12.2f}{gain:>8.0%}"
+                  f"{r['sauvegarde_s'] * 1000:>10.0f}ms{r['chargement_s'] * 1000:>10.0f}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(tous, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
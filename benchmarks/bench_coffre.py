@@ -0,0 +1,258 @@
+"""Banc d'essai des opérations du coffre sur des coffres synthétiques de 100 à 1 000 000 d'entrées.
+
+Pour chaque taille, un sous-processus crée un coffre dans un répertoire temporaire et
+mesure : dérivation de clé, déverrouillage, sauvegarde (session et `sauvegarder_stockage`),
+ajout journalisé, réplication (initiale, puis après une modification), lecture d'une entrée, `lister_sites`, construction de l'index de
+recherche et filtre de l'interface, génération de mots de passe, débit des pièces jointes
+(et déverrouillage d'un coffre qui en a), ainsi que le pic de mémoire du processus. Les résultats sont écrits en JSON et comparés à une référence :
+
+    python benchmarks/bench_coffre.py                                  # 100 à 100 000 entrées
+    python benchmarks/bench_coffre.py --tailles 1000000 --repetitions 1
+    python benchmarks/bench_coffre.py --sortie resultats.json --reference benchmarks/reference.json
+    python benchmarks/bench_coffre.py --enregistrer-reference benchmarks/reference.json
+
+Le code de sortie vaut 1 si une mesure régresse de plus de `--tolerance` par rapport à la
+référence. Les durées sont le minimum de `--repetitions` essais ; la dérivation utilise des
+paramètres fixes (`KDF_BANC`) pour que les chiffres soient comparables d'une machine à l'autre.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RACINE)
+
+import core_password_manager as core
+import historique_password_manager as historique_pm
+import pieces_password_manager as pieces_pm
+import replication_password_manager as replication
+
+TAILLES_DEFAUT = [100, 1000, 10000, 100000]
+KDF_BANC = {"algo": "scrypt", "n": 2 ** 14, "r": 8, "p": 1}
+MAITRE = "banc-d-essai"
+UTILISATEURS_PAR_SITE = 2
+TAILLE_PIECE = 16 * 1024 * 1024 # Pièce jointe des mesures de débit
+TERMES_RECHERCHE = ["e", "site-00", "042", "example.com", "introuvable"]
+TOLERANCE_DEFAUT = 0.25
+# Écarts absolus en dessous desquels une variation est du bruit de mesure, par unité.
+BRUIT_ABSOLU = {"_s": 0.002, "_ms": 0.5, "_us": 5.0, "_mo": 1.0, "_ko": 1.0}
+
+
+def _chrono(fonction, repetitions: int = 1) -> float:
+    """Durée minimale (s) de `repetitions` appels."""
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction()
+        durees.append(time.perf_counter() - debut)
+    return min(durees)
+
+
+def _pic_memoire_mo() -> float:
+    """Pic de mémoire résidente du processus (Mo), si le système le fournit."""
+    try:
+        import resource
+    except ImportError: # Windows
+        return None
+    pic = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pic / 1024 / 1024 if sys.platform == "darwin" else pic / 1024 # octets sous macOS, Ko ailleurs
+
+
+def creer_coffre(nb_entrees: int) -> core.SessionCoffre:
+    """Crée dans le répertoire courant un coffre scellé de `nb_entrees` entrées (sans journal)."""
+    core._charger_crypto()
+    cle = core.Fernet.generate_key()
+    entete = core._nouvel_entete(MAITRE, cle, KDF_BANC)
+    session = core.SessionCoffre(core.DonneesCoffre(), core.base64.b64decode(entete["sel"]), cle, entete)
+    donnees = session.passwords_data
+    donnees.scelleur = session.scelleur
+    mots_de_passe = core.generer_mots_de_passe(nb_entrees)
+    for i, mot_de_passe in enumerate(mots_de_passe):
+        site = f"site-{i // UTILISATEURS_PAR_SITE:07d}.example.com"
+        core.ajouter_ou_modifier_entree(donnees, site, f"utilisateur{i % UTILISATEURS_PAR_SITE}@example.com", mot_de_passe)
+    session.sauvegarder()
+    return session
+
+
+def mesurer_taille(nb_entrees: int, repetitions: int) -> dict:
+    """Toutes les mesures pour une taille ; à lancer dans un processus dédié (pic mémoire)."""
+    core.KDF_MARGE_AMELIORATION = 0 # Pas de recalibrage automatique pendant les mesures
+    r = {}
+    debut = time.perf_counter()
+    session = creer_coffre(nb_entrees)
+    r["creation_s"] = time.perf_counter() - debut
+    r["taille_fichier_mo"] = os.path.getsize(core.STORAGE_FILENAME) / 1e6
+
+    sel = os.urandom(16)
+    r["deriver_cle_s"] = _chrono(lambda: core.deriver_cle(MAITRE.encode('utf-8'), sel), repetitions)
+    r["deriver_cle_kdf_s"] = _chrono(lambda: core.deriver_cle_kdf(MAITRE.encode('utf-8'), sel, KDF_BANC), repetitions)
+
+    r["sauvegarde_s"] = _chrono(session.sauvegarder, repetitions)
+    r["sauvegarder_stockage_s"] = _chrono(lambda: core.sauvegarder_stockage(session.passwords_data, MAITRE), repetitions)
+    del session
+
+    sessions = []
+    r["deverrouillage_s"] = _chrono(lambda: sessions.append(core.charger_ou_creer_stockage(MAITRE)), repetitions)
+    session = sessions[-1]
+    del sessions[:-1]
+    donnees = session.passwords_data
+
+    sites = core.lister_sites(donnees)
+    r["lister_sites_ms"] = _chrono(lambda: core.lister_sites(donnees), repetitions) * 1000
+    site_milieu = sites[len(sites) // 2]
+    utilisateur = core.recuperer_utilisateurs_pour_site(donnees, site_milieu)[0]
+    n_lectures = 1000
+    r["recuperer_entree_us"] = _chrono(lambda: [core.recuperer_entree(donnees, site_milieu, utilisateur) for _ in range(n_lectures)], repetitions) / n_lectures * 1e6
+
+    r["index_construction_s"] = _chrono(lambda: core.IndexRecherche(donnees), repetitions)
+    index = session.index_recherche
+    r["filtre_gui_ms"] = statistics.median(_chrono(lambda t=terme: index.rechercher(t), repetitions) for terme in TERMES_RECHERCHE) * 1000
+    r["filtre_lineaire_ms"] = statistics.median(
+        _chrono(lambda t=terme.casefold(): sorted(s for s in donnees if t in s.casefold()), repetitions) for terme in TERMES_RECHERCHE) * 1000
+
+    n_ajouts = 200
+    def ajouts():
+        for i in range(n_ajouts):
+            core.ajouter_ou_modifier_entree(donnees, f"banc-{i}.example.com", "ajout", "mot-de-passe")
+            session.persister()
+    r["ajout_journalise_us"] = _chrono(ajouts) / n_ajouts * 1e6
+
+    r["replication_initiale_s"] = _chrono(lambda: replication.repliquer(session, "replique"))
+    increments = []
+    def replication_increment():
+        core.ajouter_ou_modifier_entree(donnees, site_milieu, utilisateur, core.generer_mot_de_passe())
+        increments.append(replication.repliquer(session, "replique"))
+    r["replication_increment_ms"] = _chrono(replication_increment, repetitions) * 1000
+    r["replication_increment_ko"] = min(rapport.octets_ecrits for rapport in increments) / 1024
+
+    r["historique_initial_s"] = _chrono(lambda: historique_pm.activer(session)) # Version initiale : tout le coffre
+    def historique_version():
+        core.ajouter_ou_modifier_entree(donnees, site_milieu, utilisateur, core.generer_mot_de_passe())
+        session.persister()
+    r["historique_version_ms"] = _chrono(historique_version, repetitions) * 1000
+
+    pieces = pieces_pm.activer(session)
+    sources = []
+    for i in range(repetitions): # Contenus distincts (pas de déduplication), écrits par blocs : pas de pic mémoire
+        sources.append(f"source-{i}.bin")
+        with open(sources[-1], "wb") as f_source:
+            for _ in range(TAILLE_PIECE // pieces_pm.TAILLE_BLOC):
+                f_source.write(os.urandom(pieces_pm.TAILLE_BLOC))
+    def ecrire_piece():
+        with open(sources.pop(), "rb") as f_source:
+            stockees.append(pieces.ajouter(f_source)) # Hachage, puis chiffrement (contenu nouveau)
+    stockees = []
+    r["piece_ecriture_mo_par_s"] = TAILLE_PIECE / 1e6 / _chrono(ecrire_piece, repetitions)
+    r["piece_lecture_mo_par_s"] = TAILLE_PIECE / 1e6 / _chrono(lambda: pieces.extraire(stockees[0]["objet"], "piece.bin"), repetitions)
+    for i, stockee in enumerate(stockees):
+        pieces.attacher(site_milieu, utilisateur, stockee, f"piece-{i}.bin")
+    session.sauvegarder()
+    r["deverrouillage_avec_pieces_s"] = _chrono(lambda: core.charger_ou_creer_stockage(MAITRE), repetitions) # Pièces jamais lues
+
+    n_generes = 10000
+    r["generer_mot_de_passe_par_s"] = n_generes / _chrono(lambda: [core.generer_mot_de_passe() for _ in range(n_generes)], repetitions)
+    r["generer_mots_de_passe_par_s"] = n_generes / _chrono(lambda: core.generer_mots_de_passe(n_generes), repetitions)
+
+    r["pic_memoire_mo"] = _pic_memoire_mo()
+    return r
+
+
+def _mesurer_dans_sous_processus(nb_entrees: int, repetitions: int) -> dict:
+    commande = [sys.executable, os.path.abspath(__file__), "--_taille", str(nb_entrees), "--repetitions", str(repetitions)]
+    sortie = subprocess.run(commande, check=True, capture_output=True, text=True)
+    return json.loads(sortie.stdout.strip().splitlines()[-1])
+
+
+def _plus_grand_est_mieux(mesure: str) -> bool:
+    return mesure.endswith("_par_s")
+
+def comparer(resultats: dict, reference: dict, tolerance: float) -> list:
+    """Mesures hors tolérance : liste de (taille, mesure, référence, valeur, écart relatif)."""
+    regressions = []
+    for taille, mesures in resultats.items():
+        for mesure, valeur in mesures.items():
+            ref = reference.get(taille, {}).get(mesure)
+            if not ref or valeur is None or mesure == "creation_s":
+                continue
+            ecart = (ref / valeur - 1) if _plus_grand_est_mieux(mesure) else (valeur / ref - 1)
+            bruit = next((seuil for unite, seuil in BRUIT_ABSOLU.items() if mesure.endswith(unite)), 0)
+            if ecart > tolerance and abs(valeur - ref) > bruit:
+                regressions.append((taille, mesure, ref, valeur, ecart))
+    return regressions
+
+
+def _afficher(resultats: dict, reference: dict):
+    for taille, mesures in resultats.items():
+        print(f"\n{int(taille):,} entrées".replace(",", " "))
+        for mesure, valeur in mesures.items():
+            ref = reference.get(taille, {}).get(mesure)
+            ligne = f"  {mesure:<30}{valeur:>14,.3f}" if valeur is not None else f"  {mesure:<30}{'-':>14}"
+            if ref and valeur is not None:
+                ligne += f"   (référence {ref:,.3f}, {valeur / ref - 1:+.0%})"
+            print(ligne)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tailles", type=int, nargs="+", default=TAILLES_DEFAUT, help="Nombres d'entrées à tester")
+    parser.add_argument("--repetitions", type=int, default=3, help="Essais par mesure (on garde le minimum)")
+    parser.add_argument("--sortie", help="Écrit les résultats dans ce fichier JSON")
+    parser.add_argument("--reference", help="Compare à ce fichier de résultats")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE_DEFAUT, help="Écart relatif toléré (0.25 = 25 %%)")
+    parser.add_argument("--enregistrer-reference", metavar="FICHIER", help="Écrit les résultats comme nouvelle référence")
+    parser.add_argument("--_taille", type=int, help=argparse.SUPPRESS) # Sous-processus de mesure
+    args = parser.parse_args(argv)
+
+    if args._taille is not None:
+        with tempfile.TemporaryDirectory() as dossier:
+            os.chdir(dossier)
+            with contextlib.redirect_stdout(sys.stderr):
+                resultat = mesurer_taille(args._taille, args.repetitions)
+        print(json.dumps(resultat))
+        return 0
+
+    resultats = {}
+    for taille in args.tailles:
+        print(f"Mesure avec {taille} entrées...", file=sys.stderr)
+        resultats[str(taille)] = _mesurer_dans_sous_processus(taille, args.repetitions)
+
+    document = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "plateforme": platform.platform(),
+            "processeur": platform.processor() or platform.machine(),
+            "kdf": KDF_BANC,
+            "repetitions": args.repetitions,
+        },
+        "resultats": resultats,
+    }
+    reference = {}
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as f_reference:
+            reference = json.load(f_reference)["resultats"]
+    _afficher(resultats, reference)
+
+    for chemin in (args.sortie, args.enregistrer_reference):
+        if chemin:
+            with open(chemin, "w", encoding="utf-8") as f_sortie:
+                json.dump(document, f_sortie, indent=2)
+
+    regressions = comparer(resultats, reference, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) au-delà de {args.tolerance:.0%} :")
+        for taille, mesure, ref, valeur, ecart in regressions:
+            print(f"  {taille} entrées, {mesure} : {ref:,.3f} -> {valeur:,.3f} ({ecart:+.0%})")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,102 @@
+"""Compare le conteneur Fernet (version 1 du fichier) et le conteneur binaire AES-256-GCM (version 2).
+
+Pour chaque taille de coffre synthétique, le même contenu sérialisé est mis dans les
+deux conteneurs. On mesure la taille sur disque, le chiffrement (fichier complet, en-tête
+compris) et le déchiffrement (découpe et déchiffrement, sans la dérivation de clé).
+
+    python benchmarks/bench_conteneur.py --tailles 100000 1000000
+"""
+import argparse
+import base64
+import json
+import os
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core_password_manager as core
+
+KDF_BANC = {"algo": "pbkdf2-sha256", "iterations": 1000} # La dérivation n'est pas mesurée
+
+
+def coffre_synthetique(nb_entrees: int, utilisateurs_par_site: int = 2) -> core.DonneesCoffre:
+    """Coffre de `nb_entrees` entrées dont les valeurs ressemblent à des jetons scellés."""
+    donnees = core.DonneesCoffre()
+    for i in range(nb_entrees):
+        site = f"site-{i // utilisateurs_par_site:07d}.example.com"
+        jeton = base64.urlsafe_b64encode(os.urandom(73)).decode('ascii') # Jeton Fernet d'un mot de passe court
+        donnees.ecrire(site, f"utilisateur{i % utilisateurs_par_site}@example.com", jeton)
+    return donnees
+
+
+def _fichier_fernet(session: core.SessionCoffre, contenu: bytes) -> bytes:
+    """Fichier de la version 1 : en-tête, puis jeton Fernet du contenu."""
+    entete_json = json.dumps(session.entete, separators=(",", ":")).encode('utf-8')
+    return core.MAGIC_FICHIER + b"\x01" + struct.pack("<I", len(entete_json)) + entete_json + session.chiffrer(contenu)
+
+
+def _chrono(fonction, repetitions: int):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        resultat = fonction()
+        durees.append(time.perf_counter() - debut)
+    return resultat, min(durees)
+
+
+def mesurer(contenu: bytes, session: core.SessionCoffre, repetitions: int) -> list:
+    conteneurs = [("Fernet (version 1)", lambda: _fichier_fernet(session, contenu)),
+                  ("AES-256-GCM (version 2)", lambda: session.chiffrer_fichier(contenu))]
+    resultats = []
+    for nom, chiffrer in conteneurs:
+        fichier, t_chiffrement = _chrono(chiffrer, repetitions)
+        def dechiffrer(fichier=fichier):
+            _entete, prefixe, corps = core._decouper_fichier(fichier)
+            return session.dechiffrer_fichier(prefixe, corps)
+        clair, t_dechiffrement = _chrono(dechiffrer, repetitions)
+        assert clair == contenu, nom
+        resultats.append({
+            "conteneur": nom,
+            "octets_contenu": len(contenu),
+            "octets_disque": len(fichier),
+            "chiffrement_s": t_chiffrement,
+            "dechiffrement_s": t_dechiffrement,
+        })
+        del fichier, clair, dechiffrer
+    return resultats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tailles", type=int, nargs="+", default=[100000, 1000000], help="Nombres d'entrées à tester")
+    parser.add_argument("--repetitions", type=int, default=3, help="Essais par mesure (le minimum est retenu)")
+    parser.add_argument("--json", help="Écrit aussi les résultats dans ce fichier JSON")
+    args = parser.parse_args(argv)
+
+    core._charger_crypto()
+    cle = core.Fernet.generate_key()
+    entete = core._nouvel_entete("banc-d-essai", cle, KDF_BANC)
+    session = core.SessionCoffre(core.DonneesCoffre(), base64.b64decode(entete["sel"]), cle, entete)
+    tous = {}
+    for taille in args.tailles:
+        contenu = core.encoder_contenu(coffre_synthetique(taille), {"format": core.FORMAT_STOCKAGE})
+        resultats = mesurer(contenu, session, args.repetitions)
+        del contenu
+        tous[taille] = resultats
+        reference = resultats[0]
+        print(f"\n{taille} entrées ({reference['octets_contenu'] / 1e6:.1f} Mo sérialisés)")
+        print(f"{'conteneur':<26}{'disque (Mo)':>12}{'gain':>8}{'chiffrement':>13}{'déchiffrement':>15}")
+        for r in resultats:
+            gain = 1 - r["octets_disque"] / reference["octets_disque"]
+            print(f"{r['conteneur']:<26}{r['octets_disque'] / 1e6:>12.2f}{gain:>8.0%}"
+                  f"{r['chiffrement_s'] * 1000:>11.0f}ms{r['dechiffrement_s'] * 1000:>13.0f}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(tous, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Compare le débit de `generer_mot_de_passe` (un appel par mot de passe) et de la génération en masse.
+
+Affiche aussi l'entropie estimée de chaque politique.
+
+    python benchmarks/bench_generation.py --nombre 20000
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core_password_manager as core
+
+POLITIQUES = [
+    ("20 car., toutes classes", dict(longueur=20)),
+    ("12 car., minuscules + chiffres", dict(longueur=12, utiliser_majuscules=False, utiliser_symboles=False)),
+    ("32 car., toutes classes", dict(longueur=32)),
+]
+
+
+def _debit(fonction, nombre: int) -> float:
+    debut = time.perf_counter()
+    fonction()
+    return nombre / (time.perf_counter() - debut)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--nombre", type=int, default=20000, help="Mots de passe générés par mesure")
+    args = parser.parse_args(argv)
+    n = args.nombre
+
+    print(f"{'politique':<34}{'entropie':>10}{'unitaire/s':>14}{'masse/s':>14}{'gain':>8}")
+    for nom, options in POLITIQUES:
+        unitaire = _debit(lambda: [core.generer_mot_de_passe(**options) for _ in range(n)], n)
+        masse = _debit(lambda: core.generer_mots_de_passe(n, **options), n)
+        print(f"{nom:<34}{core.estimer_entropie(**options):>8.1f} b{unitaire:>14,.0f}{masse:>14,.0f}{masse / unitaire:>7.1f}x")
+
+    core.charger_liste_mots() # Chargement paresseux : hors mesure
+    for nb_mots in (5, 6, 8):
+        phrases = _debit(lambda: core.generer_phrases_de_passe(n, nb_mots), n)
+        print(f"{f'phrase de {nb_mots} mots (EFF)':<34}{core.estimer_entropie_phrase(nb_mots):>8.1f} b{'-':>14}{phrases:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
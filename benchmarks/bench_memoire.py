@@ -0,0 +1,137 @@
+"""Mémoire occupée par les entrées déverrouillées : ancien dict de dicts contre `DonneesCoffre`.
+
+Un coffre synthétique (valeurs de la taille d'un jeton scellé, noms d'utilisateur tirés
+d'un petit ensemble comme dans un vrai coffre) est encodé dans l'ancien format et dans
+le format actuel, puis chaque structure est décodée dans un sous-processus neuf. On mesure la
+mémoire résidente ajoutée par la construction (/proc/self/statm ; à défaut, les
+allocations Python suivies par tracemalloc) et la durée de construction.
+
+    python benchmarks/bench_memoire.py --tailles 100000 1000000
+"""
+import argparse
+import array
+import base64
+import gc
+import json
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import core_password_manager as core
+
+STRUCTURES = ("dict de dicts", "DonneesCoffre")
+UTILISATEURS_DISTINCTS = 200 # Adresses réutilisées d'un site à l'autre
+
+
+def coffre_synthetique(nb_entrees: int, utilisateurs_par_site: int = 2) -> core.DonneesCoffre:
+    """Coffre de `nb_entrees` entrées datées."""
+    aleatoire = random.Random(nb_entrees)
+    donnees = core.DonneesCoffre()
+    maintenant = int(time.time())
+    for i in range(nb_entrees):
+        site = f"site-{i // utilisateurs_par_site:07d}.example.com"
+        utilisateur = f"utilisateur{aleatoire.randrange(UTILISATEURS_DISTINCTS)}@example.com"
+        jeton = base64.urlsafe_b64encode(os.urandom(73)).decode('ascii') # Jeton Fernet d'un mot de passe court
+        donnees.ecrire(site, utilisateur, jeton, maintenant - aleatoire.randrange(10 ** 8))
+    return donnees
+
+
+def _encoder_ancien(donnees: core.PasswordData) -> bytes:
+    """Corps du codec d'avant les colonnes : utilisateurs et valeurs alternés, sans dates."""
+    noms_sites = list(donnees)
+    comptes = array.array("I", (len(donnees[nom]) for nom in noms_sites))
+    chaines = noms_sites + [chaine for nom in noms_sites for entree in donnees[nom].items() for chaine in entree]
+    return struct.pack("<II", len(noms_sites), 0) + comptes.tobytes() + "\0".join(chaines).encode('utf-8')
+
+
+def _dict_de_dicts(corps: bytes) -> core.PasswordData:
+    """Structure d'avant `DonneesCoffre`, décodée comme avant : un dict par site, une chaîne par champ."""
+    nb_sites, _taille_extras = struct.unpack_from("<II", corps)
+    comptes = array.array("I")
+    comptes.frombytes(corps[8:8 + 4 * nb_sites])
+    chaines = corps[8 + 4 * nb_sites:].decode('utf-8').split("\0")
+    sites: core.PasswordData = {}
+    i = nb_sites
+    for nom, compte in zip(chaines, comptes):
+        fin = i + 2 * compte
+        sites[nom] = dict(zip(chaines[i:fin:2], chaines[i + 1:fin:2]))
+        i = fin
+    return sites
+
+
+def _memoire_residente() -> int:
+    with open("/proc/self/statm") as f_statm:
+        return int(f_statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+def mesurer_structure(structure: str, chemin: str) -> dict:
+    """Exécuté dans un sous-processus : construit `structure` depuis le contenu et mesure.
+
+    Le contenu est libéré après la construction : seul compte ce qui reste en mémoire.
+    """
+    construire = core.decoder_contenu if structure == "DonneesCoffre" else _dict_de_dicts
+    residente = os.path.exists("/proc/self/statm")
+    if residente:
+        avant = _memoire_residente()
+    else:
+        import tracemalloc
+        tracemalloc.start()
+    with open(chemin, "rb") as f_contenu:
+        contenu = f_contenu.read()
+    debut = time.perf_counter()
+    donnees = construire(contenu)
+    duree = time.perf_counter() - debut
+    del contenu
+    gc.collect()
+    octets = _memoire_residente() - avant if residente else tracemalloc.get_traced_memory()[0]
+    assert donnees
+    return {"octets": octets, "mesure": "rss" if residente else "tracemalloc", "construction_s": duree}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tailles", type=int, nargs="+", default=[100000, 1000000], help="Nombres d'entrées à tester")
+    parser.add_argument("--json", help="Écrit aussi les résultats dans ce fichier JSON")
+    parser.add_argument("--mesurer", nargs=2, metavar=("STRUCTURE", "FICHIER"), help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.mesurer:
+        print(json.dumps(mesurer_structure(*args.mesurer)))
+        return
+
+    tous = {}
+    with tempfile.TemporaryDirectory() as dossier:
+        for taille in args.tailles:
+            donnees = coffre_synthetique(taille)
+            contenus = {"dict de dicts": _encoder_ancien(donnees),
+                        "DonneesCoffre": core.encoder_contenu(donnees, {"format": core.FORMAT_STOCKAGE})}
+            del donnees
+            resultats = {}
+            for structure in STRUCTURES:
+                chemin = os.path.join(dossier, f"contenu-{taille}.bin")
+                with open(chemin, "wb") as f_contenu:
+                    f_contenu.write(contenus[structure])
+                sortie = subprocess.run([sys.executable, os.path.abspath(__file__), "--mesurer", structure, chemin],
+                                        check=True, capture_output=True, text=True).stdout
+                resultats[structure] = json.loads(sortie.splitlines()[-1])
+            tous[taille] = resultats
+            reference = resultats[STRUCTURES[0]]["octets"]
+            print(f"\n{taille} entrées ({resultats[STRUCTURES[0]]['mesure']})")
+            print(f"{'structure':<16}{'mémoire (Mo)':>14}{'octets/entrée':>15}{'gain':>8}{'construction':>14}")
+            for structure, r in resultats.items():
+                print(f"{structure:<16}{r['octets'] / 1e6:>14.1f}{r['octets'] / taille:>15.0f}"
+                      f"{1 - r['octets'] / reference:>8.0%}{r['construction_s'] * 1000:>12.0f}ms")
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(tous, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
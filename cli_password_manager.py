@@ -0,0 +1,553 @@
+"""Interface en ligne de commande de Big Key, sans interface graphique.
+
+    python -m cli_password_manager generate -n 5 -l 24
+    printf '%s\n' "$MAITRE" | python -m cli_password_manager --master-stdin get exemple.fr alice
+    BIG_KEY_MASTER_PASSWORD=... python -m cli_password_manager --json list
+
+Le démarrage est gardé minimal pour les scripts et la CI : ni `customtkinter`, ni
+`tkinter`, ni `pyperclip` ne sont importés, et `cryptography` ne l'est qu'au
+déverrouillage du coffre (la génération n'en a pas besoin). Le mot de passe maître
+est lu, par ordre de priorité, depuis `--master-fd`, `--master-stdin`, `--master-env`,
+la variable `BIG_KEY_MASTER_PASSWORD`, puis une saisie masquée sur le terminal.
+
+Si `BIG_KEY_AGENT_SOCK` est défini (voir `agent_password_manager`), `get` et `list`
+interrogent d'abord l'agent, sans dérivation de clé ; s'il est injoignable ou
+verrouillé, le coffre est déverrouillé directement.
+
+Codes de sortie : 0 succès, 1 entrée introuvable, 2 usage, 3 coffre illisible ou erreur.
+"""
+import argparse
+import contextlib
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+import core_password_manager as core
+
+
+MASTER_ENV = "BIG_KEY_MASTER_PASSWORD"
+AGENT_SOCKET_ENV = "BIG_KEY_AGENT_SOCK"
+DIR_ENV = "BIG_KEY_DIR"
+
+SORTIE_OK = 0
+SORTIE_INTROUVABLE = 1
+SORTIE_USAGE = 2
+SORTIE_ERREUR = 3
+
+
+class ErreurCli(Exception):
+    """Erreur signalée à l'utilisateur, avec son code de sortie."""
+    def __init__(self, message: str, code: int = SORTIE_ERREUR):
+        super().__init__(message)
+        self.code = code
+
+
+# --- Lecture des secrets ---
+
+def _lire_fd(fd: int) -> str:
+    """Première ligne lue sur le descripteur `fd` (sans le saut de ligne)."""
+    with open(fd, "r", encoding="utf-8", closefd=False) as flux:
+        return flux.readline().rstrip("\r\n")
+
+def _lire_secret(fd=None, stdin=False, env=None, invite="Mot de passe : ", env_defaut=None) -> str:
+    """Lit un secret depuis un descripteur, l'entrée standard, une variable ou le terminal."""
+    if fd is not None:
+        return _lire_fd(fd)
+    if stdin:
+        ligne = sys.stdin.readline()
+        if not ligne:
+            raise ErreurCli("Entrée standard vide : secret attendu.", SORTIE_USAGE)
+        return ligne.rstrip("\r\n")
+    for nom in (env, env_defaut):
+        if nom and nom in os.environ:
+            return os.environ[nom]
+    if not sys.stdin.isatty():
+        raise ErreurCli("Aucun secret fourni (--*-fd, --*-stdin ou --*-env) et pas de terminal.", SORTIE_USAGE)
+    import getpass
+    return getpass.getpass(invite)
+
+def _mot_passe_maitre(args) -> str:
+    return _lire_secret(args.master_fd, args.master_stdin, args.master_env, "Mot de passe maître : ", MASTER_ENV)
+
+
+# --- Session ---
+
+def _ouvrir_session(args, creer: bool = False, mot_passe_maitre: str = None, historique: bool = False,
+                    lecture_seule: bool = False) -> core.SessionCoffre:
+    """Déverrouille le coffre du répertoire courant (créé seulement si `creer`).
+
+    Avec `historique`, les écritures de la session sont versionnées (voir `historique_password_manager`).
+    En `lecture_seule`, le coffre et son journal sont lus sans rien écrire : les sessions
+    ouvertes ailleurs (GUI, agent) ne voient pas le disque changer.
+    """
+    if not creer and not os.path.exists(core.STORAGE_FILENAME):
+        raise ErreurCli(f"Aucun coffre '{core.STORAGE_FILENAME}' dans '{os.getcwd()}'.")
+    if mot_passe_maitre is None:
+        mot_passe_maitre = _mot_passe_maitre(args)
+    try:
+        session = core.charger_ou_creer_stockage(mot_passe_maitre, journal=not lecture_seule)
+    except ValueError as e:
+        raise ErreurCli(str(e))
+    if historique:
+        import historique_password_manager as historique_pm
+        try:
+            historique_pm.activer(session)
+        except (OSError, ValueError) as e:
+            print(f"AVERTISSEMENT: Historique indisponible : {e}", file=sys.stderr)
+    return session
+
+def _persister(session: core.SessionCoffre):
+    """Ajoute les modifications au journal, ou réécrit l'instantané s'il est temps de compacter."""
+    if session.doit_compacter():
+        session.sauvegarder()
+    else:
+        session.persister()
+
+def _via_agent(args, operation: str, **parametres) -> Optional[dict]:
+    """Réponse de l'agent, ou None s'il n'y en a pas (ou s'il est verrouillé)."""
+    if args.no_agent or not os.environ.get(AGENT_SOCKET_ENV):
+        return None
+    from agent_password_manager import ClientAgent, ErreurAgent # Client seul : pas d'asyncio
+    try:
+        with ClientAgent(os.environ[AGENT_SOCKET_ENV]) as client:
+            return client.requete(operation, **parametres)
+    except ErreurAgent as e:
+        if e.code == "not_found":
+            raise ErreurCli(str(e), SORTIE_INTROUVABLE)
+        if e.code == "usage":
+            raise ErreurCli(str(e), SORTIE_USAGE)
+        return None
+
+def _utilisateur_unique(passwords_data: core.PasswordData, site: str) -> str:
+    utilisateurs = core.recuperer_utilisateurs_pour_site(passwords_data, site)
+    if not utilisateurs:
+        raise ErreurCli(f"Site '{site}' introuvable.", SORTIE_INTROUVABLE)
+    if len(utilisateurs) > 1:
+        raise ErreurCli(f"Plusieurs utilisateurs pour '{site}' : précisez-en un ({', '.join(utilisateurs)}).", SORTIE_USAGE)
+    return utilisateurs[0]
+
+
+# --- Commandes ---
+# Chaque commande retourne l'objet à afficher : une chaîne, une liste (une ligne par
+# élément) ou un dict (affiché seulement avec --json), ou None.
+
+def cmd_generate(args):
+    if args.words:
+        valeurs = core.generer_phrases_de_passe(args.count, args.words, args.separator)
+        entropie = core.estimer_entropie_phrase(args.words)
+    else:
+        options = (args.length, not args.no_upper, not args.no_digits, not args.no_symbols)
+        valeurs = core.generer_mots_de_passe(args.count, *options)
+        entropie = core.estimer_entropie(*options)
+    if args.json:
+        return {"passwords": valeurs, "entropy_bits": round(entropie, 1)}
+    return valeurs
+
+def cmd_get(args):
+    reponse = _via_agent(args, "get", site=args.site, user=args.user)
+    if reponse is not None:
+        if args.json:
+            return {"site": reponse["site"], "username": reponse["username"], "password": reponse["password"]}
+        return reponse["password"]
+    session = _ouvrir_session(args, lecture_seule=True)
+    utilisateur = args.user if args.user is not None else _utilisateur_unique(session.passwords_data, args.site)
+    mot_de_passe = core.recuperer_entree(session.passwords_data, args.site, utilisateur)
+    if mot_de_passe is None:
+        raise ErreurCli(f"Entrée '{utilisateur}' introuvable pour '{args.site}'.", SORTIE_INTROUVABLE)
+    if args.json:
+        resultat = {"site": args.site, "username": utilisateur, "password": mot_de_passe}
+        dates = core.recuperer_dates_entree(session.passwords_data, args.site, utilisateur)
+        if dates is not None:
+            resultat["created_at"], resultat["modified_at"] = dates
+        return resultat
+    return mot_de_passe
+
+def cmd_set(args):
+    mot_passe_maitre = _mot_passe_maitre(args) # Lu en premier : sur stdin, le maître précède la valeur
+    if args.generate:
+        mot_de_passe = core.generer_mot_de_passe(args.generate)
+    else:
+        mot_de_passe = _lire_secret(args.fd, args.stdin, args.env, f"Mot de passe pour {args.user}@{args.site} : ")
+    if not mot_de_passe:
+        raise ErreurCli("Mot de passe vide.", SORTIE_USAGE)
+    session = _ouvrir_session(args, creer=True, mot_passe_maitre=mot_passe_maitre, historique=True)
+    existait = core.entree_existe(session.passwords_data, args.site, args.user)
+    core.ajouter_ou_modifier_entree(session.passwords_data, args.site, args.user, mot_de_passe)
+    _persister(session)
+    if args.json:
+        resultat = {"site": args.site, "username": args.user, "created": not existait}
+        if args.generate:
+            resultat["password"] = mot_de_passe
+        return resultat
+    return mot_de_passe if args.generate else None
+
+def cmd_list(args):
+    reponse = _via_agent(args, "list", site=args.site, search=args.search)
+    if reponse is not None:
+        if args.site is not None:
+            return {"site": args.site, "usernames": reponse["usernames"]} if args.json else reponse["usernames"]
+        return {"sites": reponse["sites"]} if args.json else reponse["sites"]
+    session = _ouvrir_session(args, lecture_seule=True)
+    if args.site is not None:
+        if args.site not in session.passwords_data:
+            raise ErreurCli(f"Site '{args.site}' introuvable.", SORTIE_INTROUVABLE)
+        utilisateurs = core.recuperer_utilisateurs_pour_site(session.passwords_data, args.site)
+        return {"site": args.site, "usernames": utilisateurs} if args.json else utilisateurs
+    sites = core.lister_sites(session.passwords_data)
+    if args.search:
+        terme = args.search.casefold()
+        sites = [site for site in sites if terme in site.casefold()] # Un seul passage : moins cher que construire l'index
+    return {"sites": sites} if args.json else sites
+
+def cmd_delete(args):
+    session = _ouvrir_session(args, historique=True)
+    if args.user is None:
+        supprime = core.supprimer_site(session.passwords_data, args.site)
+    else:
+        supprime = core.supprimer_entree(session.passwords_data, args.site, args.user)
+    if not supprime:
+        raise ErreurCli("Entrée introuvable.", SORTIE_INTROUVABLE)
+    _persister(session)
+    return {"site": args.site, "username": args.user, "deleted": True} if args.json else None
+
+def cmd_import(args):
+    session = _ouvrir_session(args, creer=True, historique=True)
+    try:
+        rapport = core.importer_fichier(session, args.file, args.format, args.policy)
+    except (OSError, ValueError) as e:
+        raise ErreurCli(str(e))
+    if args.json:
+        return {"added": rapport.ajoutees, "overwritten": rapport.ecrasees, "renamed": rapport.renommees,
+                "identical": rapport.identiques, "skipped": rapport.ignorees, "invalid": rapport.invalides,
+                "conflicts": [{"site": site, "username": user} for site, user in rapport.conflits]}
+    return str(rapport)
+
+def cmd_export(args):
+    session = _ouvrir_session(args, lecture_seule=True)
+    try:
+        nombre = core.exporter_fichier(session, args.file, args.format)
+    except (OSError, ValueError) as e:
+        raise ErreurCli(str(e))
+    return {"file": args.file, "entries": nombre} if args.json else None
+
+def cmd_passwd(args):
+    ancien = _mot_passe_maitre(args) # Sur stdin : l'actuel, puis le nouveau
+    nouveau = _lire_secret(args.new_fd, args.new_stdin, args.new_env, "Nouveau mot de passe maître : ")
+    if not nouveau:
+        raise ErreurCli("Nouveau mot de passe maître vide.", SORTIE_USAGE)
+    session = _ouvrir_session(args, mot_passe_maitre=ancien)
+    import historique_password_manager as historique_pm
+    import pieces_password_manager as pieces_pm
+    try:
+        historique_pm.activer(session)
+    except (OSError, ValueError) as e:
+        if args.rotate_key: # Clé de l'historique laissée sous l'ancienne clé de données : historique perdu
+            raise ErreurCli(f"Historique indisponible, rotation de la clé annulée : {e}")
+        print(f"AVERTISSEMENT: Historique indisponible : {e}", file=sys.stderr)
+    pieces_pm.activer(session) # Clé des pièces jointes réenveloppée en cas de rotation
+    try:
+        core.changer_mot_passe_maitre(session, ancien, nouveau, pivoter_cle=args.rotate_key, processus=args.workers)
+    except ValueError as e:
+        raise ErreurCli(str(e))
+    return {"rotated_key": args.rotate_key, "revision": session.revision} if args.json else None
+
+def _piece_json(piece: dict) -> dict:
+    return {"name": piece["nom"], "type": piece["type"], "size": piece["taille"], "added": piece["ajout"]}
+
+def cmd_attach(args):
+    import pieces_password_manager as pieces_pm
+    mot_passe_maitre = _mot_passe_maitre(args) # Sur stdin, le maître précède la note
+    if (args.file is None) == (args.note is None):
+        raise ErreurCli("Indiquer un fichier, ou --note TITRE (texte sur l'entrée standard).", SORTIE_USAGE)
+    texte = sys.stdin.read() if args.note is not None else None
+    session = _ouvrir_session(args, mot_passe_maitre=mot_passe_maitre, historique=True)
+    pieces = pieces_pm.activer(session)
+    try:
+        if args.note is not None:
+            piece = pieces.joindre_note(args.site, args.user, args.note, texte)
+        else:
+            piece = pieces.joindre_fichier(args.site, args.user, args.file, args.name)
+    except ValueError as e:
+        raise ErreurCli(str(e), SORTIE_INTROUVABLE)
+    _persister(session)
+    return dict(_piece_json(piece), site=args.site, username=args.user) if args.json else None
+
+def cmd_attachments(args):
+    import pieces_password_manager as pieces_pm
+    session = _ouvrir_session(args, lecture_seule=True)
+    if not core.entree_existe(session.passwords_data, args.site, args.user):
+        raise ErreurCli(f"Entrée '{args.user}' introuvable pour '{args.site}'.", SORTIE_INTROUVABLE)
+    liste = core.recuperer_pieces_entree(session.passwords_data, args.site, args.user)
+    if args.name is None:
+        if args.json:
+            return {"site": args.site, "username": args.user, "attachments": [_piece_json(piece) for piece in liste]}
+        return [f"{piece['nom']}\t{piece['type']}\t{pieces_pm.formater_taille(piece['taille'])}" for piece in liste]
+    piece = pieces_pm.trouver_piece(liste, args.name)
+    if piece is None:
+        raise ErreurCli(f"Pièce jointe '{args.name}' introuvable.", SORTIE_INTROUVABLE)
+    pieces = pieces_pm.activer(session)
+    try:
+        if args.output is not None:
+            pieces.extraire(piece["objet"], args.output)
+            return {"file": args.output, "size": piece["taille"]} if args.json else None
+        if piece["type"] != "note":
+            raise ErreurCli("Pièce jointe binaire : indiquer -o FICHIER.", SORTIE_USAGE)
+        texte = pieces.lire_note(piece)
+    except ValueError as e:
+        raise ErreurCli(str(e))
+    return {"name": piece["nom"], "text": texte} if args.json else texte
+
+def cmd_detach(args):
+    import pieces_password_manager as pieces_pm
+    session = _ouvrir_session(args, historique=True)
+    pieces = pieces_pm.activer(session)
+    if not pieces.detacher(args.site, args.user, args.name):
+        raise ErreurCli(f"Pièce jointe '{args.name}' introuvable.", SORTIE_INTROUVABLE)
+    _persister(session)
+    pieces.nettoyer(session.passwords_data)
+    return {"site": args.site, "username": args.user, "name": args.name, "detached": True} if args.json else None
+
+def _rapport_replication(args, rapport):
+    if args.json:
+        return {"sequence": rapport.sequence, "modified": rapport.modifiees, "deleted": rapport.supprimees,
+                "buckets": rapport.seaux_differents, "deltas": rapport.deltas_rejoues, "bytes_written": rapport.octets_ecrits}
+    return str(rapport)
+
+def cmd_replicate(args):
+    import replication_password_manager as replication
+    session = _ouvrir_session(args, lecture_seule=True)
+    try:
+        return _rapport_replication(args, replication.repliquer(session, args.directory))
+    except ValueError as e:
+        raise ErreurCli(str(e))
+
+def cmd_restore(args):
+    import replication_password_manager as replication
+    try:
+        if os.path.exists(core.STORAGE_FILENAME):
+            rapport = replication.tirer(_ouvrir_session(args, historique=True), args.directory)
+        else:
+            rapport = replication.restaurer(args.directory, _mot_passe_maitre(args))
+    except (FileNotFoundError, ValueError) as e:
+        raise ErreurCli(str(e))
+    return _rapport_replication(args, rapport)
+
+def _session_historique(args, lecture_seule: bool = False):
+    session = _ouvrir_session(args, historique=True, lecture_seule=lecture_seule)
+    if session.historique is None:
+        raise ErreurCli("Historique indisponible.")
+    return session
+
+def cmd_history(args):
+    session = _session_historique(args, lecture_seule=True)
+    historique = session.historique
+    if args.site is None:
+        if args.json:
+            return {"versions": [{"version": version.numero, "time": version.horodatage, "revision": version.revision,
+                                  "buckets": len(version.seaux)} for version in historique.versions]}
+        return [str(version) for version in historique.versions]
+    if args.user is None:
+        args.user = _utilisateur_unique(historique.etat(historique.versions[-1].numero, args.site), args.site)
+    valeurs = historique.historique_entree(args.site, args.user)
+    if not valeurs:
+        raise ErreurCli(f"Aucune version de '{args.user}' pour '{args.site}'.", SORTIE_INTROUVABLE)
+    if args.json:
+        return {"site": args.site, "username": args.user,
+                "versions": [{"version": version.numero, "time": version.horodatage, "deleted": valeur is None,
+                              **({"password": valeur} if args.show and valeur is not None else {})} for version, valeur in valeurs]}
+    lignes = []
+    for version, valeur in valeurs:
+        moment = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(version.horodatage))
+        affichee = "(supprimée)" if valeur is None else (valeur if args.show else "••••••••")
+        lignes.append(f"{version.numero:>6}  {moment}  {affichee}")
+    return lignes
+
+def cmd_rollback(args):
+    import historique_password_manager as historique_pm
+    session = _session_historique(args)
+    if args.user is not None and args.site is None:
+        raise ErreurCli("Précisez le site de l'utilisateur.", SORTIE_USAGE)
+    try:
+        modifiees = historique_pm.restaurer(session, args.version, args.site, args.user)
+    except ValueError as e:
+        raise ErreurCli(str(e), SORTIE_INTROUVABLE)
+    if modifiees:
+        _persister(session)
+    return {"version": args.version, "changed": modifiees} if args.json else None
+
+def cmd_audit(args):
+    import audit_password_manager as audit
+    corpus = None
+    chemin = args.breaches or os.environ.get(audit.FUITES_ENV)
+    if chemin:
+        try:
+            corpus = audit.CorpusFuites(os.path.abspath(chemin))
+        except (OSError, ValueError) as e:
+            raise ErreurCli(str(e), SORTIE_USAGE)
+    session = _ouvrir_session(args, lecture_seule=True)
+    try:
+        rapport = audit.auditer(session.passwords_data, corpus)
+    finally:
+        if corpus is not None:
+            corpus.fermer()
+    if args.json:
+        return {"entries": rapport.total, "breaches_checked": rapport.fuites_verifiees,
+                "weak": [{"site": site, "user": user, "bits": round(bits, 1)} for site, user, bits in rapport.faibles],
+                "reused": [[{"site": site, "user": user} for site, user in groupe] for groupe in rapport.reutilises],
+                "breached": [{"site": site, "user": user, "count": nombre} for site, user, nombre in rapport.compromis]}
+    return str(rapport)
+
+
+def _ajouter_source_secret(parser, prefixe: str, aide: str):
+    groupe = parser.add_mutually_exclusive_group()
+    groupe.add_argument(f"--{prefixe}fd", type=int, metavar="FD", help=f"{aide} : première ligne du descripteur FD")
+    groupe.add_argument(f"--{prefixe}stdin", action="store_true", help=f"{aide} : une ligne de l'entrée standard")
+    groupe.add_argument(f"--{prefixe}env", metavar="VAR", help=f"{aide} : variable d'environnement VAR")
+    return groupe
+
+def construire_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="cli_password_manager", description="Big Key en ligne de commande.")
+    parser.add_argument("--dir", default=os.environ.get(DIR_ENV), help=f"répertoire du coffre (défaut : ${DIR_ENV} ou répertoire courant)")
+    parser.add_argument("--json", action="store_true", help="sortie JSON sur une ligne")
+    parser.add_argument("-v", "--verbose", action="store_true", help="messages et durées par phase sur la sortie d'erreur")
+    parser.add_argument("--metrics", metavar="FICHIER", help="ajoute les durées par phase à FICHIER (JSON Lines)")
+    parser.add_argument("--no-agent", action="store_true", help=f"ignorer l'agent même si ${AGENT_SOCKET_ENV} est défini")
+    _ajouter_source_secret(parser, "master-", "mot de passe maître")
+    commandes = parser.add_subparsers(dest="commande", required=True)
+
+    p = commandes.add_parser("generate", help="génère des mots de passe ou des phrases de passe (sans coffre)")
+    p.add_argument("-n", "--count", type=int, default=1)
+    p.add_argument("-l", "--length", type=int, default=20)
+    p.add_argument("--no-upper", action="store_true")
+    p.add_argument("--no-digits", action="store_true")
+    p.add_argument("--no-symbols", action="store_true")
+    p.add_argument("-w", "--words", type=int, default=0, help="phrase de passe de N mots (liste EFF)")
+    p.add_argument("--separator", default="-")
+    p.set_defaults(fonction=cmd_generate)
+
+    p = commandes.add_parser("get", help="affiche un mot de passe")
+    p.add_argument("site")
+    p.add_argument("user", nargs="?", help="facultatif si le site n'a qu'un utilisateur")
+    p.set_defaults(fonction=cmd_get)
+
+    p = commandes.add_parser("set", help="ajoute ou modifie une entrée")
+    p.add_argument("site")
+    p.add_argument("user")
+    source = _ajouter_source_secret(p, "", "nouveau mot de passe")
+    source.add_argument("--generate", type=int, nargs="?", const=20, metavar="LONGUEUR", help="génère le mot de passe (et l'affiche)")
+    p.set_defaults(fonction=cmd_set)
+
+    p = commandes.add_parser("list", help="liste les sites, ou les utilisateurs d'un site")
+    p.add_argument("site", nargs="?")
+    p.add_argument("-s", "--search", help="sites dont le nom contient TERME")
+    p.set_defaults(fonction=cmd_list)
+
+    p = commandes.add_parser("delete", help="supprime une entrée, ou un site entier")
+    p.add_argument("site")
+    p.add_argument("user", nargs="?")
+    p.set_defaults(fonction=cmd_delete)
+
+    p = commandes.add_parser("import", help="importe un fichier CSV/JSON")
+    p.add_argument("file")
+    p.add_argument("--format", choices=("csv", "json", "jsonl"))
+    p.add_argument("--policy", choices=core.POLITIQUES_IMPORT, default="ignorer")
+    p.set_defaults(fonction=cmd_import)
+
+    p = commandes.add_parser("export", help="exporte le coffre EN CLAIR (CSV/JSON)")
+    p.add_argument("file")
+    p.add_argument("--format", choices=("csv", "json", "jsonl"))
+    p.set_defaults(fonction=cmd_export)
+
+    p = commandes.add_parser("attach", help="joint un fichier, ou une note sécurisée, à une entrée")
+    p.add_argument("site")
+    p.add_argument("user")
+    p.add_argument("file", nargs="?", type=os.path.abspath)
+    p.add_argument("--name", help="nom de la pièce (défaut : nom du fichier)")
+    p.add_argument("--note", metavar="TITRE", help="note sécurisée lue sur l'entrée standard")
+    p.set_defaults(fonction=cmd_attach)
+
+    p = commandes.add_parser("attachments", help="liste les pièces jointes d'une entrée, ou en extrait une")
+    p.add_argument("site")
+    p.add_argument("user")
+    p.add_argument("name", nargs="?")
+    p.add_argument("-o", "--output", type=os.path.abspath, metavar="FICHIER", help="écrit la pièce dans FICHIER")
+    p.set_defaults(fonction=cmd_attachments)
+
+    p = commandes.add_parser("detach", help="retire une pièce jointe d'une entrée")
+    p.add_argument("site")
+    p.add_argument("user")
+    p.add_argument("name")
+    p.set_defaults(fonction=cmd_detach)
+
+    p = commandes.add_parser("passwd", help="change le mot de passe maître")
+    _ajouter_source_secret(p, "new-", "nouveau mot de passe maître")
+    p.add_argument("--rotate-key", action="store_true", help="tire aussi une nouvelle clé de données et rescelle toutes les entrées")
+    p.add_argument("--workers", type=int, metavar="N", help="processus pour le rescellement (défaut : un par cœur)")
+    p.set_defaults(fonction=cmd_passwd)
+
+    p = commandes.add_parser("replicate", help="pousse les modifications vers une réplique (dossier local ou partage)")
+    p.add_argument("directory", type=os.path.abspath) # Résolu avant --dir
+    p.set_defaults(fonction=cmd_replicate)
+
+    p = commandes.add_parser("restore", help="reconstruit le coffre depuis une réplique, ou le met à jour")
+    p.add_argument("directory", type=os.path.abspath)
+    p.set_defaults(fonction=cmd_restore)
+
+    p = commandes.add_parser("history", help="versions conservées du coffre, ou valeurs successives d'une entrée")
+    p.add_argument("site", nargs="?")
+    p.add_argument("user", nargs="?", help="facultatif si le site n'a qu'un utilisateur")
+    p.add_argument("--show", action="store_true", help="affiche les mots de passe")
+    p.set_defaults(fonction=cmd_history)
+
+    p = commandes.add_parser("rollback", help="ramène le coffre, un site ou une entrée à une version antérieure")
+    p.add_argument("version", type=int)
+    p.add_argument("site", nargs="?")
+    p.add_argument("user", nargs="?")
+    p.set_defaults(fonction=cmd_rollback)
+
+    p = commandes.add_parser("audit", help="signale les mots de passe faibles, réutilisés ou présents dans une fuite connue")
+    p.add_argument("--breaches", type=os.path.abspath, metavar="FICHIER", help="empreintes compromises (défaut : $BIG_KEY_BREACH_FILE)")
+    p.set_defaults(fonction=cmd_audit)
+    return parser
+
+def _afficher(resultat, sortie):
+    if resultat is None:
+        return
+    if isinstance(resultat, dict):
+        sortie.write(json.dumps(resultat, ensure_ascii=False) + "\n")
+    elif isinstance(resultat, list):
+        sortie.writelines(f"{ligne}\n" for ligne in resultat)
+    else:
+        sortie.write(f"{resultat}\n")
+
+def main(argv=None) -> int:
+    args = construire_parser().parse_args(argv)
+    sortie = sys.stdout
+    if args.metrics:
+        core.activer_mesures(os.path.abspath(args.metrics))
+    if args.verbose:
+        import logging
+        logging.basicConfig(level=logging.INFO, stream=sys.stderr, format="%(message)s")
+        if not core.mesures_actives():
+            core.activer_mesures()
+    try:
+        if args.dir:
+            os.chdir(args.dir)
+        # Les messages du coffre (print) ne doivent pas se mêler à la sortie exploitable.
+        with open(os.devnull, "w") if not args.verbose else contextlib.nullcontext(sys.stderr) as journal_messages:
+            with contextlib.redirect_stdout(journal_messages):
+                resultat = args.fonction(args)
+    except ErreurCli as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return e.code
+    except OSError as e:
+        print(f"Erreur : {e}", file=sys.stderr)
+        return SORTIE_ERREUR
+    _afficher(resultat, sortie)
+    return SORTIE_OK
+
+
+if __name__ == "__main__":
+    sys.exit(main())
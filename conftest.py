@@ -0,0 +1,23 @@
+"""Fixtures communes des tests : coffre dans un répertoire temporaire, dérivation de clé rapide."""
+import pytest
+
+import core_password_manager as core
+
+
+KDF_TEST = {"algo": "pbkdf2-sha256", "iterations": 1000} # Quelques ms : les tests déverrouillent souvent
+MAITRE = "maitre de test"
+
+
+@pytest.fixture
+def coffre(tmp_path, monkeypatch):
+    """Répertoire courant vide pour les fichiers du coffre, KDF minimale et jamais recalibrée."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(core, "calibrer_kdf", lambda *args, **kwargs: dict(KDF_TEST))
+    monkeypatch.setattr(core, "KDF_MARGE_AMELIORATION", 0)
+    return tmp_path
+
+
+@pytest.fixture
+def session(coffre):
+    """Nouveau coffre déverrouillé, en mode journal."""
+    return core.charger_ou_creer_stockage(MAITRE)
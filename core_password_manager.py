@@ -1,17 +1,174 @@
 import secrets
 import string
 import json
+import logging
 import os
-from cryptography.fernet import Fernet, InvalidToken
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+import hashlib
+import array
+import collections
+import collections.abc
+import struct
+import sys
+import zlib
+import heapq
+import contextlib
+import csv
+import functools
+import itertools
+import math
+import time
+import threading
 import base64
-from typing import Dict, Optional, Tuple
+import bisect
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
 
 
 SALT_FILENAME = "pm_salt.bin"
 STORAGE_FILENAME = "passwords.enc"
 PBKDF2_ITERATIONS = 48000
+FORMAT_STOCKAGE = 2 # 1 : {site: {user: password}} en clair sous le chiffrement global ; 2 : mots de passe scellés un par un
+
+# --- 0. Mesures de Performance ---
+# Chaque opération (déverrouillage, sauvegarde, lecture d'une entrée...) est découpée
+# en phases chronométrées (dérivation, lecture, déchiffrement, désérialisation...).
+# Désactivées, les mesures coûtent un appel de fonction et un test par phase.
+
+logger = logging.getLogger("big_key")
+METRIQUES_ENV = "BIG_KEY_METRICS" # Chemin d'un fichier JSON Lines : active les mesures au chargement du module
+HISTORIQUE_MESURES = 100          # Opérations gardées en mémoire pour le panneau de diagnostic
+
+class _EtatMesures:
+    def __init__(self):
+        self.actives = False
+        self.fichier: Optional[str] = None
+        self.historique = collections.deque(maxlen=HISTORIQUE_MESURES)
+        self.local = threading.local() # Opération en cours, par thread
+        self.verrou = threading.Lock()
+
+_mesures = _EtatMesures()
+
+class _MesureInactive:
+    """Contexte sans effet renvoyé quand les mesures sont désactivées."""
+    __slots__ = ()
+    def __enter__(self):
+        return self
+    def __exit__(self, *exc):
+        return False
+    def __setitem__(self, cle, valeur):
+        pass
+
+_MESURE_INACTIVE = _MesureInactive()
+
+class _Phase:
+    __slots__ = ("nom", "attributs", "_debut")
+    def __init__(self, nom: str, attributs: dict):
+        self.nom = nom
+        self.attributs = attributs
+
+    def __setitem__(self, cle: str, valeur):
+        self.attributs[cle] = valeur
+
+    def __enter__(self):
+        self._debut = time.perf_counter()
+        return self
+
+    def __exit__(self, type_exc, exc, tb):
+        enregistrement = {"phase": self.nom, "duree_ms": round((time.perf_counter() - self._debut) * 1000, 3)}
+        enregistrement.update(self.attributs)
+        if type_exc is not None:
+            enregistrement["erreur"] = type_exc.__name__
+        operation = getattr(_mesures.local, "operation", None)
+        if operation is not None:
+            operation.phases.append(enregistrement)
+        else: # Phase isolée : c'est sa propre opération
+            _emettre({"operation": self.nom, "duree_ms": enregistrement["duree_ms"], "phases": [enregistrement]})
+        return False
+
+class _Operation:
+    __slots__ = ("nom", "phases", "_debut", "_racine")
+    def __init__(self, nom: str):
+        self.nom = nom
+        self.phases: List[dict] = []
+
+    def __enter__(self):
+        # Une opération imbriquée (sauvegarde pendant un déverrouillage) ajoute ses phases à l'englobante.
+        self._racine = getattr(_mesures.local, "operation", None) is None
+        if self._racine:
+            _mesures.local.operation = self
+            self._debut = time.perf_counter()
+        return self
+
+    def __exit__(self, type_exc, exc, tb):
+        if self._racine:
+            _mesures.local.operation = None
+            enregistrement = {"operation": self.nom, "duree_ms": round((time.perf_counter() - self._debut) * 1000, 3), "phases": self.phases}
+            if type_exc is not None:
+                enregistrement["erreur"] = type_exc.__name__
+            _emettre(enregistrement)
+        return False
+
+def mesurer_phase(nom: str, **attributs):
+    """Contexte chronométrant une phase ; `phase["octets"] = n` y ajoute un attribut."""
+    if not _mesures.actives:
+        return _MESURE_INACTIVE
+    return _Phase(nom, attributs)
+
+def mesurer_operation(nom: str):
+    """Décorateur : regroupe les phases d'un appel de la fonction en une opération `nom`."""
+    def decorateur(fonction):
+        @functools.wraps(fonction)
+        def enveloppe(*args, **kwargs):
+            if not _mesures.actives:
+                return fonction(*args, **kwargs)
+            with _Operation(nom):
+                return fonction(*args, **kwargs)
+        return enveloppe
+    return decorateur
+
+def _emettre(enregistrement: dict):
+    enregistrement["horodatage"] = round(time.time(), 3)
+    _mesures.historique.append(enregistrement)
+    if logger.isEnabledFor(logging.INFO):
+        detail = ", ".join(f"{p['phase']} {p['duree_ms']:.1f} ms" + (f" ({p['octets']} o)" if "octets" in p else "")
+                           for p in enregistrement["phases"])
+        logger.info("%s : %.1f ms [%s]", enregistrement["operation"], enregistrement["duree_ms"], detail)
+    if _mesures.fichier:
+        ligne = json.dumps(enregistrement, ensure_ascii=False) + "\n"
+        with _mesures.verrou:
+            try:
+                with open(_mesures.fichier, "a", encoding="utf-8") as f_metriques:
+                    f_metriques.write(ligne)
+            except OSError as e:
+                logger.warning("Écriture des mesures dans '%s' impossible : %s", _mesures.fichier, e)
+
+def activer_mesures(fichier_metriques: Optional[str] = None):
+    """Active les mesures ; avec `fichier_metriques`, chaque opération y est ajoutée en JSON Lines."""
+    _mesures.fichier = fichier_metriques
+    _mesures.actives = True
+
+def desactiver_mesures():
+    _mesures.actives = False
+    _mesures.fichier = None
+
+def mesures_actives() -> bool:
+    return _mesures.actives
+
+def dernieres_mesures() -> List[dict]:
+    """Dernières opérations mesurées (la plus récente en dernier)."""
+    return list(_mesures.historique)
+
+def effacer_mesures():
+    _mesures.historique.clear()
+
+def noter_operation(nom: str, phases: Dict[str, float]):
+    """Enregistre une opération chronométrée ailleurs (durées en ms par phase), si les mesures sont actives."""
+    if _mesures.actives:
+        _emettre({"operation": nom, "duree_ms": round(sum(phases.values()), 3),
+                  "phases": [{"phase": phase, "duree_ms": round(duree, 3)} for phase, duree in phases.items()]})
+
+if os.environ.get(METRIQUES_ENV):
+    activer_mesures(os.environ[METRIQUES_ENV])
+
 
 # --- 1. Génération de Mot de Passe ---
 
@@ -48,36 +205,711 @@ def generer_mot_de_passe(longueur: int = 20, utiliser_majuscules: bool = True, u
     return "".join(mot_de_passe_liste)
 
 
+# Génération en masse : les octets viennent de gros blocs os.urandom et sont convertis
+# en caractères par `bytes.translate`, qui rejette en même temps les octets qui
+# biaiseraient le tirage (échantillonnage par rejet, sans biais de modulo).
+TAILLE_BLOC_ALEATOIRE = 64 * 1024
+WORDLIST_FILENAME = os.path.join(os.path.dirname(os.path.abspath(__file__)), "eff_large_wordlist.txt")
+
+def _classes_caracteres(utiliser_majuscules: bool, utiliser_chiffres: bool, utiliser_symboles: bool) -> Tuple[str, List[str]]:
+    """Alphabet complet et classes dont au moins un caractère est exigé (comme `generer_mot_de_passe`)."""
+    classes_exigees = []
+    if utiliser_majuscules:
+        classes_exigees.append(string.ascii_uppercase)
+    if utiliser_chiffres:
+        classes_exigees.append(string.digits)
+    if utiliser_symboles:
+        classes_exigees.append(string.punctuation)
+    return string.ascii_lowercase + "".join(classes_exigees), classes_exigees
+
+@functools.lru_cache(maxsize=16)
+def _table_rejet(alphabet: str) -> Tuple[bytes, bytes]:
+    """Table de traduction octet -> caractère et octets à rejeter pour un tirage uniforme."""
+    limite = 256 - 256 % len(alphabet)
+    table = bytes(ord(alphabet[octet % len(alphabet)]) if octet < limite else 0 for octet in range(256))
+    return table, bytes(range(limite, 256))
+
+def _caracteres_aleatoires(alphabet: str, nombre: int) -> str:
+    """`nombre` caractères tirés uniformément dans `alphabet` (ASCII, au plus 256 symboles)."""
+    table, rejetes = _table_rejet(alphabet)
+    morceaux, total = [], 0
+    while total < nombre:
+        morceau = os.urandom(max(TAILLE_BLOC_ALEATOIRE, nombre - total)).translate(table, rejetes)
+        morceaux.append(morceau)
+        total += len(morceau)
+    return b"".join(morceaux)[:nombre].decode('ascii')
+
+def _indices_aleatoires(borne: int, nombre: int) -> List[int]:
+    """`nombre` entiers uniformes dans [0, borne[ (borne < 65536), par rejet sur 16 bits."""
+    limite = 65536 - 65536 % borne
+    indices: List[int] = []
+    while len(indices) < nombre:
+        valeurs = array.array("H", os.urandom(2 * max(1024, 2 * (nombre - len(indices)))))
+        indices.extend(valeur % borne for valeur in valeurs if valeur < limite)
+    return indices[:nombre]
+
+def generer_mots_de_passe(nombre: int, longueur: int = 20, utiliser_majuscules: bool = True, utiliser_chiffres: bool = True, utiliser_symboles: bool = True) -> list[str]:
+    """Génère `nombre` mots de passe avec les mêmes garanties que `generer_mot_de_passe`.
+
+    Chaque classe sélectionnée apparaît au moins une fois : les tirages qui n'en
+    contiennent pas sont rejetés, ce qui garde la distribution uniforme sur les
+    mots de passe valides.
+    """
+    alphabet, classes_exigees = _classes_caracteres(utiliser_majuscules, utiliser_chiffres, utiliser_symboles)
+    if longueur < len(classes_exigees):
+        raise ValueError(f"Longueur trop courte pour inclure {len(classes_exigees)} classes de caractères.")
+    ensembles = [frozenset(classe) for classe in classes_exigees]
+    mots_de_passe: list[str] = []
+    while len(mots_de_passe) < nombre:
+        flux = _caracteres_aleatoires(alphabet, (nombre - len(mots_de_passe)) * longueur)
+        for debut in range(0, len(flux), longueur):
+            candidat = flux[debut:debut + longueur]
+            if all(not ensemble.isdisjoint(candidat) for ensemble in ensembles):
+                mots_de_passe.append(candidat)
+    return mots_de_passe
+
+@functools.lru_cache(maxsize=4)
+def charger_liste_mots(chemin: str = WORDLIST_FILENAME) -> Tuple[str, ...]:
+    """Charge (une seule fois) une liste de mots au format diceware « 11111<tab>mot »."""
+    with open(chemin, encoding="utf-8") as f_mots:
+        mots = tuple(ligne.split()[-1] for ligne in f_mots if ligne.strip())
+    if len(set(mots)) != len(mots):
+        raise ValueError(f"La liste de mots '{chemin}' contient des doublons.")
+    return mots
+
+def generer_phrases_de_passe(nombre: int, nb_mots: int = 6, separateur: str = "-", chemin_liste: str = WORDLIST_FILENAME) -> list[str]:
+    """Génère `nombre` phrases de passe de `nb_mots` mots tirés uniformément (style diceware)."""
+    if nb_mots < 1:
+        raise ValueError("Une phrase de passe contient au moins un mot.")
+    mots = charger_liste_mots(chemin_liste)
+    indices = _indices_aleatoires(len(mots), nombre * nb_mots)
+    return [separateur.join(mots[i] for i in indices[debut:debut + nb_mots]) for debut in range(0, len(indices), nb_mots)]
+
+def estimer_entropie(longueur: int = 20, utiliser_majuscules: bool = True, utiliser_chiffres: bool = True, utiliser_symboles: bool = True) -> float:
+    """Entropie en bits d'un mot de passe de `generer_mots_de_passe` avec cette politique.
+
+    Compte exactement les chaînes valides (inclusion-exclusion sur les classes exigées).
+    """
+    alphabet, classes_exigees = _classes_caracteres(utiliser_majuscules, utiliser_chiffres, utiliser_symboles)
+    valides = 0
+    for nb_exclues in range(len(classes_exigees) + 1):
+        for exclues in itertools.combinations(classes_exigees, nb_exclues):
+            valides += (-1) ** nb_exclues * (len(alphabet) - sum(len(classe) for classe in exclues)) ** longueur
+    return math.log2(valides) if valides > 0 else 0.0
+
+def estimer_entropie_phrase(nb_mots: int = 6, chemin_liste: str = WORDLIST_FILENAME) -> float:
+    """Entropie en bits d'une phrase de passe de `generer_phrases_de_passe`."""
+    return nb_mots * math.log2(len(charger_liste_mots(chemin_liste)))
+
+
 # --- 2. Chiffrement et Déchiffrement ---
 
+# `cryptography` n'est importé qu'au premier besoin : la génération de mots de passe
+# et la ligne de commande (`cli_password_manager`) démarrent sans en payer le coût.
+Fernet = InvalidToken = AESGCM = InvalidTag = hashes = PBKDF2HMAC = HKDF = None
+
+def _charger_crypto():
+    """Importe les primitives de `cryptography` dans l'espace du module (une seule fois)."""
+    global Fernet, InvalidToken, AESGCM, InvalidTag, hashes, PBKDF2HMAC, HKDF
+    if Fernet is None:
+        from cryptography.exceptions import InvalidTag
+        from cryptography.fernet import Fernet, InvalidToken
+        from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+        from cryptography.hazmat.primitives import hashes
+        from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
+        from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
 def deriver_cle(mot_passe_maitre: bytes, salt: bytes) -> bytes:
     """Dérive une clé de chiffrement depuis le mot de passe maître et un sel."""
+    _charger_crypto()
     kdf = PBKDF2HMAC(
         algorithm=hashes.SHA256(),
         length=32,
         salt=salt,
         iterations=PBKDF2_ITERATIONS,
     )
-    cle = base64.urlsafe_b64encode(kdf.derive(mot_passe_maitre))
+    with mesurer_phase("derivation", algo="pbkdf2-sha256", iterations=PBKDF2_ITERATIONS):
+        cle = base64.urlsafe_b64encode(kdf.derive(mot_passe_maitre))
     return cle
 
-def chiffrer_donnees(cle: bytes, donnees: bytes) -> bytes:
-    """Chiffre les données en utilisant la clé dérivée."""
-    f = Fernet(cle)
-    return f.encrypt(donnees)
+def deriver_sous_cle(cle: bytes, usage: bytes) -> bytes:
+    """Dérive de la clé de session une clé Fernet indépendante, dédiée à `usage` (HKDF)."""
+    _charger_crypto()
+    hkdf = HKDF(algorithm=hashes.SHA256(), length=32, salt=None, info=b"big-key " + usage)
+    return base64.urlsafe_b64encode(hkdf.derive(base64.urlsafe_b64decode(cle)))
 
-def dechiffrer_donnees(cle: bytes, donnees_chiffrees: bytes) -> bytes:
-    """Déchiffre les données. Lève InvalidToken ou ValueError."""
-    f = Fernet(cle)
+# Paramètres de dérivation enregistrés dans l'en-tête du coffre, par exemple
+#   {"algo": "scrypt", "n": 131072, "r": 8, "p": 1} ou {"algo": "pbkdf2-sha256", "iterations": 600000}
+KDF_ALGORITHME = "scrypt"
+KDF_CIBLE_MS = 300                      # Durée de déverrouillage visée sur la machine courante
+KDF_MARGE_AMELIORATION = 0.5            # Recalibrage si la dérivation prend moins de 50 % de la cible
+KDF_MEMOIRE_MAX = 256 * 1024 * 1024     # Plafond mémoire de scrypt (128 * n * r octets)
+SCRYPT_N_MIN = 2 ** 14
+SCRYPT_R = 8
+
+def deriver_cle_kdf(mot_passe_maitre: bytes, salt: bytes, parametres: dict) -> bytes:
+    """Dérive une clé Fernet selon les paramètres KDF d'un en-tête de coffre."""
+    _charger_crypto()
+    algo = parametres.get("algo")
+    if algo == "pbkdf2-sha256":
+        kdf = PBKDF2HMAC(algorithm=hashes.SHA256(), length=32, salt=salt, iterations=int(parametres["iterations"]))
+    elif algo == "scrypt":
+        from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+        kdf = Scrypt(salt=salt, length=32, n=int(parametres["n"]), r=int(parametres["r"]), p=int(parametres["p"]))
+    else:
+        raise ValueError(f"Algorithme de dérivation inconnu : {algo}")
+    with mesurer_phase("derivation", **parametres):
+        return base64.urlsafe_b64encode(kdf.derive(mot_passe_maitre))
+
+def _duree_derivation(parametres: dict) -> float:
+    debut = time.perf_counter()
+    deriver_cle_kdf(b"calibrage", b"\0" * 16, parametres)
+    return time.perf_counter() - debut
+
+@functools.lru_cache(maxsize=None)
+def _calibrer_kdf(algorithme: str, cible_ms: int) -> Tuple[Tuple[str, object], ...]:
+    cible = cible_ms / 1000
+    if algorithme == "scrypt":
+        try:
+            duree = _duree_derivation({"algo": "scrypt", "n": SCRYPT_N_MIN, "r": SCRYPT_R, "p": 1})
+        except Exception: # scrypt absent de la bibliothèque OpenSSL utilisée
+            return _calibrer_kdf("pbkdf2-sha256", cible_ms)
+        # Le coût de scrypt est linéaire en n : on double n tant que la cible n'est pas dépassée.
+        n = SCRYPT_N_MIN
+        while duree * 2 <= cible and 128 * (n * 2) * SCRYPT_R <= KDF_MEMOIRE_MAX:
+            n *= 2
+            duree *= 2
+        return (("algo", "scrypt"), ("n", n), ("r", SCRYPT_R), ("p", 1))
+    if algorithme == "pbkdf2-sha256":
+        essai = 20000
+        duree = _duree_derivation({"algo": "pbkdf2-sha256", "iterations": essai})
+        iterations = int(essai * cible / max(duree, 1e-6)) // 1000 * 1000
+        return (("algo", "pbkdf2-sha256"), ("iterations", max(PBKDF2_ITERATIONS, iterations)))
+    raise ValueError(f"Algorithme de dérivation inconnu : {algorithme}")
+
+def calibrer_kdf(algorithme: str = KDF_ALGORITHME, cible_ms: int = KDF_CIBLE_MS) -> dict:
+    """Choisit les paramètres KDF les plus forts tenant dans `cible_ms` sur cette machine.
+
+    Le résultat est mis en cache pour la durée du processus.
+    """
+    return dict(_calibrer_kdf(algorithme, cible_ms))
+
+def cout_kdf(parametres: dict) -> int:
+    """Estimation du travail (comparable au sein d'un même algorithme)."""
+    if parametres.get("algo") == "scrypt":
+        return int(parametres["n"]) * int(parametres["r"]) * int(parametres["p"])
+    return int(parametres.get("iterations", 0))
+
+# Chiffrement en bloc (contenu du coffre) : AES-256-GCM avec une sous-clé "contenu" de la
+# clé Fernet. Le résultat est binaire : nonce aléatoire de 12 octets, chiffré, puis étiquette
+# de 16 octets ; Fernet ajoutait 57 octets, mais surtout un tiers de la taille (base64).
+TAILLE_NONCE = 12
+_PREFIXE_FERNET = b"gAAAAA" # Version 0x80 et horodatage < 2**32 en base64 : début de tout jeton Fernet
+
+def _chiffreur_contenu(cle: bytes) -> "AESGCM":
+    """Chiffreur AES-256-GCM dérivé de la clé Fernet `cle`."""
+    _charger_crypto()
+    return AESGCM(base64.urlsafe_b64decode(deriver_sous_cle(cle, b"contenu")))
+
+def _chiffrer_aead(chiffreur: "AESGCM", donnees: bytes, associees: bytes = b"") -> bytes:
+    """`associees`, le nonce puis le chiffré, assemblés en une seule copie."""
+    nonce = os.urandom(TAILLE_NONCE)
+    return b"".join((associees, nonce, chiffreur.encrypt(nonce, donnees, associees)))
+
+def _dechiffrer_aead(chiffreur: "AESGCM", donnees_chiffrees: bytes, associees: bytes = b"") -> bytes:
+    vue = memoryview(donnees_chiffrees) # Pas de copie du chiffré
     try:
-        return f.decrypt(donnees_chiffrees)
-    except InvalidToken:
+        return chiffreur.decrypt(vue[:TAILLE_NONCE], vue[TAILLE_NONCE:], associees)
+    except InvalidTag:
         raise ValueError("Impossible de déchiffrer. Mot de passe maître incorrect ou données corrompues.")
 
+def chiffrer_donnees(cle: bytes, donnees: bytes) -> bytes:
+    """Chiffre les données en utilisant la clé dérivée (AES-256-GCM, résultat binaire)."""
+    return _chiffrer_aead(_chiffreur_contenu(cle), donnees)
+
+def dechiffrer_donnees(cle: bytes, donnees_chiffrees: bytes) -> bytes:
+    """Déchiffre les données, y compris un jeton Fernet d'une version précédente. Lève ValueError."""
+    _charger_crypto()
+    if donnees_chiffrees.startswith(_PREFIXE_FERNET):
+        try:
+            return Fernet(cle).decrypt(donnees_chiffrees)
+        except InvalidToken:
+            pass # Nonce qui ressemble à un début de jeton (probabilité 2**-48)
+    return _dechiffrer_aead(_chiffreur_contenu(cle), donnees_chiffrees)
+
 
 # --- 3. Gestion du Stockage ---
 
-PasswordData = Dict[str, Dict[str, str]] # Type hint pour la structure {site: {user: password}}
+PasswordData = Dict[str, Dict[str, str]] # Type hint pour la structure {site: {user: password}} (password éventuellement scellé)
+
+JOURNAL_FILENAME = "passwords.journal"
+JOURNAL_TAILLE_MIN = 64 * 1024        # En dessous, jamais de compaction
+JOURNAL_TAILLE_MAX = 4 * 1024 * 1024  # Au-dessus, compaction quelle que soit la taille du coffre
+JOURNAL_RATIO_MAX = 0.5               # Compaction si journal > 50 % de l'instantané
+LOCK_FILENAME = "passwords.lock"      # Verrou consultatif partagé par tous les processus qui ouvrent le coffre
+
+
+class EntreesSite(collections.abc.MutableMapping):
+    """Vue {utilisateur: valeur} d'un site de `DonneesCoffre`.
+
+    Ne contient rien : lectures et écritures vont dans les colonnes du coffre.
+    """
+    __slots__ = ("_donnees", "_site")
+
+    def __init__(self, donnees: "DonneesCoffre", nom_site: str):
+        self._donnees = donnees
+        self._site = nom_site
+
+    def __getitem__(self, nom_utilisateur: str) -> str:
+        valeur = self._donnees.valeur(self._site, nom_utilisateur)
+        if valeur is None:
+            raise KeyError(nom_utilisateur)
+        return valeur
+
+    def __setitem__(self, nom_utilisateur: str, valeur: str):
+        self._donnees.ecrire(self._site, nom_utilisateur, valeur)
+
+    def __delitem__(self, nom_utilisateur: str):
+        if not self._donnees.effacer(self._site, nom_utilisateur):
+            raise KeyError(nom_utilisateur)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._donnees._utilisateurs_du_site(self._site))
+
+    def __len__(self) -> int:
+        ref = self._donnees._sites[self._site]
+        return 1 if type(ref) is int else len(ref)
+
+    def __contains__(self, nom_utilisateur) -> bool:
+        return self._donnees._emplacement(self._site, nom_utilisateur) is not None
+
+    def items(self):
+        return _PairesSite(self)
+
+    def __repr__(self) -> str:
+        return repr(dict(self.items()))
+
+def _emplacements(ref) -> Iterable[int]:
+    """Emplacements des entrées d'un site de `DonneesCoffre`, quelle que soit sa représentation."""
+    if type(ref) is int:
+        return (ref,)
+    return ref.values() if type(ref) is dict else ref
+
+class _PairesSite(collections.abc.ItemsView):
+    """`items()` d'un site, lu directement dans les colonnes (une recherche par entrée de moins)."""
+    def __iter__(self):
+        return iter(self._mapping._donnees._paires_du_site(self._mapping._site))
+
+
+class _SitesCoffre(collections.abc.ItemsView):
+    """`items()` de `DonneesCoffre` : vues créées directement, sans recherche du site."""
+    def __iter__(self):
+        donnees = self._mapping
+        return ((nom_site, EntreesSite(donnees, nom_site)) for nom_site in donnees._sites)
+
+
+class DonneesCoffre(collections.abc.MutableMapping):
+    """Entrées du coffre, vues comme {site: {user: password}}, qui signalent chacune de leurs modifications.
+
+    Les entrées sont rangées en colonnes indexées par emplacement : noms d'utilisateur
+    (internés, donc partagés entre sites), valeurs, dates de création et de modification
+    (secondes, 0 si inconnue). Un site pointe vers l'emplacement de son unique entrée,
+    vers un tuple d'emplacements (jusqu'à UTILISATEURS_TUPLE entrées), puis vers un dict
+    {utilisateur: emplacement} ; `coffre[site]` est une vue (`EntreesSite`). On évite
+    ainsi un dict par site et une copie de chaque nom d'utilisateur. Les références des
+    pièces jointes (`pieces`) sont rangées à part, pour les seules entrées qui en ont.
+
+    Les fonctions de gestion des entrées appellent `notifier` après chaque changement :
+    `generation` compte les modifications depuis le chargement et les `ecouteurs`
+    (journal, index...) reçoivent `(operation, site, utilisateur, mot_de_passe)`.
+
+    Avec un `scelleur`, chaque mot de passe est conservé scellé (jeton Fernet
+    individuel) et n'est déchiffré qu'à la demande par `recuperer_entree` ; les
+    écouteurs reçoivent alors la valeur scellée.
+
+    `index_ordonne` garde les sites et les utilisateurs triés ; il est mis à jour
+    avant les écouteurs, qui le trouvent donc déjà à jour.
+    """
+    UTILISATEURS_TUPLE = 8 # Au-delà, recherche d'un utilisateur par dict plutôt que par parcours
+
+    def __init__(self, sites: Optional[PasswordData] = None):
+        self._sites: Dict[str, object] = {}  # site -> emplacement, tuple d'emplacements ou {utilisateur: emplacement}
+        self._noms: List[Optional[str]] = [] # Colonnes, indexées par emplacement (None : emplacement libre)
+        self._valeurs: List[Optional[str]] = []
+        self._crees = array.array("I")
+        self._modifies = array.array("I")
+        self._libres: List[int] = []
+        self._pieces: Dict[int, List[dict]] = {} # emplacement -> références des pièces jointes (voir `pieces_password_manager`)
+        self.generation = 0
+        self.ecouteurs: List[Callable[[str, str, Optional[str], Optional[str]], None]] = []
+        self.scelleur: Optional[Fernet] = None
+        self.suivi: Optional["SuiviModifications"] = None
+        self._index_ordonne: Optional["IndexOrdonne"] = None
+        for nom_site, utilisateurs in (sites or {}).items():
+            self._sites[nom_site] = ()
+            for nom_utilisateur, valeur in utilisateurs.items():
+                self.ecrire(nom_site, nom_utilisateur, valeur, 0) # Dates inconnues
+
+    # --- Mapping {site: vue} ---
+
+    def __getitem__(self, nom_site: str) -> EntreesSite:
+        if nom_site not in self._sites:
+            raise KeyError(nom_site)
+        return EntreesSite(self, nom_site)
+
+    def __setitem__(self, nom_site: str, utilisateurs):
+        """Remplace les entrées du site (les dates d'une autre vue `EntreesSite` sont conservées)."""
+        if isinstance(utilisateurs, EntreesSite):
+            source = utilisateurs._donnees
+            entrees = [(nom, valeur) + source.dates(utilisateurs._site, nom) for nom, valeur in utilisateurs.items()]
+        else:
+            entrees = [(nom, valeur, None, None) for nom, valeur in utilisateurs.items()]
+        if nom_site in self._sites:
+            del self[nom_site]
+        self._sites[nom_site] = ()
+        for nom, valeur, creation, modification in entrees:
+            self.ecrire(nom_site, nom, valeur, modification, creation)
+
+    def __delitem__(self, nom_site: str):
+        for emplacement in _emplacements(self._sites.pop(nom_site)):
+            self._liberer(emplacement)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._sites)
+
+    def __len__(self) -> int:
+        return len(self._sites)
+
+    def __contains__(self, nom_site) -> bool:
+        return nom_site in self._sites
+
+    def __repr__(self) -> str:
+        return repr({nom_site: dict(utilisateurs.items()) for nom_site, utilisateurs in self.items()})
+
+    def items(self):
+        return _SitesCoffre(self)
+
+    def setdefault(self, nom_site: str, defaut=None) -> EntreesSite:
+        if nom_site not in self._sites:
+            self[nom_site] = defaut or {}
+        return self[nom_site]
+
+    def clear(self):
+        self._sites.clear()
+        del self._noms[:], self._valeurs[:], self._crees[:], self._modifies[:], self._libres[:]
+        self._pieces.clear()
+
+    # --- Colonnes ---
+
+    def _emplacement(self, nom_site: str, nom_utilisateur: str) -> Optional[int]:
+        ref = self._sites.get(nom_site)
+        if type(ref) is int:
+            return ref if self._noms[ref] == nom_utilisateur else None
+        if type(ref) is tuple:
+            noms = self._noms
+            for emplacement in ref:
+                if noms[emplacement] == nom_utilisateur:
+                    return emplacement
+            return None
+        return ref.get(nom_utilisateur) if ref is not None else None
+
+    def _utilisateurs_du_site(self, nom_site: str):
+        ref = self._sites[nom_site]
+        if type(ref) is dict:
+            return ref
+        return [self._noms[emplacement] for emplacement in _emplacements(ref)]
+
+    def _paires_du_site(self, nom_site: str) -> List[Tuple[str, str]]:
+        noms, valeurs = self._noms, self._valeurs
+        return [(noms[emplacement], valeurs[emplacement]) for emplacement in _emplacements(self._sites[nom_site])]
+
+    def _nouvel_emplacement(self, nom_utilisateur: str, valeur: str, date: int, creation: Optional[int] = None) -> int:
+        nom_utilisateur = sys.intern(nom_utilisateur)
+        creation = date if creation is None else int(creation)
+        if self._libres:
+            emplacement = self._libres.pop()
+            self._noms[emplacement], self._valeurs[emplacement] = nom_utilisateur, valeur
+            self._crees[emplacement], self._modifies[emplacement] = creation, date
+            return emplacement
+        self._noms.append(nom_utilisateur)
+        self._valeurs.append(valeur)
+        self._crees.append(creation)
+        self._modifies.append(date)
+        return len(self._noms) - 1
+
+    def _liberer(self, emplacement: int):
+        self._noms[emplacement] = self._valeurs[emplacement] = None
+        self._pieces.pop(emplacement, None)
+        self._libres.append(emplacement)
+
+    def valeur(self, nom_site: str, nom_utilisateur: str) -> Optional[str]:
+        """Valeur stockée (scellée le cas échéant) d'une entrée, ou None."""
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        return None if emplacement is None else self._valeurs[emplacement]
+
+    def dates(self, nom_site: str, nom_utilisateur: str) -> Tuple[int, int]:
+        """(création, dernière modification) d'une entrée existante, en secondes ; 0 si inconnue."""
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        if emplacement is None:
+            raise KeyError((nom_site, nom_utilisateur))
+        return self._crees[emplacement], self._modifies[emplacement]
+
+    def ecrire(self, nom_site: str, nom_utilisateur: str, valeur: str, date: Optional[int] = None, creation: Optional[int] = None):
+        """Crée ou remplace une entrée, datée de `date` (maintenant par défaut). Ne notifie pas.
+
+        `creation` : date de création d'une nouvelle entrée, si ce n'est pas `date`.
+        """
+        date = int(time.time()) if date is None else int(date)
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        if emplacement is not None:
+            self._valeurs[emplacement] = valeur
+            self._modifies[emplacement] = date
+            return
+        emplacement = self._nouvel_emplacement(nom_utilisateur, valeur, date, creation)
+        ref = self._sites.get(nom_site, ())
+        if type(ref) is int:
+            self._sites[nom_site] = (ref, emplacement)
+        elif type(ref) is dict:
+            ref[self._noms[emplacement]] = emplacement
+        elif not ref: # Site absent ou vide
+            self._sites[nom_site] = emplacement
+        elif len(ref) < self.UTILISATEURS_TUPLE:
+            self._sites[nom_site] = ref + (emplacement,)
+        else:
+            self._sites[nom_site] = {self._noms[i]: i for i in ref + (emplacement,)}
+
+    def pieces(self, nom_site: str, nom_utilisateur: str) -> List[dict]:
+        """Références des pièces jointes d'une entrée (liste vide si aucune ou si l'entrée n'existe pas)."""
+        if not self._pieces: # Cas courant : aucune pièce jointe dans le coffre
+            return []
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        return list(self._pieces.get(emplacement, ())) if emplacement is not None else []
+
+    def definir_pieces(self, nom_site: str, nom_utilisateur: str, pieces: List[dict]):
+        """Remplace les références des pièces jointes d'une entrée existante. Ne notifie pas."""
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        if emplacement is None:
+            raise KeyError((nom_site, nom_utilisateur))
+        if pieces:
+            self._pieces[emplacement] = list(pieces)
+        else:
+            self._pieces.pop(emplacement, None)
+
+    def toutes_pieces(self) -> Iterator[Tuple[str, str, List[dict]]]:
+        """(site, utilisateur, références) de chaque entrée qui a des pièces jointes."""
+        if not self._pieces:
+            return
+        for nom_site, ref in self._sites.items():
+            for emplacement in (ref,) if type(ref) is int else _emplacements(ref):
+                pieces = self._pieces.get(emplacement)
+                if pieces:
+                    yield nom_site, self._noms[emplacement], pieces
+
+    def resceller(self, nom_site: str, nom_utilisateur: str, valeur: str):
+        """Remplace la valeur d'une entrée existante sans la dater (changement de clé). Ne notifie pas."""
+        self._valeurs[self._emplacement(nom_site, nom_utilisateur)] = valeur
+
+    def effacer(self, nom_site: str, nom_utilisateur: str) -> bool:
+        """Retire une entrée ; le site reste présent (vide) s'il n'en a plus. Ne notifie pas."""
+        emplacement = self._emplacement(nom_site, nom_utilisateur)
+        if emplacement is None:
+            return False
+        ref = self._sites[nom_site]
+        if type(ref) is dict:
+            del ref[nom_utilisateur]
+            if len(ref) <= self.UTILISATEURS_TUPLE:
+                self._sites[nom_site] = tuple(ref.values())
+        elif type(ref) is tuple:
+            reste = tuple(i for i in ref if i != emplacement)
+            self._sites[nom_site] = reste[0] if len(reste) == 1 else reste
+        else:
+            self._sites[nom_site] = ()
+        self._liberer(emplacement)
+        return True
+
+    def entrees(self) -> Iterator[Tuple[str, str, str]]:
+        """Toutes les entrées (site, utilisateur, valeur stockée), lues directement dans les colonnes."""
+        noms, valeurs = self._noms, self._valeurs
+        for nom_site, ref in self._sites.items():
+            if type(ref) is int:
+                yield nom_site, noms[ref], valeurs[ref]
+            else:
+                for emplacement in _emplacements(ref):
+                    yield nom_site, noms[emplacement], valeurs[emplacement]
+
+    def copie(self) -> "DonneesCoffre":
+        """Copie des entrées, de leurs dates et de leurs pièces jointes (sans écouteurs ni scelleur)."""
+        copie = DonneesCoffre()
+        copie._sites = {nom_site: dict(ref) if type(ref) is dict else ref for nom_site, ref in self._sites.items()}
+        copie._noms, copie._valeurs = self._noms[:], self._valeurs[:]
+        copie._crees, copie._modifies = self._crees[:], self._modifies[:]
+        copie._libres = self._libres[:]
+        copie._pieces = dict(self._pieces) # Listes jamais modifiées sur place (voir `definir_pieces`)
+        return copie
+
+    def remplacer_par(self, autre: "DonneesCoffre"):
+        """Prend les entrées de `autre` (colonnes partagées : `autre` ne doit plus servir). Ne notifie pas."""
+        self._sites, self._noms, self._valeurs = autre._sites, autre._noms, autre._valeurs
+        self._crees, self._modifies, self._libres = autre._crees, autre._modifies, autre._libres
+        self._pieces = autre._pieces
+
+    def colonnes(self) -> Tuple[List[str], array.array, List[str], List[str], array.array, array.array]:
+        """(sites, nombre d'entrées par site, utilisateurs, valeurs, créations, modifications).
+
+        Les entrées sont dans l'ordre des sites (voir `encoder_contenu`).
+        """
+        noms_sites = list(self._sites)
+        comptes = array.array("I", bytes(4 * len(noms_sites)))
+        ordre: List[int] = []
+        for i, ref in enumerate(self._sites.values()):
+            if type(ref) is int:
+                comptes[i] = 1
+                ordre.append(ref)
+            else:
+                comptes[i] = len(ref)
+                ordre.extend(_emplacements(ref))
+        return (noms_sites, comptes, list(map(self._noms.__getitem__, ordre)), list(map(self._valeurs.__getitem__, ordre)),
+                array.array("I", map(self._crees.__getitem__, ordre)), array.array("I", map(self._modifies.__getitem__, ordre)))
+
+    @classmethod
+    def depuis_colonnes(cls, noms_sites: List[str], comptes: array.array, utilisateurs: List[str], valeurs: List[str],
+                        crees: Optional[array.array] = None, modifies: Optional[array.array] = None) -> "DonneesCoffre":
+        """Inverse de `colonnes` (dates inconnues si absentes). Les listes sont reprises sans copie.
+
+        Les noms d'utilisateur devraient déjà être partagés (voir `decoder_contenu`).
+        """
+        donnees = cls()
+        donnees._noms, donnees._valeurs = utilisateurs, valeurs
+        nb_entrees = len(utilisateurs)
+        donnees._crees = crees if crees is not None else array.array("I", bytes(4 * nb_entrees))
+        donnees._modifies = modifies if modifies is not None else array.array("I", bytes(4 * nb_entrees))
+        sites, noms, debut = donnees._sites, donnees._noms, 0
+        for nom_site, compte in zip(noms_sites, comptes):
+            if compte == 1:
+                sites[nom_site] = debut
+            elif compte <= cls.UTILISATEURS_TUPLE:
+                sites[nom_site] = tuple(range(debut, debut + compte))
+            else:
+                sites[nom_site] = dict(zip(noms[debut:debut + compte], range(debut, debut + compte)))
+            debut += compte
+        return donnees
+
+    @property
+    def index_ordonne(self) -> "IndexOrdonne":
+        """Sites et utilisateurs triés (construit au premier accès, puis tenu à jour)."""
+        if self._index_ordonne is None:
+            self._index_ordonne = IndexOrdonne(self)
+        return self._index_ordonne
+
+    def sceller(self, mot_de_passe: str) -> str:
+        """Valeur à stocker pour `mot_de_passe` (scellée si un scelleur est défini)."""
+        if self.scelleur is None:
+            return mot_de_passe
+        return self.scelleur.encrypt(mot_de_passe.encode('utf-8')).decode('ascii')
+
+    def ouvrir(self, valeur: str) -> str:
+        """Inverse de `sceller`. Lève ValueError si le jeton est invalide."""
+        if self.scelleur is None:
+            return valeur
+        try:
+            return self.scelleur.decrypt(valeur.encode('ascii')).decode('utf-8')
+        except InvalidToken:
+            raise ValueError("Impossible de déchiffrer l'entrée. Données corrompues.")
+
+    def notifier(self, operation: str, nom_site: str, nom_utilisateur: Optional[str] = None, mot_de_passe: Optional[str] = None):
+        self.generation += 1
+        if self._index_ordonne is not None:
+            if operation == "lot":
+                self._index_ordonne = None # Tout a pu changer : reconstruit au prochain accès
+            else:
+                self._index_ordonne.ecouter(operation, nom_site, nom_utilisateur)
+        for ecouteur in self.ecouteurs:
+            ecouteur(operation, nom_site, nom_utilisateur, mot_de_passe)
+
+    @contextlib.contextmanager
+    def lot(self):
+        """Regroupe des modifications en masse.
+
+        Pendant le lot, les écouteurs ne sont pas appelés ; ils reçoivent à la fin une
+        seule notification `("lot", "", None, None)` signifiant « tout a pu changer »
+        (aucune si le lot n'a rien modifié). L'index ordonné n'est pas non plus tenu
+        à jour entrée par entrée : il est reconstruit après le lot, à la demande.
+        """
+        ecouteurs, self.ecouteurs = self.ecouteurs, []
+        index, self._index_ordonne = self._index_ordonne, None
+        generation = self.generation
+        try:
+            yield self
+        finally:
+            self.ecouteurs = ecouteurs
+            if self._index_ordonne is None:
+                self._index_ordonne = index # Invalidé par la notification « lot » ci-dessous si besoin
+            if self.generation != generation:
+                self.notifier("lot", "")
+
+
+class ConflitEcriture(Exception):
+    """Le coffre a été modifié sur disque par un autre processus depuis notre dernière écriture.
+
+    Levée quand la fusion ne peut pas se faire sur place (instantané pris dans un
+    autre thread, ou `fusionner=False`) : appeler `SessionCoffre.synchroniser` depuis
+    le thread propriétaire des données, puis sauvegarder de nouveau.
+    """
+
+
+class SuiviModifications:
+    """Ancêtres des entrées modifiées localement, pour la fusion à trois voies.
+
+    Pour chaque entrée (site, utilisateur) modifiée depuis la dernière écriture, garde
+    la valeur qu'elle avait avant la première modification (None si elle n'existait
+    pas), c'est-à-dire la valeur connue sur disque. `noter` est appelé avant chaque
+    modification (y compris dans un lot), `apres_ecriture` une fois les modifications
+    jusqu'à une génération donnée rendues durables.
+    """
+    def __init__(self):
+        self._verrou = threading.Lock()
+        self._ancetres: Dict[Tuple[str, str], list] = {} # (site, utilisateur) -> [valeur d'origine, génération de la dernière modification, pièces d'origine]
+        self._generation_ecrite = 0
+
+    def noter(self, passwords_data: PasswordData, nom_site: str, nom_utilisateur: str):
+        valeur = passwords_data.get(nom_site, {}).get(nom_utilisateur)
+        generation = getattr(passwords_data, "generation", 0) + 1 # Génération après la modification
+        cle = (nom_site, nom_utilisateur)
+        with self._verrou:
+            suivi = self._ancetres.get(cle)
+            if suivi is None or suivi[1] <= self._generation_ecrite:
+                self._ancetres[cle] = [valeur, generation, recuperer_pieces_entree(passwords_data, nom_site, nom_utilisateur)]
+            else:
+                suivi[1] = generation
+
+    def apres_ecriture(self, generation: int):
+        """Les modifications jusqu'à `generation` sont sur disque : elles ne sont plus locales."""
+        with self._verrou:
+            self._generation_ecrite = max(self._generation_ecrite, generation)
+            self._ancetres = {cle: suivi for cle, suivi in self._ancetres.items() if suivi[1] > self._generation_ecrite}
+
+    def modifications(self) -> Dict[Tuple[str, str], Optional[str]]:
+        """{(site, utilisateur): valeur d'origine} des entrées modifiées et pas encore écrites."""
+        with self._verrou:
+            return {cle: suivi[0] for cle, suivi in self._ancetres.items() if suivi[1] > self._generation_ecrite}
+
+    def pieces_d_origine(self) -> Dict[Tuple[str, str], List[dict]]:
+        """{(site, utilisateur): références des pièces jointes d'origine} des mêmes entrées que `modifications`."""
+        with self._verrou:
+            return {cle: suivi[2] for cle, suivi in self._ancetres.items() if suivi[1] > self._generation_ecrite}
+
+
+def _noter_avant(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str):
+    """Mémorise la valeur d'origine d'une entrée avant de la modifier (voir `SuiviModifications`)."""
+    suivi = getattr(passwords_data, "suivi", None)
+    if suivi is not None:
+        suivi.noter(passwords_data, nom_site, nom_utilisateur)
+
+def _notifier(passwords_data: PasswordData, operation: str, nom_site: str, nom_utilisateur: Optional[str] = None, mot_de_passe: Optional[str] = None):
+    """Prévient les écouteurs si les données sont observables (dict simple : rien à faire)."""
+    if isinstance(passwords_data, DonneesCoffre):
+        passwords_data.notifier(operation, nom_site, nom_utilisateur, mot_de_passe)
+
 
 def initialiser_stockage() -> str:
     """Crée le fichier de sel s'il n'existe pas. Retourne le chemin du fichier de sel."""
@@ -93,63 +925,1134 @@ def initialiser_stockage() -> str:
             raise # Renvoyer l'erreur
     return SALT_FILENAME
 
-def charger_ou_creer_stockage(mot_passe_maitre: str) -> PasswordData:
-    """Charge ou crée le stockage chiffré."""
+def _lire_sel() -> bytes:
+    """Lit le sel depuis le disque (le crée au besoin)."""
     try:
         salt_path = initialiser_stockage() # Assure que le sel existe
-        with open(salt_path, "rb") as f_salt:
-            salt = f_salt.read()
+        with mesurer_phase("lecture_sel"), open(salt_path, "rb") as f_salt:
+            return f_salt.read()
     except (IOError, FileNotFoundError) as e:
         print(f"ERREUR critique: Impossible de lire ou créer le fichier de sel: {e}")
         raise # L'application ne peut pas fonctionner sans sel
 
-    cle = deriver_cle(mot_passe_maitre.encode('utf-8'), salt)
+def _ecrire_atomique(chemin: str, contenu: bytes):
+    """Écrit un fichier via un fichier temporaire + `os.replace` (jamais de fichier à moitié écrit)."""
+    chemin_tmp = chemin + ".tmp"
+    with open(chemin_tmp, "wb") as f:
+        f.write(contenu)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(chemin_tmp, chemin)
+
+# Verrou consultatif entre processus : les écritures (et la fusion qui les précède) se font
+# sous verrou exclusif, les relectures sous verrou partagé. Le verrou est réentrant dans un
+# processus : seul l'appel le plus externe prend le verrou du fichier, les threads du
+# processus s'y succèdent.
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+_verrou_processus = threading.RLock()
+_profondeur_verrou = 0
+_fichier_verrou = None
+
+def _verrouiller_fichier(fichier, exclusif: bool):
+    if fcntl is not None:
+        fcntl.flock(fichier.fileno(), fcntl.LOCK_EX if exclusif else fcntl.LOCK_SH)
+    else:
+        fichier.seek(0)
+        msvcrt.locking(fichier.fileno(), msvcrt.LK_LOCK, 1) # Pas de verrou partagé : toujours exclusif
+
+def _deverrouiller_fichier(fichier):
+    if fcntl is not None:
+        fcntl.flock(fichier.fileno(), fcntl.LOCK_UN)
+    else:
+        fichier.seek(0)
+        msvcrt.locking(fichier.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextlib.contextmanager
+def verrou_fichier(chemin: str, exclusif: bool = True):
+    """Verrou consultatif sur un fichier quelconque (non réentrant), par exemple celui d'une réplique."""
+    with open(chemin, "a+b") as fichier:
+        _verrouiller_fichier(fichier, exclusif)
+        try:
+            yield
+        finally:
+            _deverrouiller_fichier(fichier)
+
+@contextlib.contextmanager
+def verrou_coffre(exclusif: bool = True):
+    """Verrou consultatif du coffre (`LOCK_FILENAME`), bloquant, réentrant dans le processus."""
+    global _profondeur_verrou, _fichier_verrou
+    with _verrou_processus:
+        if _profondeur_verrou == 0:
+            chemin = os.path.abspath(LOCK_FILENAME)
+            if _fichier_verrou is None or _fichier_verrou.name != chemin:
+                if _fichier_verrou is not None:
+                    _fichier_verrou.close()
+                _fichier_verrou = open(chemin, "a+b") # Gardé ouvert : pas de réouverture à chaque écriture
+            with mesurer_phase("verrou"):
+                _verrouiller_fichier(_fichier_verrou, exclusif)
+        _profondeur_verrou += 1
+        try:
+            yield
+        finally:
+            _profondeur_verrou -= 1
+            if _profondeur_verrou == 0:
+                _deverrouiller_fichier(_fichier_verrou)
+
+
+class JournalCoffre:
+    """Journal en ajout seul des modifications, appliqué par-dessus l'instantané.
+
+    Chaque modification devient une ligne : un jeton Fernet (chiffré et authentifié)
+    contenant l'opération et son numéro de séquence. La première ligne (en-tête)
+    lie le journal à l'empreinte SHA-256 de l'instantané : un journal qui ne
+    correspond pas à l'instantané présent sur disque (compaction interrompue) est ignoré.
+
+    Les lignes sont préparées dans le thread qui modifie les données (`ecouter`) puis
+    écrites par `vider`, qui peut tourner dans un thread de travail. Un lot de
+    modifications (`DonneesCoffre.lot`) n'est pas journalisé : il exige un instantané.
+    """
+    def __init__(self, chemin: str, session: "SessionCoffre"):
+        self.chemin = chemin
+        self._session = session
+        self._verrou = threading.Lock()
+        self._en_attente: List[bytes] = []
+        self._base = 0       # Nombre d'enregistrements déjà inclus dans l'instantané
+        self._nb_lignes = 0  # Enregistrements présents dans le fichier
+        self._taille = 0     # Taille du fichier en octets
+        self._generation_attente = 0 # Génération des données après le dernier enregistrement préparé
+        self._generation_ecrite = 0  # ... après le dernier enregistrement écrit dans le fichier
+        self.instantane_requis = False # Vrai après un lot, jusqu'à la prochaine compaction
+        self._generation_lot = 0       # Génération des données après le dernier lot
+        self.propre = True   # Faux si le dernier `rejouer` a trouvé un journal périmé ou une ligne tronquée
+
+    @property
+    def position(self) -> int:
+        """Numéro de séquence du dernier enregistrement produit (en attente compris)."""
+        with self._verrou:
+            return self._base + self._nb_lignes + len(self._en_attente)
+
+    @property
+    def vide(self) -> bool:
+        """Vrai si le journal ne contient aucun enregistrement (en attente compris)."""
+        with self._verrou:
+            return self._nb_lignes == 0 and not self._en_attente
+
+    @property
+    def taille(self) -> int:
+        """Taille du journal, enregistrements en attente compris."""
+        with self._verrou:
+            return self._taille + sum(len(ligne) for ligne in self._en_attente)
+
+    def _entete(self, empreinte_instantane: str, base: int) -> bytes:
+        entete = {"instantane": empreinte_instantane, "base": base}
+        return self._session.chiffrer(json.dumps(entete).encode('utf-8')) + b"\n"
+
+    def rejouer(self, passwords_data: PasswordData, empreinte_instantane: str, lecture_seule: bool = False,
+                contenu: Optional[bytes] = None) -> int:
+        """Applique le journal aux données de l'instantané. Retourne la position atteinte.
+
+        Un journal cohérent est laissé tel quel : le journal retient seulement l'état
+        du fichier, dont la signature reste valable pour les autres processus. Un journal
+        périmé, absent ou à la fin tronquée est réécrit proprement pour cette session,
+        sauf en `lecture_seule` (lecteur concurrent d'un coffre ouvert ailleurs, voir
+        `adopter`). `contenu` : le fichier déjà lu (voir `Prechargement`).
+        """
+        self._base = self._nb_lignes = self._taille = 0
+        self.propre = True
+        if contenu is None and not os.path.exists(self.chemin):
+            if not lecture_seule:
+                self.reinitialiser(empreinte_instantane, 0)
+            return 0
+
+        if contenu is None:
+            with open(self.chemin, "rb") as f_journal:
+                contenu = f_journal.read()
+        lignes = contenu.split(b"\n")
+        # Une dernière ligne sans "\n" est une écriture interrompue : on l'ignore.
+        self.propre = not lignes[-1]
+        lignes = lignes[:-1]
+        if not lignes:
+            self.propre = False
+            if not lecture_seule:
+                self.reinitialiser(empreinte_instantane, 0)
+            return 0
+
+        entete = json.loads(self._session.dechiffrer(lignes[0]).decode('utf-8'))
+        if entete.get("instantane") != empreinte_instantane:
+            print(f"Journal '{self.chemin}' périmé (instantané plus récent), ignoré.")
+            self.propre = False
+            if not lecture_seule:
+                self.reinitialiser(empreinte_instantane, 0)
+            return 0
+
+        base = entete.get("base", 0)
+        for position, ligne in enumerate(lignes[1:], start=1):
+            enregistrement = json.loads(self._session.dechiffrer(ligne).decode('utf-8'))
+            if enregistrement.get("seq") != base + position:
+                raise ValueError(f"Journal '{self.chemin}' corrompu : enregistrements manquants ou réordonnés.")
+            _appliquer_operation(passwords_data, enregistrement["op"], enregistrement["site"],
+                                 enregistrement.get("user"), enregistrement.get("password"),
+                                 scelle=enregistrement.get("scelle", False), date=enregistrement.get("t"),
+                                 pieces=enregistrement.get("p", []))
+
+        if len(lignes) > 1:
+            print(f"Journal rejoué : {len(lignes) - 1} modification(s).")
+        if self.propre or lecture_seule:
+            self._base, self._nb_lignes, self._taille = base, len(lignes) - 1, len(contenu)
+        else:
+            self.reinitialiser(empreinte_instantane, base, lignes[1:]) # Élimine la ligne tronquée
+        return base + len(lignes) - 1
+
+    def reinitialiser(self, empreinte_instantane: str, base: int, lignes_conservees: Optional[List[bytes]] = None):
+        """Réécrit le journal pour l'instantané donné, en conservant éventuellement des lignes."""
+        with self._verrou:
+            self._reecrire(empreinte_instantane, base, lignes_conservees or [])
+
+    def _reecrire(self, empreinte_instantane: str, base: int, lignes_conservees: List[bytes]):
+        contenu = self._entete(empreinte_instantane, base) + b"".join(ligne + b"\n" for ligne in lignes_conservees)
+        _ecrire_atomique(self.chemin, contenu)
+        self._base = base
+        self._nb_lignes = len(lignes_conservees)
+        self._taille = len(contenu)
+
+    def adopter(self, autre: "JournalCoffre"):
+        """Reprend l'état d'un journal relu en `lecture_seule` (écrit par un autre processus).
+
+        Les enregistrements en attente sont abandonnés : l'appelant les a déjà intégrés.
+        """
+        with self._verrou:
+            self._base, self._nb_lignes, self._taille = autre._base, autre._nb_lignes, autre._taille
+            self._en_attente.clear()
+            self.instantane_requis = False
+
+    def repartir(self, empreinte_instantane: str):
+        """Vide le journal sous un nouvel instantané qui inclut tout, en attente compris."""
+        with self._verrou:
+            self._en_attente.clear()
+            self._reecrire(empreinte_instantane, 0, [])
+            self.instantane_requis = False
+
+    def ecouter(self, operation: str, nom_site: str, nom_utilisateur: Optional[str], mot_de_passe: Optional[str]):
+        """Écouteur de `DonneesCoffre` : prépare l'enregistrement chiffré de la modification."""
+        if operation == "lot":
+            self.instantane_requis = True
+            self._generation_lot = self._session.generation
+            return
+        with self._verrou:
+            seq = self._base + self._nb_lignes + len(self._en_attente) + 1
+            enregistrement = {"seq": seq, "op": operation, "site": nom_site, "user": nom_utilisateur, "password": mot_de_passe,
+                              "scelle": getattr(self._session.passwords_data, "scelleur", None) is not None}
+            if operation == "ajout":
+                enregistrement["t"] = int(time.time()) # Date de modification, rétablie au rejeu
+                pieces = self._session.passwords_data.pieces(nom_site, nom_utilisateur)
+                if pieces:
+                    enregistrement["p"] = pieces # Références des pièces jointes après la modification
+            ligne = self._session.chiffrer(json.dumps(enregistrement).encode('utf-8'))
+            self._en_attente.append(ligne + b"\n")
+            self._generation_attente = self._session.generation # Déjà incrémentée par `notifier`
+
+    def vider(self) -> int:
+        """Ajoute les enregistrements en attente à la fin du fichier (écriture O(modification)).
+
+        Retourne la génération des données couverte par le fichier : celle du dernier
+        enregistrement écrit, et non celle des données, qui a pu avancer avant que
+        l'enregistrement correspondant soit préparé.
+        """
+        with self._verrou:
+            if not self._en_attente:
+                return self._generation_ecrite
+            bloc = b"".join(self._en_attente)
+            with mesurer_phase("journal_ajout", octets=len(bloc), enregistrements=len(self._en_attente)), \
+                 open(self.chemin, "ab") as f_journal:
+                f_journal.write(bloc)
+                f_journal.flush()
+                os.fsync(f_journal.fileno())
+            self._nb_lignes += len(self._en_attente)
+            self._taille += len(bloc)
+            self._en_attente.clear()
+            self._generation_ecrite = self._generation_attente
+            return self._generation_ecrite
+
+    def compacter(self, empreinte_instantane: str, position_instantane: int, generation: int):
+        """Rebase le journal sur un nouvel instantané pris à la position `position_instantane`.
+
+        Les enregistrements postérieurs à l'instantané (modifiés pendant son écriture)
+        sont conservés, les autres sont désormais inclus dans l'instantané. Un lot
+        postérieur (`generation` : celle de l'instantané) exige encore un instantané.
+        """
+        with self._verrou:
+            if os.path.exists(self.chemin):
+                with open(self.chemin, "rb") as f_journal:
+                    lignes = [ligne for ligne in f_journal.read().split(b"\n")[1:] if ligne]
+            else:
+                lignes = []
+            lignes += [ligne.rstrip(b"\n") for ligne in self._en_attente]
+            self._en_attente.clear()
+            a_garder = lignes[max(0, position_instantane - self._base):]
+            self._reecrire(empreinte_instantane, position_instantane, a_garder)
+            self._generation_ecrite = self._generation_attente
+            self.instantane_requis = self._generation_lot > generation
+
+
+class SessionCoffre:
+    """Coffre déverrouillé : garde le sel et les chiffreurs pour toute la session.
+
+    La dérivation PBKDF2 n'a lieu qu'une fois, au déverrouillage. Les sauvegardes
+    suivantes ne coûtent que la sérialisation, le chiffrement et l'écriture.
+    En mode journal, chaque modification est simplement ajoutée au journal et
+    l'instantané complet n'est réécrit qu'à la compaction. Les mots de passe sont
+    scellés un par un avec `scelleur`, une sous-clé dédiée de la clé de session.
+
+    Plusieurs processus peuvent ouvrir le même coffre : chaque écriture se fait sous
+    `verrou_coffre` et vérifie d'abord que le disque n'a pas changé depuis la dernière
+    écriture de la session. Sinon, les modifications locales sont fusionnées entrée
+    par entrée avec celles de l'autre processus (voir `synchroniser`).
+    """
+    def __init__(self, passwords_data: PasswordData, salt: bytes, cle: bytes, entete: Optional[dict] = None):
+        self.passwords_data = passwords_data
+        self.salt = salt
+        self.cle = cle
+        self.entete = entete # None : ancien coffre sans en-tête
+        _charger_crypto()
+        self._fernet = Fernet(cle)
+        self._contenu = _chiffreur_contenu(cle)
+        self.scelleur = Fernet(deriver_sous_cle(cle, b"entrees"))
+        self.journal: Optional[JournalCoffre] = None
+        self._taille_instantane = 0
+        self._generation_persistee = 0
+        self._index_recherche: Optional["IndexRecherche"] = None
+        self.suivi = SuiviModifications()
+        self._signature: Optional[Tuple[Tuple[int, int, int], ...]] = None # État du disque après notre dernière écriture
+        self._epoque = 0 # Incrémentée à chaque synchronisation : les instantanés antérieurs sont périmés
+        self.historique = None # Voir historique_password_manager.activer : une version par écriture
+        self.pieces = None # Voir pieces_password_manager.activer : pièces jointes chiffrées à part
+
+    @property
+    def revision(self) -> int:
+        """Révision du coffre sur disque (incrémentée à chaque écriture d'instantané)."""
+        return (self.entete or {}).get("revision", 0)
+
+    def disque_modifie(self) -> bool:
+        """Vrai si un autre processus a écrit le coffre ou son journal depuis notre dernière écriture."""
+        return self._signature is not None and signature_stockage() != self._signature
+
+    def chiffrer(self, donnees: bytes) -> bytes:
+        """Chiffre des données avec la clé de session."""
+        return self._fernet.encrypt(donnees)
+
+    def dechiffrer(self, donnees_chiffrees: bytes) -> bytes:
+        """Déchiffre des données avec la clé de session. Lève ValueError."""
+        try:
+            return self._fernet.decrypt(donnees_chiffrees)
+        except InvalidToken:
+            raise ValueError("Impossible de déchiffrer. Mot de passe maître incorrect ou données corrompues.")
+
+    def chiffrer_fichier(self, donnees: bytes) -> bytes:
+        """Fichier complet du coffre : en-tête puis `donnees` chiffrées (voir MAGIC_FICHIER)."""
+        if self.entete is None:
+            return self.chiffrer(donnees) # Ancien coffre sans en-tête : jeton Fernet seul
+        return _chiffrer_aead(self._contenu, donnees, _prefixe_fichier(self.entete))
+
+    def dechiffrer_fichier(self, prefixe: bytes, corps: bytes) -> bytes:
+        """Déchiffre le contenu d'un fichier découpé par `_decouper_fichier`. Lève ValueError."""
+        if _version_fichier(prefixe) < VERSION_FICHIER:
+            return self.dechiffrer(corps) # Jeton Fernet d'une version précédente
+        return _dechiffrer_aead(self._contenu, corps, prefixe)
+
+    @property
+    def index_recherche(self) -> "IndexRecherche":
+        """Index de recherche des sites, construit au premier usage puis tenu à jour."""
+        if self._index_recherche is None:
+            self._index_recherche = construire_index_recherche(self.passwords_data)
+        return self._index_recherche
+
+    def instantane(self) -> PasswordData:
+        """Copie des données, sûre à sérialiser depuis un autre thread.
+
+        La copie garde la `generation` des données et la position du journal au
+        moment où elle est prise.
+        """
+        if isinstance(self.passwords_data, DonneesCoffre):
+            copie = self.passwords_data.copie()
+        else:
+            copie = DonneesCoffre(self.passwords_data)
+        copie.generation = getattr(self.passwords_data, "generation", 0)
+        copie.position_journal = self.journal.position if self.journal is not None else 0
+        copie.epoque = self._epoque
+        copie.scelleur = getattr(self.passwords_data, "scelleur", None)
+        return copie
+
+    @mesurer_operation("sauvegarde")
+    def sauvegarder(self, passwords_data: Optional[PasswordData] = None, fusionner: bool = True):
+        """Chiffre et sauvegarde le stockage sans refaire la dérivation de clé.
+
+        `passwords_data` permet de sauvegarder un instantané (voir `instantane`)
+        plutôt que les données vivantes, par exemple depuis un thread de travail.
+        En mode journal, c'est une compaction : le journal est rebasé sur le nouvel instantané.
+
+        Si un autre processus a écrit le coffre entre-temps, les données vivantes sont
+        d'abord fusionnées avec les siennes ; un instantané, ou `fusionner=False`, lève
+        ConflitEcriture. Un instantané pris avant une synchronisation est ignoré.
+        """
+        with verrou_coffre():
+            if self.disque_modifie():
+                if passwords_data is not None or not fusionner:
+                    raise ConflitEcriture(f"'{STORAGE_FILENAME}' a été modifié par un autre processus.")
+                self.synchroniser()
+                return
+            if passwords_data is None:
+                passwords_data = self.passwords_data
+            elif getattr(passwords_data, "epoque", self._epoque) != self._epoque:
+                return
+            generation = getattr(passwords_data, "generation", 0)
+            position = getattr(passwords_data, "position_journal", None)
+            if position is None and self.journal is not None:
+                position = self.journal.position # Données vivantes : tout le journal est inclus
+            donnees_chiffrees = _ecrire_stockage(self, passwords_data)
+            self._taille_instantane = len(donnees_chiffrees)
+            if self.journal is not None:
+                self.journal.compacter(_empreinte(donnees_chiffrees), position, generation)
+            self._apres_ecriture(generation, passwords_data)
+
+    @mesurer_operation("fusion")
+    def synchroniser(self) -> List[Tuple[str, str, str]]:
+        """Intègre les écritures d'un autre processus aux données vivantes.
+
+        Sans modification locale, les données sont simplement remplacées par celles
+        du disque. Sinon, fusion à trois voies (`fusionner_modifications`) puis écriture
+        d'un instantané fusionné. Les écouteurs reçoivent une notification "lot".
+        À appeler depuis le thread propriétaire des données. Retourne les conflits
+        (site, utilisateur, nom donné à la version de l'autre processus).
+        """
+        with verrou_coffre():
+            if not self.disque_modifie():
+                return []
+            entete, distantes, journal_lu, donnees_chiffrees = _relire(self)
+            if entete is not None:
+                self.entete = entete # Révision et enveloppe de clé à jour
+                self.salt = base64.b64decode(entete["sel"])
+            self._epoque += 1
+            conflits = []
+            if not self.est_modifie and (self.journal is None or journal_lu.propre):
+                self.passwords_data.remplacer_par(distantes)
+                self.passwords_data.notifier("lot", "")
+                self._taille_instantane = len(donnees_chiffrees)
+                if self.journal is not None:
+                    self.journal.adopter(journal_lu)
+                print(f"Coffre relu (révision {self.revision}) : modifications d'un autre processus intégrées.")
+            else:
+                conflits = fusionner_modifications(self.passwords_data, self.suivi.modifications(), distantes,
+                                                   self.suivi.pieces_d_origine())
+                donnees_chiffrees = _ecrire_stockage(self, self.passwords_data)
+                self._taille_instantane = len(donnees_chiffrees)
+                if self.journal is not None:
+                    self.journal.repartir(_empreinte(donnees_chiffrees))
+                print(f"Modifications fusionnées avec celles d'un autre processus (révision {self.revision}, {len(conflits)} conflit(s)).")
+            self._apres_ecriture(self.generation)
+            return conflits
+
+    def _apres_ecriture(self, generation: int, passwords_data: Optional[PasswordData] = None):
+        """Les données jusqu'à `generation` sont sur disque et le disque est à nous.
+
+        Avec un historique, l'état écrit (`passwords_data`, par défaut les données
+        vivantes) devient une version ; un échec de l'historique n'annule pas l'écriture.
+        """
+        if self.historique is not None:
+            try:
+                self.historique.enregistrer(self.passwords_data if passwords_data is None else passwords_data)
+            except Exception as e: # Y compris une erreur imprévue : la signature doit suivre l'écriture
+                print(f"AVERTISSEMENT: Version non enregistrée dans l'historique : {e}")
+        self._signature = signature_stockage()
+        self.suivi.apres_ecriture(generation)
+        self._marquer_persiste(generation)
+
+    @property
+    def generation(self) -> int:
+        """Compteur de modifications des données depuis le déverrouillage."""
+        return getattr(self.passwords_data, "generation", 0)
+
+    @property
+    def est_modifie(self) -> bool:
+        """Vrai si des modifications n'ont pas encore été rendues durables."""
+        return self.generation != self._generation_persistee
+
+    def _marquer_persiste(self, generation: int):
+        self._generation_persistee = max(self._generation_persistee, generation)
+
+    def doit_compacter(self) -> bool:
+        """Vrai si le journal a dépassé son seuil de taille ou de ratio par rapport à l'instantané."""
+        if self.journal is None:
+            return False
+        if self.journal.instantane_requis:
+            return True
+        seuil = max(JOURNAL_TAILLE_MIN, int(JOURNAL_RATIO_MAX * self._taille_instantane))
+        return self.journal.taille >= min(seuil, JOURNAL_TAILLE_MAX)
+
+    @mesurer_operation("persistance")
+    def persister(self, instantane: Optional[PasswordData] = None, fusionner: bool = True,
+                  copie: Optional[PasswordData] = None) -> bool:
+        """Rend les modifications durables. Retourne False si rien n'était à écrire.
+
+        Sans journal, ou si un instantané est fourni, réécrit tout le coffre ;
+        sinon, ajoute seulement les enregistrements en attente au journal.
+        Un coffre sans modification n'est pas réécrit (sauf compaction demandée).
+        Les écritures concurrentes sont traitées comme dans `sauvegarder`.
+
+        Depuis un autre thread que celui des données, passer en `copie` un `instantane`
+        pris par ce dernier : l'historique est construit depuis elle, et c'est elle qui
+        est écrite si une réécriture complète s'impose (lot, disque modifié), jamais
+        les données vivantes.
+        """
+        if instantane is None and not self.est_modifie:
+            return False
+        with verrou_coffre():
+            if self.journal is None or instantane is not None or self.journal.instantane_requis or self.disque_modifie():
+                self.sauvegarder(instantane if instantane is not None else copie, fusionner)
+            else:
+                self._apres_ecriture(self.journal.vider(), copie)
+        return True
+
+
+# Fichier du coffre :
+#   MAGIC_FICHIER | version (1 octet) | taille de l'en-tête (u32) | en-tête JSON | contenu chiffré
+# L'en-tête donne les paramètres KDF, le sel, et la clé de données enveloppée par la clé
+# dérivée du mot de passe maître : changer les paramètres KDF ne réécrit que l'en-tête.
+# Version 2 : contenu chiffré binaire (nonce, AES-256-GCM, étiquette), tout ce qui le précède
+# étant authentifié comme données associées. Version 1 : jeton Fernet (base64), encore lu ;
+# le coffre est réécrit en version 2 au déverrouillage.
+# Un fichier sans MAGIC_FICHIER est un ancien coffre (jeton seul, sel dans SALT_FILENAME).
+MAGIC_FICHIER = b"BIGKEY"
+VERSION_FICHIER = 2
+
+def _version_fichier(prefixe: bytes) -> int:
+    """Version du fichier dont `prefixe` est l'en-tête (0 : ancien coffre sans en-tête)."""
+    return prefixe[len(MAGIC_FICHIER)] if prefixe else 0
+
+def _decouper_fichier(contenu: bytes) -> Tuple[Optional[dict], bytes, bytes]:
+    """Sépare l'en-tête (None pour un ancien coffre), les octets qui le portent et le contenu chiffré."""
+    if not contenu.startswith(MAGIC_FICHIER):
+        return None, b"", contenu
+    position = len(MAGIC_FICHIER)
+    version = contenu[position]
+    if not 1 <= version <= VERSION_FICHIER:
+        raise ValueError(f"Version de fichier non prise en charge : {version}")
+    (taille,) = struct.unpack_from("<I", contenu, position + 1)
+    debut = position + 5
+    return json.loads(contenu[debut:debut + taille].decode('utf-8')), contenu[:debut + taille], contenu[debut + taille:]
+
+def _prefixe_fichier(entete: dict) -> bytes:
+    entete_json = json.dumps(entete, separators=(",", ":")).encode('utf-8')
+    return MAGIC_FICHIER + bytes((VERSION_FICHIER,)) + struct.pack("<I", len(entete_json)) + entete_json
+
+def _nouvel_entete(mot_passe_maitre: str, cle_donnees: bytes, parametres: dict) -> dict:
+    """En-tête avec un sel neuf et la clé de données enveloppée sous les paramètres donnés."""
+    salt = os.urandom(16)
+    cle_enveloppe = deriver_cle_kdf(mot_passe_maitre.encode('utf-8'), salt, parametres)
+    return {
+        "kdf": parametres,
+        "sel": base64.b64encode(salt).decode('ascii'),
+        "cle": Fernet(cle_enveloppe).encrypt(cle_donnees).decode('ascii'),
+    }
+
+def _ouvrir_cle(mot_passe_maitre: str, entete: Optional[dict], sel: Optional[bytes] = None) -> Tuple[bytes, bytes, float]:
+    """Retrouve la clé de données. Retourne (clé, sel, durée de la dérivation en secondes).
+
+    `sel` : contenu du fichier de sel déjà lu, pour un ancien coffre sans en-tête.
+    """
+    debut = time.perf_counter()
+    if entete is None:
+        salt = sel if sel is not None else _lire_sel()
+        cle = deriver_cle(mot_passe_maitre.encode('utf-8'), salt) # Ancien coffre : la clé dérivée chiffre directement
+        return cle, salt, time.perf_counter() - debut
+    salt = base64.b64decode(entete["sel"])
+    cle_enveloppe = deriver_cle_kdf(mot_passe_maitre.encode('utf-8'), salt, entete["kdf"])
+    duree = time.perf_counter() - debut
+    try:
+        with mesurer_phase("deballage_cle"):
+            return Fernet(cle_enveloppe).decrypt(entete["cle"].encode('ascii')), salt, duree
+    except InvalidToken:
+        raise ValueError("Impossible de déchiffrer. Mot de passe maître incorrect ou données corrompues.")
+
+def ameliorer_kdf(session: "SessionCoffre", mot_passe_maitre: str, parametres: Optional[dict] = None) -> bool:
+    """Réenveloppe la clé de données avec des paramètres KDF calibrés (ou donnés).
+
+    Ne baisse jamais le coût pour un même algorithme. La clé de données ne change pas :
+    seul l'en-tête est réécrit (avec le contenu, en une sauvegarde). Retourne True si
+    le coffre a été mis à niveau.
+    """
+    parametres = parametres or calibrer_kdf()
+    actuels = session.entete["kdf"] if session.entete else None
+    if actuels and actuels.get("algo") == parametres.get("algo") and cout_kdf(parametres) <= cout_kdf(actuels):
+        return False
+    print(f"Mise à niveau de la dérivation de clé : {parametres}")
+    session.entete = _nouvel_entete(mot_passe_maitre, session.cle, parametres)
+    session.salt = base64.b64decode(session.entete["sel"])
+    session.sauvegarder()
+    return True
+
+# Rotation de la clé de données : chaque entrée est rescellée avec la sous-clé de la nouvelle
+# clé. Les entrées étant indépendantes, le travail est découpé en lots répartis sur un pool
+# de processus ; chaque lot terminé est ajouté, chiffré, à ROTATION_FILENAME, ce qui permet
+# de reprendre une rotation interrompue sans refaire les lots déjà écrits.
+ROTATION_FILENAME = "passwords.rotation"
+ROTATION_LOT = 2000              # Entrées par lot (environ)
+ROTATION_PARALLELE_MIN = 20000   # En dessous, démarrer des processus coûte plus que le gain
+
+_rescellement = None # (ancien, nouveau) scelleurs Fernet, dans le processus qui rescelle
+
+def _initialiser_rescellement(ancienne_cle_entrees: bytes, nouvelle_cle_entrees: bytes):
+    global _rescellement
+    _charger_crypto()
+    _rescellement = (Fernet(ancienne_cle_entrees), Fernet(nouvelle_cle_entrees))
+
+def _resceller_lot(indice: int, entrees: List[list]) -> Tuple[int, List[list]]:
+    ancien, nouveau = _rescellement
+    return indice, [[site, utilisateur, nouveau.encrypt(ancien.decrypt(valeur.encode('ascii'))).decode('ascii')]
+                    for site, utilisateur, valeur in entrees]
+
+def _lots_rotation(passwords_data: PasswordData) -> List[List[list]]:
+    """Découpe les entrées en lots, dans un ordre stable (sites triés) pour pouvoir reprendre."""
+    lots, lot = [], []
+    for site in lister_sites(passwords_data):
+        lot.extend([site, utilisateur, valeur] for utilisateur, valeur in passwords_data[site].items())
+        if len(lot) >= ROTATION_LOT:
+            lots.append(lot)
+            lot = []
+    if lot:
+        lots.append(lot)
+    return lots
+
+def _resceller(ancienne_cle: bytes, nouvelle_cle: bytes, a_faire: List[Tuple[int, List[list]]], processus: Optional[int]) -> Iterator[Tuple[int, List[list]]]:
+    """Rescelle les lots, dans ce processus ou sur un pool ; produit les lots dans l'ordre d'achèvement."""
+    cles = (deriver_sous_cle(ancienne_cle, b"entrees"), deriver_sous_cle(nouvelle_cle, b"entrees"))
+    if processus is None:
+        processus = min(os.cpu_count() or 1, 8)
+    if processus <= 1 or sum(len(lot) for _indice, lot in a_faire) < ROTATION_PARALLELE_MIN:
+        global _rescellement
+        _initialiser_rescellement(*cles)
+        try:
+            for indice, lot in a_faire:
+                yield _resceller_lot(indice, lot)
+        finally:
+            _rescellement = None
+        return
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    with ProcessPoolExecutor(processus, initializer=_initialiser_rescellement, initargs=cles) as pool:
+        futures = [pool.submit(_resceller_lot, indice, lot) for indice, lot in a_faire]
+        try:
+            for future in as_completed(futures):
+                yield future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+def _reprendre_rotation(session: "SessionCoffre", source: str) -> Tuple[Optional[bytes], set]:
+    """(nouvelle clé, indices des lots déjà rescellés) d'une rotation interrompue du même instantané."""
+    if not os.path.exists(ROTATION_FILENAME):
+        return None, set()
+    with open(ROTATION_FILENAME, "rb") as f_rotation:
+        contenu = f_rotation.read()
+    fin = contenu.rfind(b"\n") + 1
+    if fin < len(contenu):
+        os.truncate(ROTATION_FILENAME, fin) # Lot interrompu en cours d'écriture : la suite s'ajoutera après
+    lignes = contenu[:fin].split(b"\n")[:-1]
+    try:
+        entete = json.loads(session.dechiffrer(lignes[0]).decode('utf-8'))
+    except (IndexError, ValueError):
+        entete = {}
+    if entete.get("source") != source:
+        print(f"Rotation interrompue '{ROTATION_FILENAME}' périmée (coffre modifié depuis) : recommencée.")
+        return None, set()
+    nouvelle_cle = entete["cle"].encode('ascii')
+    chiffreur = Fernet(nouvelle_cle)
+    faits = {json.loads(chiffreur.decrypt(ligne).decode('utf-8'))["lot"] for ligne in lignes[1:]}
+    return nouvelle_cle, faits
+
+def _pivoter_cle(session: "SessionCoffre", nouveau_mot_passe: str, parametres: dict, processus: Optional[int]):
+    """Remplace la clé de données : rescelle toutes les entrées, puis bascule les fichiers."""
+    if session.est_modifie or (session.journal is not None and not session.journal.vide):
+        session.sauvegarder() # Tout dans l'instantané : c'est lui que la rotation reprend
+    with open(STORAGE_FILENAME, "rb") as f_storage:
+        source = _empreinte(f_storage.read())
+    if session.pieces is not None:
+        session.pieces.ouvrir() # Clé des pièces lue tant que l'ancienne clé de données est en place
+    nouvelle_cle, faits = _reprendre_rotation(session, source)
+    if nouvelle_cle is None:
+        nouvelle_cle = Fernet.generate_key()
+        entete = {"source": source, "cle": nouvelle_cle.decode('ascii')} # Clé protégée par l'ancienne clé
+        _ecrire_atomique(ROTATION_FILENAME, session.chiffrer(json.dumps(entete).encode('utf-8')) + b"\n")
+    lots = _lots_rotation(session.passwords_data)
+    a_faire = [(indice, lot) for indice, lot in enumerate(lots) if indice not in faits]
+    print(f"Rotation de la clé : {len(lots)} lot(s), dont {len(lots) - len(a_faire)} déjà faits.")
+    chiffreur = Fernet(nouvelle_cle)
+    with mesurer_phase("rescellement", entrees=sum(len(lot) for _indice, lot in a_faire)), \
+         open(ROTATION_FILENAME, "ab") as f_rotation:
+        for indice, entrees in _resceller(session.cle, nouvelle_cle, a_faire, processus):
+            f_rotation.write(chiffreur.encrypt(json.dumps({"lot": indice, "entrees": entrees}).encode('utf-8')) + b"\n")
+            f_rotation.flush()
+            os.fsync(f_rotation.fileno())
+    del lots, a_faire
+    # Clés de l'historique et des pièces enveloppées d'avance par la nouvelle clé : une
+    # interruption après la bascule ne les laisse pas sous une clé disparue.
+    for magasin in (session.historique, session.pieces):
+        if magasin is not None:
+            magasin.preparer_rotation(nouvelle_cle)
+
+    # Bascule : les données vivantes passent à la nouvelle clé, lot par lot, depuis le fichier
+    # de rotation ; puis l'instantané est remplacé atomiquement.
+    revision = session.revision
+    session.entete = _nouvel_entete(nouveau_mot_passe, nouvelle_cle, parametres) # Seule dérivation de la rotation
+    session.entete["revision"] = revision
+    session.salt = base64.b64decode(session.entete["sel"])
+    session.cle = nouvelle_cle
+    session._fernet = chiffreur
+    session._contenu = _chiffreur_contenu(nouvelle_cle)
+    session.scelleur = Fernet(deriver_sous_cle(nouvelle_cle, b"entrees"))
+    donnees = session.passwords_data
+    with open(ROTATION_FILENAME, "rb") as f_rotation:
+        next(f_rotation)
+        for ligne in f_rotation:
+            for site, utilisateur, valeur in json.loads(chiffreur.decrypt(ligne.rstrip(b"\n")).decode('utf-8'))["entrees"]:
+                donnees.resceller(site, utilisateur, valeur)
+    donnees.scelleur = session.scelleur
+    donnees.notifier("lot", "")
+    if os.path.exists(JOURNAL_FILENAME):
+        os.remove(JOURNAL_FILENAME) # Vide, mais chiffré avec l'ancienne clé
+    donnees_chiffrees = _ecrire_stockage(session, donnees)
+    session._taille_instantane = len(donnees_chiffrees)
+    if session.journal is not None:
+        session.journal.repartir(_empreinte(donnees_chiffrees))
+    if session.historique is not None:
+        session.historique.renvelopper() # Même historique ; l'enveloppe de l'ancienne clé est retirée
+    if session.pieces is not None:
+        session.pieces.renvelopper() # Pièces jamais rechiffrées : seule leur clé est réenveloppée
+    os.remove(ROTATION_FILENAME)
+    session._apres_ecriture(session.generation)
+
+@mesurer_operation("changement_mot_passe")
+def changer_mot_passe_maitre(session: "SessionCoffre", ancien_mot_passe: str, nouveau_mot_passe: str,
+                             pivoter_cle: bool = False, parametres: Optional[dict] = None, processus: Optional[int] = None):
+    """Change le mot de passe maître (nouveau sel, une seule dérivation).
+
+    Sans `pivoter_cle`, la clé de données est seulement réenveloppée dans l'en-tête.
+    Avec `pivoter_cle`, une nouvelle clé de données est tirée et toutes les entrées
+    sont rescellées (sur `processus` processus, par défaut un par cœur) : une rotation
+    interrompue reprend là où elle s'était arrêtée au prochain appel. Les autres
+    sessions ouvertes et les répliques restent liées à l'ancienne clé. Lève ValueError
+    si `ancien_mot_passe` est incorrect.
+    """
+    with verrou_coffre():
+        if session.disque_modifie():
+            session.synchroniser()
+        if session.entete is not None:
+            cle, _salt, _duree = _ouvrir_cle(ancien_mot_passe, session.entete)
+        else:
+            cle = deriver_cle(ancien_mot_passe.encode('utf-8'), session.salt)
+        if cle != session.cle:
+            raise ValueError("Mot de passe maître actuel incorrect.")
+        parametres = parametres or (session.entete["kdf"] if session.entete else calibrer_kdf())
+        if pivoter_cle:
+            _pivoter_cle(session, nouveau_mot_passe, parametres, processus)
+        else:
+            revision = session.revision
+            session.entete = _nouvel_entete(nouveau_mot_passe, session.cle, parametres)
+            session.entete["revision"] = revision
+            session.salt = base64.b64decode(session.entete["sel"])
+            session.sauvegarder()
+        print("Mot de passe maître changé." + (" Nouvelle clé de données." if pivoter_cle else ""))
 
-    if not os.path.exists(STORAGE_FILENAME):
+def _empreinte(donnees_chiffrees: bytes) -> str:
+    """Empreinte d'un instantané chiffré, utilisée pour y lier le journal."""
+    return hashlib.sha256(donnees_chiffrees).hexdigest()
+
+@mesurer_operation("deverrouillage")
+def charger_ou_creer_stockage(mot_passe_maitre: str, journal: bool = True, prechargement: Optional["Prechargement"] = None) -> SessionCoffre:
+    """Charge ou crée le stockage chiffré et retourne la session déverrouillée.
+
+    Avec `journal=True`, le journal des modifications est rejoué sur l'instantané
+    et les modifications suivantes y seront ajoutées. Un coffre sans en-tête KDF,
+    ou dont la dérivation est devenue trop rapide pour cette machine, est mis à
+    niveau de façon transparente (voir `ameliorer_kdf`), de même qu'un coffre au
+    conteneur Fernet (version 1 de MAGIC_FICHIER). Le chargement se fait
+    sous `verrou_coffre` : il peut réécrire le journal ou migrer le coffre.
+
+    Avec `journal=False`, le chargement est en lecture seule, sous verrou partagé :
+    le journal est rejoué sans être réécrit ni suivi, sans migration ni mise à niveau.
+    Pour un lecteur (l'agent, les commandes de consultation) qui ne persiste rien.
+
+    Avec un `prechargement` (voir `precharger_stockage`) encore à jour, les fichiers
+    ne sont pas relus.
+    """
+    with verrou_coffre(exclusif=journal or not os.path.exists(STORAGE_FILENAME)):
+        if prechargement is not None and prechargement.signature != signature_stockage():
+            print("Coffre modifié depuis le préchargement : relecture.")
+            prechargement = None
+        session = _charger_ou_creer_stockage(mot_passe_maitre, journal, prechargement)
+        session.passwords_data.suivi = session.suivi
+        session._signature = signature_stockage()
+    return session
+
+def _charger_ou_creer_stockage(mot_passe_maitre: str, journal: bool, prechargement: Optional["Prechargement"] = None) -> SessionCoffre:
+    _charger_crypto()
+    migration = False
+    mise_a_niveau_kdf = False
+    ancien_conteneur = False
+
+    if (prechargement.coffre is None) if prechargement is not None else not os.path.exists(STORAGE_FILENAME):
         print(f"'{STORAGE_FILENAME}' non trouvé. Création d'un nouveau stockage.")
+        cle = Fernet.generate_key()
+        entete = _nouvel_entete(mot_passe_maitre, cle, calibrer_kdf())
+        session = SessionCoffre(DonneesCoffre(), base64.b64decode(entete["sel"]), cle, entete)
+        session.passwords_data.scelleur = session.scelleur
         try:
             # Crée un fichier vide chiffré
-            donnees_vides_chiffrees = chiffrer_donnees(cle, json.dumps({}).encode('utf-8'))
-            with open(STORAGE_FILENAME, "wb") as f_storage:
-                f_storage.write(donnees_vides_chiffrees)
-            return {}
+            donnees_chiffrees = session.chiffrer_fichier(_serialiser(session.passwords_data))
+            _ecrire_atomique(STORAGE_FILENAME, donnees_chiffrees)
         except IOError as e:
              print(f"ERREUR: Impossible de créer le fichier de stockage initial: {e}")
              raise
     else:
         print(f"Chargement de '{STORAGE_FILENAME}'...")
         try:
-            with open(STORAGE_FILENAME, "rb") as f_storage:
-                donnees_chiffrees = f_storage.read()
-            
-            donnees_json = dechiffrer_donnees(cle, donnees_chiffrees)
-            passwords_data: PasswordData = json.loads(donnees_json.decode('utf-8'))
+            if prechargement is not None:
+                donnees_chiffrees = prechargement.coffre
+            else:
+                with mesurer_phase("lecture") as phase, open(STORAGE_FILENAME, "rb") as f_storage:
+                    donnees_chiffrees = f_storage.read()
+                    phase["octets"] = len(donnees_chiffrees)
+            entete, prefixe, corps = _decouper_fichier(donnees_chiffrees)
+            cle, salt, duree_kdf = _ouvrir_cle(mot_passe_maitre, entete, prechargement.sel if prechargement is not None else None)
+            session = SessionCoffre(DonneesCoffre(), salt, cle, entete)
+            mise_a_niveau_kdf = entete is None or duree_kdf < KDF_MARGE_AMELIORATION * KDF_CIBLE_MS / 1000
+
+            ancien_conteneur = 0 < _version_fichier(prefixe) < VERSION_FICHIER
+            with mesurer_phase("dechiffrement", octets=len(corps)):
+                donnees_json = session.dechiffrer_fichier(prefixe, corps)
+            with mesurer_phase("deserialisation", octets=len(donnees_json)):
+                session.passwords_data = _deserialiser(donnees_json, session.scelleur)
+            migration = session.passwords_data.scelleur is None
             print("Stockage déchiffré avec succès.")
-            return passwords_data
-        except ValueError as e: # Capturé de dechiffrer_donnees
+        except ValueError as e: # Capturé de dechiffrer
             print(f"Erreur lors du chargement : {e}")
             raise
         except (IOError, json.JSONDecodeError) as e:
             print(f"ERREUR: Impossible de lire ou décoder le fichier de stockage: {e}")
             raise # Erreur critique
 
-def sauvegarder_stockage(passwords_data: PasswordData, mot_passe_maitre: str):
-    """Chiffre et sauvegarde le dictionnaire des mots de passe."""
+    session._taille_instantane = len(donnees_chiffrees)
     try:
-        with open(SALT_FILENAME, "rb") as f_salt:
-            salt = f_salt.read()
-    except (IOError, FileNotFoundError) as e:
-         print(f"ERREUR critique: Fichier de sel '{SALT_FILENAME}' introuvable lors de la sauvegarde: {e}")
-         raise
+        journal_lu = JournalCoffre(JOURNAL_FILENAME, session)
+        with mesurer_phase("journal_rejeu"):
+            session.passwords_data.generation = journal_lu.rejouer(
+                session.passwords_data, _empreinte(donnees_chiffrees), lecture_seule=not journal,
+                contenu=prechargement.journal if prechargement is not None else None)
+    except (IOError, json.JSONDecodeError, ValueError) as e:
+        print(f"ERREUR: Impossible de rejouer le journal '{JOURNAL_FILENAME}': {e}")
+        raise
+    if journal:
+        session.journal = journal_lu
+    else:
+        # Lecture seule : rien n'est écrit, les migrations attendent la prochaine session en écriture.
+        if migration:
+            session.passwords_data = _sceller_donnees(session.passwords_data, session.scelleur)
+        migration = mise_a_niveau_kdf = ancien_conteneur = False
+    if migration:
+        print(f"Migration de '{STORAGE_FILENAME}' au format {FORMAT_STOCKAGE} (mots de passe scellés)...")
+        session.passwords_data = _sceller_donnees(session.passwords_data, session.scelleur)
+        session.sauvegarder()
+        ancien_conteneur = False
+    if mise_a_niveau_kdf and ameliorer_kdf(session, mot_passe_maitre):
+        ancien_conteneur = False
+    if ancien_conteneur:
+        print(f"Migration de '{STORAGE_FILENAME}' vers le conteneur binaire (AES-256-GCM)...")
+        session.sauvegarder()
+    if session.journal is not None:
+        session.passwords_data.ecouteurs.append(session.journal.ecouter)
+    session._marquer_persiste(session.generation) # Tout ce qui est chargé est déjà sur disque
+    return session
+
+def signature_stockage() -> Tuple[Tuple[int, int, int], ...]:
+    """(inode, date de modification, taille) du coffre et de son journal : change à chaque écriture."""
+    signature = []
+    for chemin in (STORAGE_FILENAME, JOURNAL_FILENAME):
+        try:
+            etat = os.stat(chemin)
+            signature.append((etat.st_ino, etat.st_mtime_ns, etat.st_size)) # L'inode change à chaque `os.replace`
+        except FileNotFoundError:
+            signature.append((0, 0, 0))
+    return tuple(signature)
+
+class Prechargement:
+    """Fichiers du coffre lus d'avance, par exemple pendant la saisie du mot de passe maître.
+
+    `signature` est prise avant la lecture : si le disque change ensuite, elle ne
+    correspond plus et `charger_ou_creer_stockage` relit les fichiers.
+    """
+    def __init__(self):
+        self.signature = signature_stockage()
+        self.coffre = self._lire(STORAGE_FILENAME)   # None : pas encore de coffre
+        self.journal = self._lire(JOURNAL_FILENAME)
+        self.sel = self._lire(SALT_FILENAME)         # Ancien coffre sans en-tête seulement
+
+    @staticmethod
+    def _lire(chemin: str) -> Optional[bytes]:
+        try:
+            with open(chemin, "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+@mesurer_operation("prechargement")
+def precharger_stockage() -> Prechargement:
+    """Lit le coffre, son journal et le sel sans les déchiffrer (aucun mot de passe requis)."""
+    with verrou_coffre(exclusif=False), mesurer_phase("lecture") as phase:
+        prechargement = Prechargement()
+        phase["octets"] = len(prechargement.coffre or b"") + len(prechargement.journal or b"")
+    return prechargement
+
+def _relire(session: SessionCoffre) -> Tuple[Optional[dict], DonneesCoffre, JournalCoffre, bytes]:
+    """Relit le disque sous verrou partagé. Retourne (en-tête, données, journal relu, instantané chiffré)."""
+    with verrou_coffre(exclusif=False):
+        with open(STORAGE_FILENAME, "rb") as f_storage:
+            donnees_chiffrees = f_storage.read()
+        entete, prefixe, corps = _decouper_fichier(donnees_chiffrees)
+        passwords_data = _deserialiser(session.dechiffrer_fichier(prefixe, corps), session.scelleur)
+        if passwords_data.scelleur is None:
+            passwords_data = _sceller_donnees(passwords_data, session.scelleur)
+        journal = JournalCoffre(JOURNAL_FILENAME, session)
+        passwords_data.generation = journal.rejouer(passwords_data, _empreinte(donnees_chiffrees), lecture_seule=True)
+    return entete, passwords_data, journal, donnees_chiffrees
+
+@mesurer_operation("relecture")
+def relire_stockage(session: SessionCoffre) -> DonneesCoffre:
+    """Relit le coffre et son journal avec la clé de `session`, sans rien écrire.
+
+    Pour un lecteur concurrent (l'agent de déverrouillage) pendant qu'une autre
+    session modifie le coffre. Lève ValueError si la clé n'ouvre plus le fichier.
+    """
+    return _relire(session)[1]
+
+def fusionner_modifications(locales: DonneesCoffre, ancetres: Dict[Tuple[str, str], Optional[str]], distantes: PasswordData,
+                            pieces_ancetres: Optional[Dict[Tuple[str, str], List[dict]]] = None) -> List[Tuple[str, str, str]]:
+    """Fusion à trois voies, entrée par entrée, appliquée sur place à `locales`.
 
+    `ancetres` donne, pour chaque entrée modifiée localement, sa valeur avant
+    modification (None : absente) ; `distantes` est l'état actuel du disque (consommé).
+    Les entrées non modifiées localement prennent la valeur du disque. Une entrée
+    modifiée des deux côtés garde la valeur locale, et la valeur distante est conservée
+    sous un nouveau nom d'utilisateur (voir `_nom_libre`) ; une modification l'emporte
+    sur une suppression. Les pièces jointes d'une entrée conservée sont fusionnées de
+    la même façon d'après `pieces_ancetres` (références d'origine) : les pièces locales
+    l'emportent si elles ont changé, sinon celles du disque sont gardées. Retourne les
+    conflits (site, utilisateur, nom de la copie).
+    """
+    pieces_ancetres = pieces_ancetres or {}
+    def fusionner_pieces(site: str, utilisateur: str):
+        pieces = locales.pieces(site, utilisateur)
+        if pieces_ancetres.get((site, utilisateur), pieces) != pieces: # Sans ancêtre connu : celles du disque
+            distantes.definir_pieces(site, utilisateur, pieces)
+
+    def identiques(a: Optional[str], b: Optional[str]) -> bool:
+        if a is None or b is None:
+            return a is b
+        return a == b or locales.ouvrir(a) == locales.ouvrir(b) # Jetons scellés différents pour un même mot de passe
+
+    conflits = []
+    for (site, utilisateur), ancetre in ancetres.items():
+        locale = locales.get(site, {}).get(utilisateur)
+        distante = distantes.get(site, {}).get(utilisateur)
+        if identiques(locale, distante) or identiques(ancetre, locale):
+            if locale is not None and distante is not None:
+                fusionner_pieces(site, utilisateur) # Seules les pièces ont pu changer
+            continue # Même changement des deux côtés, ou aucun changement local au final
+        if not identiques(ancetre, distante): # Modifiée des deux côtés
+            if locale is None:
+                continue
+            if distante is not None:
+                nom_copie = _nom_libre(distantes, site, utilisateur)
+                distantes[site][nom_copie] = distante
+                distantes.definir_pieces(site, nom_copie, distantes.pieces(site, utilisateur))
+                conflits.append((site, utilisateur, nom_copie))
+        if locale is None:
+            del distantes[site][utilisateur]
+            if not distantes[site]:
+                del distantes[site]
+        else:
+            distantes.ecrire(site, utilisateur, locale, *reversed(locales.dates(site, utilisateur))) # Garde les dates locales
+            if distante is not None:
+                fusionner_pieces(site, utilisateur)
+            else:
+                distantes.definir_pieces(site, utilisateur, locales.pieces(site, utilisateur))
+
+    locales.remplacer_par(distantes)
+    locales.notifier("lot", "")
+    return conflits
+
+# Codec binaire du contenu (avant chiffrement) :
+#   MAGIC_CONTENU | version (1 octet) | compression (1 octet) | corps (éventuellement compressé)
+#   corps = <nb_sites:u32><taille_extras:u32> extras (JSON compact)
+#           nb_utilisateurs par site (u32 LE) | chaînes UTF-8 séparées par NUL :
+#           tous les sites, puis pour chaque site ses couples utilisateur, mot de passe.
+# Les anciens contenus JSON (commençant par "{") restent lisibles.
+MAGIC_CONTENU = b"BKC"
+VERSION_CODEC = 2 # 1 : sans dates ; 2 : dates de création et de modification de chaque entrée
+COMPRESSIONS = {"aucune": 0, "zlib": 1, "lzma": 2}
+COMPRESSION_STOCKAGE = "aucune" # "zlib" divise presque par deux la taille sur disque, au prix de la sauvegarde
+
+def _compresser(corps: bytes, compression: str) -> bytes:
+    if compression == "zlib":
+        return zlib.compress(corps, 1) # Niveau rapide : l'essentiel du gain vient des répétitions
+    if compression == "lzma":
+        import lzma
+        return lzma.compress(corps, preset=1)
+    return corps
+
+def _decompresser(corps: bytes, code: int) -> bytes:
+    if code == COMPRESSIONS["zlib"]:
+        return zlib.decompress(corps)
+    if code == COMPRESSIONS["lzma"]:
+        import lzma
+        return lzma.decompress(corps)
+    if code == COMPRESSIONS["aucune"]:
+        return corps
+    raise ValueError(f"Compression inconnue dans le stockage : {code}")
+
+def encoder_contenu(sites: PasswordData, extras: Optional[dict] = None, compression: str = COMPRESSION_STOCKAGE) -> bytes:
+    """Encode {site: {user: valeur}} (+ métadonnées `extras`) au format binaire compact.
+
+    Colonnes : entrées par site, numéro du nom d'utilisateur dans la table des noms
+    distincts, dates de création et de modification (celles de `DonneesCoffre` ; 0,
+    inconnues, pour un dict), puis le texte : sites, noms distincts et valeurs. Les
+    références des pièces jointes vont dans les extras (`"pieces"`).
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Compression inconnue : {compression}")
+    if isinstance(sites, DonneesCoffre):
+        noms_sites, comptes, utilisateurs, valeurs, crees, modifies = sites.colonnes()
+        pieces = [list(entree) for entree in sites.toutes_pieces()]
+        if pieces:
+            extras = dict(extras or {}, pieces=pieces)
+    else:
+        noms_sites = list(sites)
+        comptes = array.array("I", (len(sites[nom]) for nom in noms_sites))
+        utilisateurs = [utilisateur for nom in noms_sites for utilisateur in sites[nom]]
+        valeurs = [valeur for nom in noms_sites for valeur in sites[nom].values()]
+        crees = modifies = array.array("I", bytes(4 * len(valeurs)))
+    table: Dict[str, int] = {}
+    numeros = array.array("I", [table.setdefault(utilisateur, len(table)) for utilisateur in utilisateurs])
+    chaines = noms_sites + list(table) + valeurs
+    texte = "\0".join(chaines)
+    if texte.count("\0") != max(0, len(chaines) - 1):
+        # Un nom contient un caractère NUL : on retombe sur le JSON compact, toujours lisible.
+        contenu = dict(extras or {}, sites={nom: dict(sites[nom].items()) for nom in noms_sites})
+        return json.dumps(contenu, separators=(",", ":")).encode('utf-8')
+    colonnes = [comptes, numeros, crees, modifies]
+    if sys.byteorder != "little":
+        colonnes = [array.array("I", colonne) for colonne in colonnes]
+        for colonne in colonnes:
+            colonne.byteswap()
+    extras_json = json.dumps(extras or {}, separators=(",", ":")).encode('utf-8')
+    corps = b"".join([struct.pack("<III", len(noms_sites), len(extras_json), len(table)), extras_json]
+                     + [colonne.tobytes() for colonne in colonnes] + [texte.encode('utf-8')])
+    return MAGIC_CONTENU + bytes((VERSION_CODEC, COMPRESSIONS[compression])) + _compresser(corps, compression)
+
+def decoder_contenu(donnees: bytes) -> Tuple[PasswordData, dict]:
+    """Inverse de `encoder_contenu`. Retourne (sites, extras) ; accepte aussi l'ancien JSON.
+
+    Les sites du format binaire sont rendus en `DonneesCoffre` (sans écouteurs ni scelleur).
+    """
+    if not donnees.startswith(MAGIC_CONTENU):
+        contenu = json.loads(donnees.decode('utf-8'))
+        if isinstance(contenu.get("format"), int) and isinstance(contenu.get("sites"), dict):
+            sites = contenu.pop("sites")
+            return sites, contenu
+        return contenu, {} # Format 1 historique : le JSON est directement {site: {user: password}}
+    version, compression = donnees[3], donnees[4]
+    if version not in (1, VERSION_CODEC):
+        raise ValueError(f"Version de codec non prise en charge : {version}")
+    corps = _decompresser(donnees[5:], compression)
+    if version == 1:
+        (nb_sites, taille_extras), nb_noms, position = struct.unpack_from("<II", corps), 0, 8
+    else:
+        nb_sites, taille_extras, nb_noms = struct.unpack_from("<III", corps)
+        position = 12
+    extras = json.loads(corps[position:position + taille_extras].decode('utf-8'))
+    position += taille_extras
+
+    def colonne(nb: int) -> array.array:
+        nonlocal position
+        valeurs = array.array("I")
+        valeurs.frombytes(corps[position:position + 4 * nb])
+        if sys.byteorder != "little":
+            valeurs.byteswap()
+        position += 4 * nb
+        return valeurs
+
+    comptes = colonne(nb_sites)
+    if version == 1: # Utilisateurs et valeurs alternés, sans dates
+        chaines = corps[position:].decode('utf-8').split("\0") if nb_sites else []
+        utilisateurs = list(map(sys.intern, chaines[nb_sites::2]))
+        return _reprendre_pieces(DonneesCoffre.depuis_colonnes(chaines[:nb_sites], comptes, utilisateurs, chaines[nb_sites + 1::2]), extras), extras
+    nb_entrees = sum(comptes)
+    numeros, crees, modifies = colonne(nb_entrees), colonne(nb_entrees), colonne(nb_entrees)
+    chaines = corps[position:].decode('utf-8').split("\0") if nb_sites else []
+    table = list(map(sys.intern, chaines[nb_sites:nb_sites + nb_noms]))
+    utilisateurs = list(map(table.__getitem__, numeros)) # Un seul objet par nom distinct
+    donnees = DonneesCoffre.depuis_colonnes(chaines[:nb_sites], comptes, utilisateurs, chaines[nb_sites + nb_noms:], crees, modifies)
+    return _reprendre_pieces(donnees, extras), extras
+
+def _reprendre_pieces(donnees: DonneesCoffre, extras: dict) -> DonneesCoffre:
+    """Rattache aux entrées les références de pièces jointes lues dans les extras (retirées des extras)."""
+    for nom_site, nom_utilisateur, pieces in extras.pop("pieces", ()):
+        if donnees.valeur(nom_site, nom_utilisateur) is not None:
+            donnees.definir_pieces(nom_site, nom_utilisateur, pieces)
+    return donnees
+
+def _serialiser(passwords_data: PasswordData, compression: str = COMPRESSION_STOCKAGE) -> bytes:
+    """Sérialise les données : format 2 si les mots de passe sont scellés, format 1 sinon."""
+    scelle = getattr(passwords_data, "scelleur", None) is not None
+    return encoder_contenu(passwords_data, {"format": FORMAT_STOCKAGE if scelle else 1}, compression)
+
+def _deserialiser(donnees: bytes, scelleur: "Fernet") -> DonneesCoffre:
+    """Inverse de `_serialiser`. Un stockage au format 1 est rendu sans scelleur."""
+    sites, extras = decoder_contenu(donnees)
+    passwords_data = sites if isinstance(sites, DonneesCoffre) else _reprendre_pieces(DonneesCoffre(sites), extras)
+    if extras.get("format") == FORMAT_STOCKAGE:
+        passwords_data.scelleur = scelleur
+    return passwords_data
+
+def _sceller_donnees(passwords_data: PasswordData, scelleur: "Fernet") -> DonneesCoffre:
+    """Convertit des données en clair (format 1) en données scellées."""
+    scellees = DonneesCoffre()
+    scellees.scelleur = scelleur
+    for site, utilisateurs in passwords_data.items():
+        scellees[site] = {utilisateur: scellees.sceller(mot_de_passe) for utilisateur, mot_de_passe in utilisateurs.items()}
+    scellees.generation = getattr(passwords_data, "generation", 0)
+    return scellees
+
+def _ecrire_stockage(session: SessionCoffre, passwords_data: PasswordData) -> bytes:
+    """Sérialise, chiffre et écrit le dictionnaire avec un chiffreur déjà prêt.
+
+    Incrémente la révision de l'en-tête. Retourne le contenu du fichier écrit.
+    """
+    if session.entete is not None:
+        session.entete["revision"] = session.entete.get("revision", 0) + 1
     try:
-        cle = deriver_cle(mot_passe_maitre.encode('utf-8'), salt)
-        donnees_json = json.dumps(passwords_data, indent=4).encode('utf-8')
-        donnees_chiffrees = chiffrer_donnees(cle, donnees_json)
-        
-        with open(STORAGE_FILENAME, "wb") as f_storage:
-            f_storage.write(donnees_chiffrees)
+        with mesurer_phase("serialisation") as phase:
+            donnees_json = _serialiser(passwords_data)
+            phase["octets"] = len(donnees_json)
+        with mesurer_phase("chiffrement") as phase:
+            donnees_chiffrees = session.chiffrer_fichier(donnees_json)
+            phase["octets"] = len(donnees_chiffrees)
+        with mesurer_phase("ecriture", octets=len(donnees_chiffrees)):
+            _ecrire_atomique(STORAGE_FILENAME, donnees_chiffrees)
         print(f"Stockage sauvegardé dans '{STORAGE_FILENAME}'.")
+        return donnees_chiffrees
     except IOError as e:
         print(f"ERREUR: Impossible de sauvegarder le fichier de stockage: {e}")
         raise # Informer l'appelant de l'échec
@@ -157,6 +2060,26 @@ def sauvegarder_stockage(passwords_data: PasswordData, mot_passe_maitre: str):
         print(f"ERREUR inattendue lors de la sauvegarde: {e}")
         raise
 
+def sauvegarder_stockage(passwords_data: PasswordData, mot_passe_maitre: str):
+    """Chiffre et sauvegarde le dictionnaire des mots de passe.
+
+    Refait la dérivation de clé à chaque appel : préférer `SessionCoffre.sauvegarder`.
+    Conserve l'en-tête KDF du coffre existant (ou l'ancien format sans en-tête).
+    Écrit sous verrou, mais remplace le contenu sans fusion : une session, elle,
+    fusionne les écritures concurrentes.
+    """
+    with verrou_coffre():
+        entete = None
+        if os.path.exists(STORAGE_FILENAME):
+            with open(STORAGE_FILENAME, "rb") as f_storage:
+                entete, _prefixe, _corps = _decouper_fichier(f_storage.read())
+        elif not os.path.exists(SALT_FILENAME):
+            print(f"ERREUR critique: Fichier de sel '{SALT_FILENAME}' introuvable lors de la sauvegarde.")
+            raise FileNotFoundError(SALT_FILENAME)
+
+        cle, salt, _duree = _ouvrir_cle(mot_passe_maitre, entete)
+        _ecrire_stockage(SessionCoffre(passwords_data, salt, cle, entete), passwords_data)
+
 # --- 4. Fonctions de Gestion des Entrées (utilisées par la GUI) ---
 # Ces fonctions opèrent sur le dictionnaire `passwords_data` en mémoire.
 
@@ -164,37 +2087,711 @@ def ajouter_ou_modifier_entree(passwords_data: PasswordData, nom_site: str, nom_
     """Ajoute ou met à jour une entrée."""
     if not nom_site or not nom_utilisateur:
         raise ValueError("Le nom du site et le nom d'utilisateur ne peuvent pas être vides.")
-    if nom_site not in passwords_data:
-        passwords_data[nom_site] = {}
-    passwords_data[nom_site][nom_utilisateur] = mot_de_passe
+    if isinstance(passwords_data, DonneesCoffre):
+        mot_de_passe = passwords_data.sceller(mot_de_passe)
+    _inserer_entree(passwords_data, nom_site, nom_utilisateur, mot_de_passe)
+
+def _inserer_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str, valeur: str, date: Optional[int] = None):
+    """Stocke `valeur` telle quelle (déjà scellée si les données le sont), datée de `date` (maintenant par défaut)."""
+    _noter_avant(passwords_data, nom_site, nom_utilisateur)
+    if isinstance(passwords_data, DonneesCoffre):
+        passwords_data.ecrire(nom_site, nom_utilisateur, valeur, date)
+    else:
+        if nom_site not in passwords_data:
+            passwords_data[nom_site] = {}
+        passwords_data[nom_site][nom_utilisateur] = valeur
+    _notifier(passwords_data, "ajout", nom_site, nom_utilisateur, valeur)
+
+def entrees_stockees(passwords_data: PasswordData) -> Iterator[Tuple[str, str, str]]:
+    """Toutes les entrées (site, utilisateur, valeur telle que stockée, scellée le cas échéant)."""
+    if isinstance(passwords_data, DonneesCoffre):
+        return passwords_data.entrees()
+    return ((nom_site, nom_utilisateur, valeur) for nom_site, utilisateurs in passwords_data.items()
+            for nom_utilisateur, valeur in utilisateurs.items())
 
+def entree_existe(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> bool:
+    """Indique si une entrée existe, sans déchiffrer son mot de passe."""
+    if isinstance(passwords_data, DonneesCoffre):
+        return passwords_data.valeur(nom_site, nom_utilisateur) is not None
+    return nom_utilisateur in passwords_data.get(nom_site, {})
+
+@mesurer_operation("lecture_entree")
 def recuperer_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> Optional[str]:
-    """Récupère le mot de passe pour une entrée."""
+    """Récupère le mot de passe pour une entrée (déchiffré à la demande s'il est scellé)."""
+    if isinstance(passwords_data, DonneesCoffre):
+        valeur = passwords_data.valeur(nom_site, nom_utilisateur)
+        return None if valeur is None else passwords_data.ouvrir(valeur)
     return passwords_data.get(nom_site, {}).get(nom_utilisateur)
 
+def recuperer_dates_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> Optional[Tuple[float, float]]:
+    """(création, dernière modification) d'une entrée, en secondes depuis l'époque.
+
+    None si l'entrée n'existe pas ou si ses dates sont inconnues (coffre d'une version
+    qui ne les enregistrait pas, ou données non datées).
+    """
+    if not isinstance(passwords_data, DonneesCoffre) or not entree_existe(passwords_data, nom_site, nom_utilisateur):
+        return None
+    creation, modification = passwords_data.dates(nom_site, nom_utilisateur)
+    if not modification:
+        return None
+    return float(creation or modification), float(modification)
+
+def recuperer_pieces_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> List[dict]:
+    """Références des pièces jointes d'une entrée (voir `pieces_password_manager`), sans lire les pièces."""
+    if not isinstance(passwords_data, DonneesCoffre):
+        return []
+    return passwords_data.pieces(nom_site, nom_utilisateur)
+
+def definir_pieces_entree(passwords_data: DonneesCoffre, nom_site: str, nom_utilisateur: str, pieces: List[dict]):
+    """Remplace les références des pièces jointes d'une entrée existante.
+
+    L'entrée est notifiée comme modifiée (« ajout », même valeur) : le journal enregistre
+    ses nouvelles références et sa date de modification avance.
+    """
+    valeur = passwords_data.valeur(nom_site, nom_utilisateur)
+    if valeur is None:
+        raise ValueError(f"Entrée '{nom_utilisateur}' introuvable pour '{nom_site}'.")
+    _noter_avant(passwords_data, nom_site, nom_utilisateur)
+    passwords_data.ecrire(nom_site, nom_utilisateur, valeur)
+    passwords_data.definir_pieces(nom_site, nom_utilisateur, pieces)
+    passwords_data.notifier("ajout", nom_site, nom_utilisateur, valeur)
+
 def recuperer_utilisateurs_pour_site(passwords_data: PasswordData, nom_site: str) -> list[str]:
-     """Retourne la liste des noms d'utilisateur pour un site donné."""
-     return list(passwords_data.get(nom_site, {}).keys())
+     """Retourne la liste triée des noms d'utilisateur pour un site donné."""
+     if isinstance(passwords_data, DonneesCoffre):
+         return list(passwords_data.index_ordonne.utilisateurs(nom_site))
+     return sorted(passwords_data.get(nom_site, {}))
 
 def lister_sites(passwords_data: PasswordData) -> list[str]:
-    """Retourne la liste des noms de sites enregistrés."""
-    return sorted(list(passwords_data.keys()))
+    """Retourne la liste triée des noms de sites enregistrés (sans tri si les données sont indexées)."""
+    if isinstance(passwords_data, DonneesCoffre):
+        return list(passwords_data.index_ordonne.sites)
+    return sorted(passwords_data)
 
 def supprimer_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> bool:
     """Supprime une entrée utilisateur spécifique pour un site."""
     if nom_site in passwords_data and nom_utilisateur in passwords_data[nom_site]:
+        _noter_avant(passwords_data, nom_site, nom_utilisateur)
         del passwords_data[nom_site][nom_utilisateur]
         # Si c'était le dernier utilisateur pour ce site, supprimer le site aussi
         if not passwords_data[nom_site]:
             del passwords_data[nom_site]
+        _notifier(passwords_data, "suppression", nom_site, nom_utilisateur)
         return True
     return False
 
 def supprimer_site(passwords_data: PasswordData, nom_site: str) -> bool:
      """Supprime toutes les entrées pour un site."""
      if nom_site in passwords_data:
+         for nom_utilisateur in passwords_data[nom_site]:
+             _noter_avant(passwords_data, nom_site, nom_utilisateur)
          del passwords_data[nom_site]
+         _notifier(passwords_data, "suppression_site", nom_site)
          return True
      return False
 
+def _appliquer_operation(passwords_data: PasswordData, operation: str, nom_site: str, nom_utilisateur: Optional[str], mot_de_passe: Optional[str],
+                         scelle: bool = False, date: Optional[int] = None, pieces: Optional[List[dict]] = None):
+    """Rejoue une opération notifiée (voir `DonneesCoffre.notifier`) sur des données.
+
+    `scelle` indique que `mot_de_passe` est déjà une valeur scellée ; `date` est la
+    date de modification enregistrée (maintenant si absente) ; `pieces`, les références
+    des pièces jointes de l'entrée après un ajout (inchangées si None).
+    """
+    if operation == "ajout":
+        if scelle:
+            if getattr(passwords_data, "scelleur", None) is None:
+                raise ValueError("Entrée scellée rejouée sur un stockage non scellé.")
+            _inserer_entree(passwords_data, nom_site, nom_utilisateur, mot_de_passe, date)
+        else:
+            ajouter_ou_modifier_entree(passwords_data, nom_site, nom_utilisateur, mot_de_passe)
+        if pieces is not None and isinstance(passwords_data, DonneesCoffre):
+            passwords_data.definir_pieces(nom_site, nom_utilisateur, pieces)
+    elif operation == "suppression":
+        supprimer_entree(passwords_data, nom_site, nom_utilisateur)
+    elif operation == "suppression_site":
+        supprimer_site(passwords_data, nom_site)
+    else:
+        raise ValueError(f"Opération inconnue : {operation}")
+
+# --- 5. Recherche de Sites ---
+
+TAILLE_NGRAMME = 3
+_DEBUT_NOM = "\x02" # Marque le début du nom : les recherches par préfixe deviennent des recherches de sous-chaîne
+
+def _trigrammes(texte: str) -> set:
+    """Toutes les sous-chaînes de TAILLE_NGRAMME caractères de `texte`."""
+    return {texte[i:i + TAILLE_NGRAMME] for i in range(len(texte) - TAILLE_NGRAMME + 1)}
+
+class IndexRecherche:
+    """Index de trigrammes sur les noms de sites, insensible à la casse.
+
+    Une recherche d'au moins trois caractères ne parcourt que l'intersection des sites
+    qui contiennent chacun de ses trigrammes, en partant du plus rare, et vérifie la
+    sous-chaîne sur ces seuls candidats avant de les trier. Une requête plus courte,
+    peu sélective de toute façon, parcourt les sites dans l'ordre de l'index trié
+    et s'arrête à `limite`. L'index est tenu à jour par les notifications de
+    `DonneesCoffre` (voir `construire_index_recherche`).
+    """
+    def __init__(self, passwords_data: PasswordData):
+        self._donnees = passwords_data
+        self._cles: Dict[str, str] = {}         # site -> nom replié (avec marque de début)
+        self._postings: Dict[str, set] = {}     # trigramme -> sites qui le contiennent
+        for nom_site in passwords_data:
+            self.ajouter(nom_site)
+
+    def __len__(self) -> int:
+        return len(self._cles)
+
+    def ajouter(self, nom_site: str):
+        if nom_site in self._cles:
+            return
+        cle = _DEBUT_NOM + nom_site.casefold()
+        self._cles[nom_site] = cle
+        for trigramme in _trigrammes(cle):
+            self._postings.setdefault(trigramme, set()).add(nom_site)
+
+    def retirer(self, nom_site: str):
+        cle = self._cles.pop(nom_site, None)
+        if cle is None:
+            return
+        for trigramme in _trigrammes(cle):
+            sites = self._postings.get(trigramme)
+            if sites is not None:
+                sites.discard(nom_site)
+                if not sites:
+                    del self._postings[trigramme]
+
+    def ecouter(self, operation: str, nom_site: str, nom_utilisateur: Optional[str], mot_de_passe: Optional[str]):
+        """Écouteur de `DonneesCoffre` : le site est indexé tant qu'il existe dans les données."""
+        if operation == "lot":
+            for site in [site for site in self._cles if site not in self._donnees]:
+                self.retirer(site)
+            for site in self._donnees:
+                self.ajouter(site)
+        elif nom_site in self._donnees:
+            self.ajouter(nom_site)
+        else:
+            self.retirer(nom_site)
+
+    def _sites_tries(self) -> Iterable[str]:
+        if isinstance(self._donnees, DonneesCoffre):
+            return self._donnees.index_ordonne.sites
+        return sorted(self._cles)
+
+    def rechercher(self, terme: str, prefixe: bool = False, limite: Optional[int] = None) -> list[str]:
+        """Sites dont le nom contient `terme` (ou commence par, si `prefixe`), triés.
+
+        Avec `limite`, seuls les `limite` premiers résultats sont triés et retournés.
+        """
+        requete = terme.casefold()
+        if prefixe:
+            requete = _DEBUT_NOM + requete
+        if len(requete) < TAILLE_NGRAMME:
+            trouves = (site for site in self._sites_tries() if requete in self._cles[site])
+            return list(itertools.islice(trouves, limite))
+        postings = sorted((self._postings.get(t, set()) for t in _trigrammes(requete)), key=len)
+        candidats = postings[0]
+        for sites in postings[1:]:
+            if not candidats:
+                break
+            candidats = candidats & sites
+        candidats = [site for site in candidats if requete in self._cles[site]]
+        if limite is not None:
+            return heapq.nsmallest(limite, candidats)
+        return sorted(candidats)
+
+def construire_index_recherche(passwords_data: PasswordData) -> IndexRecherche:
+    """Construit l'index de recherche et l'abonne aux modifications des données."""
+    index = IndexRecherche(passwords_data)
+    if isinstance(passwords_data, DonneesCoffre):
+        passwords_data.ecouteurs.append(index.ecouter)
+    return index
+
+class ListeTriee:
+    """Liste triée de chaînes distinctes, découpée en blocs d'au plus 2 × TAILLE_BLOC éléments.
+
+    L'insertion et le retrait ne déplacent que les éléments d'un bloc ; un arbre de
+    Fenwick sur la taille des blocs donne le rang d'un élément et l'élément d'un rang
+    en O(log n), sans parcourir la liste. `tranche` parcourt un intervalle de rangs
+    (pagination).
+    """
+    TAILLE_BLOC = 512
+
+    def __init__(self, elements: Iterable[str] = (), trie: bool = False):
+        """`elements` ne doit pas contenir de doublon ; `trie` : il est déjà trié (pas de tri)."""
+        elements = list(elements) if trie else sorted(elements)
+        self._blocs: List[List[str]] = [elements[i:i + self.TAILLE_BLOC] for i in range(0, len(elements), self.TAILLE_BLOC)]
+        self._max: List[str] = [bloc[-1] for bloc in self._blocs]
+        self._taille = len(elements)
+        self._construire_arbre()
+
+    def _construire_arbre(self):
+        """Arbre de Fenwick des tailles de blocs (à refaire quand un bloc apparaît ou disparaît)."""
+        nb = len(self._blocs)
+        arbre = [0] * (nb + 1)
+        for k, bloc in enumerate(self._blocs, 1):
+            arbre[k] += len(bloc)
+            parent = k + (k & -k)
+            if parent <= nb:
+                arbre[parent] += arbre[k]
+        self._arbre = arbre
+
+    def _ajuster(self, i: int, delta: int):
+        k = i + 1
+        while k < len(self._arbre):
+            self._arbre[k] += delta
+            k += k & -k
+
+    def _avant(self, i: int) -> int:
+        """Nombre d'éléments dans les blocs précédant le bloc `i`."""
+        total = 0
+        while i:
+            total += self._arbre[i]
+            i -= i & -i
+        return total
+
+    def _localiser(self, rang: int) -> Tuple[int, int]:
+        """(bloc, position dans le bloc) de l'élément de rang `rang`."""
+        bloc, reste = 0, rang
+        pas = 1 << (len(self._blocs).bit_length() - 1) if self._blocs else 0
+        while pas:
+            suivant = bloc + pas
+            if suivant <= len(self._blocs) and self._arbre[suivant] <= reste:
+                bloc = suivant
+                reste -= self._arbre[suivant]
+            pas >>= 1
+        return bloc, reste
+
+    def _chercher(self, element: str) -> Tuple[int, int]:
+        """(bloc, position d'insertion dans le bloc) de `element`."""
+        i = min(bisect.bisect_left(self._max, element), len(self._blocs) - 1)
+        return i, bisect.bisect_left(self._blocs[i], element)
+
+    def __len__(self) -> int:
+        return self._taille
+
+    def __iter__(self) -> Iterator[str]:
+        for bloc in self._blocs:
+            yield from bloc
+
+    def __contains__(self, element: str) -> bool:
+        return self.rang(element) is not None
+
+    def __getitem__(self, rang: int) -> str:
+        if rang < 0:
+            rang += self._taille
+        if not 0 <= rang < self._taille:
+            raise IndexError("rang hors de la liste")
+        i, j = self._localiser(rang)
+        return self._blocs[i][j]
+
+    def ajouter(self, element: str) -> bool:
+        """Insère `element` à sa place ; False s'il y était déjà."""
+        if not self._blocs:
+            self._blocs, self._max, self._taille = [[element]], [element], 1
+            self._construire_arbre()
+            return True
+        i, j = self._chercher(element)
+        bloc = self._blocs[i]
+        if j < len(bloc) and bloc[j] == element:
+            return False
+        bloc.insert(j, element)
+        self._max[i] = bloc[-1]
+        self._taille += 1
+        if len(bloc) > 2 * self.TAILLE_BLOC:
+            self._blocs[i:i + 1] = [bloc[:self.TAILLE_BLOC], bloc[self.TAILLE_BLOC:]]
+            self._max[i:i + 1] = [bloc[self.TAILLE_BLOC - 1], bloc[-1]]
+            self._construire_arbre()
+        else:
+            self._ajuster(i, 1)
+        return True
+
+    def retirer(self, element: str) -> bool:
+        """Retire `element` ; False s'il n'y était pas."""
+        if not self._blocs:
+            return False
+        i, j = self._chercher(element)
+        bloc = self._blocs[i]
+        if j >= len(bloc) or bloc[j] != element:
+            return False
+        del bloc[j]
+        self._taille -= 1
+        if bloc:
+            self._max[i] = bloc[-1]
+            self._ajuster(i, -1)
+        else:
+            del self._blocs[i], self._max[i]
+            self._construire_arbre()
+        return True
+
+    def position(self, element: str) -> int:
+        """Nombre d'éléments strictement inférieurs à `element` (place où il serait inséré)."""
+        if not self._blocs:
+            return 0
+        i, j = self._chercher(element)
+        return self._avant(i) + j
+
+    def rang(self, element: str) -> Optional[int]:
+        """Rang de `element` dans la liste, ou None s'il n'y figure pas."""
+        if not self._blocs:
+            return None
+        i, j = self._chercher(element)
+        bloc = self._blocs[i]
+        if j < len(bloc) and bloc[j] == element:
+            return self._avant(i) + j
+        return None
+
+    def tranche(self, debut: int, fin: Optional[int] = None) -> Iterator[str]:
+        """Éléments de rang `debut` (inclus) à `fin` (exclu)."""
+        fin = self._taille if fin is None else min(fin, self._taille)
+        if debut >= fin:
+            return
+        i, j = self._localiser(max(0, debut))
+        reste = fin - max(0, debut)
+        while reste > 0:
+            morceau = self._blocs[i][j:j + reste]
+            yield from morceau
+            reste -= len(morceau)
+            i, j = i + 1, 0
+
+class IndexOrdonne:
+    """Sites triés et, pour chaque site consulté, ses utilisateurs triés.
+
+    Tenu à jour par `DonneesCoffre.notifier` en O(log n) par modification : la liste
+    des sites n'est jamais retriée. Les utilisateurs d'un site ne sont triés qu'au
+    premier accès à ce site.
+    """
+    def __init__(self, passwords_data: PasswordData):
+        self._donnees = passwords_data
+        self.sites = ListeTriee(passwords_data)
+        self._utilisateurs: Dict[str, ListeTriee] = {}
+
+    def utilisateurs(self, nom_site: str) -> ListeTriee:
+        """Utilisateurs triés de `nom_site` (liste vide si le site n'existe pas)."""
+        utilisateurs = self._utilisateurs.get(nom_site)
+        if utilisateurs is None:
+            if nom_site not in self._donnees:
+                return ListeTriee()
+            utilisateurs = self._utilisateurs[nom_site] = ListeTriee(self._donnees[nom_site])
+        return utilisateurs
+
+    def rang_site(self, nom_site: str) -> Optional[int]:
+        return self.sites.rang(nom_site)
+
+    def rang_utilisateur(self, nom_site: str, nom_utilisateur: str) -> Optional[int]:
+        return self.utilisateurs(nom_site).rang(nom_utilisateur)
+
+    def ecouter(self, operation: str, nom_site: str, nom_utilisateur: Optional[str]):
+        """Applique une modification notifiée (hors « lot », qui invalide l'index)."""
+        if operation == "ajout":
+            self.sites.ajouter(nom_site)
+            utilisateurs = self._utilisateurs.get(nom_site)
+            if utilisateurs is not None:
+                utilisateurs.ajouter(nom_utilisateur)
+        elif operation == "suppression" and nom_site in self._donnees:
+            utilisateurs = self._utilisateurs.get(nom_site)
+            if utilisateurs is not None:
+                utilisateurs.retirer(nom_utilisateur)
+        else: # Suppression du site, ou de son dernier utilisateur
+            self.sites.retirer(nom_site)
+            self._utilisateurs.pop(nom_site, None)
+
+# --- 6. Import / Export ---
+
+POLITIQUES_IMPORT = ("ignorer", "ecraser", "renommer") # Traitement d'une entrée existante au mot de passe différent
+FORMATS_FICHIER = {".csv": "csv", ".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl"}
+
+# Noms de colonnes reconnus (casse ignorée), par ordre de préférence. Couvre les exports
+# de Chrome/Edge, Firefox, Bitwarden, KeePass, LastPass et le format de `exporter_csv`.
+_COLONNES_SITE = ("site", "name", "title", "account", "nom")
+_COLONNES_URL = ("url", "login_uri", "web site", "website", "uri", "origin")
+_COLONNES_UTILISATEUR = ("username", "login_username", "login name", "user", "login", "email", "utilisateur")
+_COLONNES_MOT_DE_PASSE = ("password", "login_password", "mot_de_passe", "mot de passe")
+
+Ligne = Tuple[str, str, str] # (site, utilisateur, mot de passe)
+
+class RapportImport:
+    """Bilan d'un import : compteurs par issue et liste des conflits rencontrés."""
+    def __init__(self, politique: str):
+        self.politique = politique
+        self.ajoutees = 0
+        self.identiques = 0     # Entrée déjà présente avec le même mot de passe
+        self.ecrasees = 0
+        self.renommees = 0
+        self.ignorees = 0       # Conflits laissés intacts (politique "ignorer")
+        self.invalides = 0      # Lignes sans site, sans utilisateur ou sans mot de passe
+        self.conflits: List[Tuple[str, str]] = []
+
+    @property
+    def modifiees(self) -> int:
+        return self.ajoutees + self.ecrasees + self.renommees
+
+    def __str__(self) -> str:
+        return (f"{self.ajoutees} ajoutée(s), {self.ecrasees} écrasée(s), {self.renommees} renommée(s), "
+                f"{self.identiques} identique(s), {self.ignorees} conflit(s) ignoré(s), {self.invalides} ligne(s) invalide(s)")
+
+def _champ(ligne: dict, noms: Tuple[str, ...], brut: bool = False) -> str:
+    """Première valeur non vide parmi les colonnes `noms` (espaces conservés si `brut`)."""
+    for nom in noms:
+        valeur = ligne.get(nom)
+        if isinstance(valeur, str) and valeur.strip():
+            return valeur if brut else valeur.strip()
+    return ""
+
+def _site_depuis_url(url: str) -> str:
+    """Nom d'hôte d'une URL (`https://www.exemple.fr/login` -> `www.exemple.fr`)."""
+    if not url:
+        return ""
+    import urllib.parse
+    hote = urllib.parse.urlsplit(url if "://" in url else "//" + url).hostname
+    return hote or url
+
+def _ligne_depuis_champs(champs: dict) -> Ligne:
+    champs = {str(cle).strip().casefold(): valeur for cle, valeur in champs.items()}
+    site = _champ(champs, _COLONNES_SITE) or _site_depuis_url(_champ(champs, _COLONNES_URL))
+    return site, _champ(champs, _COLONNES_UTILISATEUR), _champ(champs, _COLONNES_MOT_DE_PASSE, brut=True)
+
+def lire_csv(flux) -> Iterator[Ligne]:
+    """Lit un export CSV ligne par ligne ; les colonnes sont reconnues d'après l'en-tête."""
+    for champs in csv.DictReader(flux):
+        yield _ligne_depuis_champs({cle: valeur for cle, valeur in champs.items() if cle is not None})
+
+def _ligne_depuis_objet(objet: dict) -> Ligne:
+    """Entrée JSON : objet plat, ou élément Bitwarden (`name` + `login.username/password/uris`)."""
+    champs = dict(objet)
+    login = objet.get("login")
+    if isinstance(login, dict):
+        champs.update({f"login_{cle}": valeur for cle, valeur in login.items() if isinstance(valeur, str)})
+        uris = login.get("uris") or []
+        if uris and isinstance(uris[0], dict):
+            champs["login_uri"] = uris[0].get("uri") or ""
+    return _ligne_depuis_champs(champs)
+
+class _LecteurJson:
+    """Lecture d'un document JSON par morceaux, une valeur à la fois (`JSONDecoder.raw_decode`).
+
+    Seul le morceau en cours et la valeur lue sont en mémoire : une longue liste
+    d'entrées est parcourue élément par élément.
+    """
+    TAILLE_BLOC = 64 * 1024
+
+    def __init__(self, flux):
+        self._flux = flux
+        self._tampon = ""
+        self._pos = 0
+        self._fin = False
+        self._decodeur = json.JSONDecoder()
+
+    def _remplir(self) -> bool:
+        """Ajoute un bloc au tampon (en oubliant la partie déjà lue). Faux en fin de flux."""
+        bloc = "" if self._fin else self._flux.read(self.TAILLE_BLOC)
+        if not bloc:
+            self._fin = True
+            return False
+        self._tampon = self._tampon[self._pos:] + bloc
+        self._pos = 0
+        return True
+
+    def caractere(self) -> str:
+        """Prochain caractère hors espaces, sans le consommer ("" en fin de document)."""
+        while True:
+            while self._pos < len(self._tampon) and self._tampon[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._tampon) or not self._remplir():
+                return self._tampon[self._pos:self._pos + 1]
+
+    def consommer(self, attendu: str):
+        if self.caractere() != attendu:
+            raise ValueError(f"Document JSON invalide : '{attendu}' attendu.")
+        self._pos += 1
+
+    def valeur(self):
+        """Décode la valeur suivante, en lisant d'autres blocs si elle est coupée."""
+        self.caractere()
+        while True:
+            try:
+                valeur, fin = self._decodeur.raw_decode(self._tampon, self._pos)
+            except json.JSONDecodeError:
+                if self._remplir():
+                    continue
+                raise
+            # Une valeur qui finit avec le tampon (nombre, littéral) peut continuer dans le bloc suivant.
+            if fin < len(self._tampon) or not self._remplir():
+                self._pos = fin
+                return valeur
+
+    def elements(self) -> Iterator:
+        """Éléments de la liste qui commence ici."""
+        self.consommer("[")
+        if self.caractere() == "]":
+            return
+        while True:
+            yield self.valeur()
+            if self.caractere() == "]":
+                return
+            self.consommer(",")
+
+def _objets_json(lecteur: _LecteurJson) -> Iterator:
+    """Entrées d'un document JSON : la liste elle-même, ou celle de sa clé "entrees" ou "items"."""
+    if lecteur.caractere() != "{":
+        yield from lecteur.elements()
+        return
+    lecteur.consommer("{")
+    while lecteur.caractere() != "}":
+        cle = lecteur.valeur()
+        lecteur.consommer(":")
+        if cle in ("entrees", "items") and lecteur.caractere() == "[":
+            yield from lecteur.elements() # Le reste du document (dossiers Bitwarden...) n'est pas lu
+            return
+        lecteur.valeur()
+        if lecteur.caractere() != "}":
+            lecteur.consommer(",")
+
+def lire_json(flux, lignes_json: bool = False) -> Iterator[Ligne]:
+    """Lit un export JSON en flux.
+
+    Avec `lignes_json`, un objet par ligne (JSON Lines). Sinon, le document est une
+    liste d'objets, ou un objet `{"entrees": [...]}` / `{"items": [...]}` (Bitwarden) :
+    la liste est lue élément par élément (voir `_LecteurJson`).
+    """
+    if lignes_json:
+        objets = (json.loads(ligne) for ligne in flux if ligne.strip())
+    else:
+        objets = _objets_json(_LecteurJson(flux))
+    for objet in objets:
+        if isinstance(objet, dict):
+            yield _ligne_depuis_objet(objet)
+
+def _nom_libre(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> str:
+    """Premier nom `utilisateur (n)` encore libre pour ce site."""
+    for n in itertools.count(2):
+        candidat = f"{nom_utilisateur} ({n})"
+        if not entree_existe(passwords_data, nom_site, candidat):
+            return candidat
+
+def importer_entrees(passwords_data: PasswordData, lignes, politique: str = "ignorer") -> RapportImport:
+    """Applique des lignes (site, utilisateur, mot de passe) aux données en un seul lot.
+
+    Un conflit est une entrée existante dont le mot de passe diffère : elle est laissée
+    intacte ("ignorer"), remplacée ("ecraser") ou l'import est rangé sous un nouveau nom
+    d'utilisateur ("renommer"). Ne sauvegarde pas : voir `importer_fichier`.
+
+    L'import est atomique : si une ligne ne peut pas être lue (fichier malformé),
+    les entrées déjà importées sont restaurées avant que l'exception remonte.
+    """
+    if politique not in POLITIQUES_IMPORT:
+        raise ValueError(f"Politique d'import inconnue : {politique!r} (attendu : {', '.join(POLITIQUES_IMPORT)}).")
+    rapport = RapportImport(politique)
+    lot = passwords_data.lot() if isinstance(passwords_data, DonneesCoffre) else contextlib.nullcontext()
+    annulation = [] # (site, utilisateur, valeur stockée et dates avant l'import, ou None)
+    with lot:
+        try:
+            for nom_site, nom_utilisateur, mot_de_passe in lignes:
+                nom_site, nom_utilisateur = (nom_site or "").strip(), (nom_utilisateur or "").strip()
+                if not nom_site or not nom_utilisateur or not mot_de_passe:
+                    rapport.invalides += 1
+                    continue
+                if entree_existe(passwords_data, nom_site, nom_utilisateur):
+                    if recuperer_entree(passwords_data, nom_site, nom_utilisateur) == mot_de_passe:
+                        rapport.identiques += 1
+                        continue
+                    rapport.conflits.append((nom_site, nom_utilisateur))
+                    if politique == "ignorer":
+                        rapport.ignorees += 1
+                        continue
+                    if politique == "renommer":
+                        nom_utilisateur = _nom_libre(passwords_data, nom_site, nom_utilisateur)
+                        rapport.renommees += 1
+                    else:
+                        rapport.ecrasees += 1
+                else:
+                    rapport.ajoutees += 1
+                annulation.append(_etat_entree(passwords_data, nom_site, nom_utilisateur))
+                ajouter_ou_modifier_entree(passwords_data, nom_site, nom_utilisateur, mot_de_passe)
+        except BaseException:
+            _restaurer_entrees(passwords_data, annulation)
+            raise
+    return rapport
+
+def _etat_entree(passwords_data: PasswordData, nom_site: str, nom_utilisateur: str) -> Tuple[str, str, Optional[Tuple[str, Optional[Tuple[int, int]]]]]:
+    """(site, utilisateur, (valeur stockée, dates) ou None si l'entrée n'existe pas)."""
+    valeur = passwords_data.get(nom_site, {}).get(nom_utilisateur)
+    if valeur is None:
+        return nom_site, nom_utilisateur, None
+    dates = passwords_data.dates(nom_site, nom_utilisateur) if isinstance(passwords_data, DonneesCoffre) else None
+    return nom_site, nom_utilisateur, (valeur, dates)
+
+def _restaurer_entrees(passwords_data: PasswordData, etats: List[tuple]):
+    """Remet les entrées dans les états relevés par `_etat_entree` (du plus récent au plus ancien)."""
+    for nom_site, nom_utilisateur, etat in reversed(etats):
+        if etat is None:
+            supprimer_entree(passwords_data, nom_site, nom_utilisateur)
+        elif isinstance(passwords_data, DonneesCoffre):
+            valeur, (_creation, modification) = etat
+            passwords_data.ecrire(nom_site, nom_utilisateur, valeur, modification)
+            _notifier(passwords_data, "ajout", nom_site, nom_utilisateur, valeur)
+        else:
+            passwords_data[nom_site][nom_utilisateur] = etat[0]
+
+def _format_fichier(chemin: str, format: Optional[str]) -> str:
+    if format is None:
+        format = FORMATS_FICHIER.get(os.path.splitext(chemin)[1].lower())
+    if format not in ("csv", "json", "jsonl"):
+        raise ValueError(f"Format de fichier non reconnu pour '{chemin}' (csv, json ou jsonl).")
+    return format
+
+@mesurer_operation("import")
+def importer_fichier(session: SessionCoffre, chemin: str, format: Optional[str] = None, politique: str = "ignorer") -> RapportImport:
+    """Importe un fichier CSV/JSON dans le coffre puis fait une seule sauvegarde chiffrée."""
+    format = _format_fichier(chemin, format)
+    with open(chemin, "r", encoding="utf-8-sig", newline="") as flux:
+        lignes = lire_csv(flux) if format == "csv" else lire_json(flux, lignes_json=(format == "jsonl"))
+        rapport = importer_entrees(session.passwords_data, lignes, politique)
+    print(f"Import de '{chemin}' : {rapport}.")
+    if rapport.modifiees:
+        session.sauvegarder()
+    return rapport
+
+def iterer_entrees(passwords_data: PasswordData) -> Iterator[Ligne]:
+    """Toutes les entrées en clair, triées, déchiffrées une à une."""
+    for nom_site in lister_sites(passwords_data):
+        for nom_utilisateur in recuperer_utilisateurs_pour_site(passwords_data, nom_site):
+            yield nom_site, nom_utilisateur, recuperer_entree(passwords_data, nom_site, nom_utilisateur)
+
+def _ouvrir_export(chemin: str):
+    """Ouvre (ou tronque) le fichier d'export, lisible par son seul propriétaire."""
+    descripteur = os.open(chemin, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    return open(descripteur, "w", encoding="utf-8", newline="")
+
+@mesurer_operation("export")
+def exporter_fichier(session: SessionCoffre, chemin: str, format: Optional[str] = None) -> int:
+    """Exporte le coffre EN CLAIR (CSV `site,username,password`, JSON ou JSON Lines).
+
+    L'écriture se fait au fil du déchiffrement : un seul mot de passe en clair est en
+    mémoire à la fois. Retourne le nombre d'entrées écrites.
+    """
+    format = _format_fichier(chemin, format)
+    nombre = 0
+    with _ouvrir_export(chemin) as flux:
+        if format == "csv":
+            ecrivain = csv.writer(flux)
+            ecrivain.writerow(("site", "username", "password"))
+        elif format == "json":
+            flux.write("[")
+        for nom_site, nom_utilisateur, mot_de_passe in iterer_entrees(session.passwords_data):
+            if format == "csv":
+                ecrivain.writerow((nom_site, nom_utilisateur, mot_de_passe))
+            else:
+                objet = json.dumps({"site": nom_site, "username": nom_utilisateur, "password": mot_de_passe}, ensure_ascii=False)
+                if format == "json":
+                    flux.write(("\n" if nombre == 0 else ",\n") + objet)
+                else:
+                    flux.write(objet + "\n")
+            nombre += 1
+        if format == "json":
+            flux.write("\n]\n")
+    print(f"{nombre} entrée(s) exportée(s) dans '{chemin}'.")
+    return nombre
+
 # (Le bloc if __name__ == "__main__": pour le test en ligne de commande peut être gardé ou supprimé)
\ No newline at end of file
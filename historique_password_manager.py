@@ -0,0 +1,420 @@
+"""Historique des versions du coffre : chaque écriture devient une version consultable et restaurable.
+
+    python -m cli_password_manager history                    # versions conservées
+    python -m cli_password_manager history exemple.fr alice   # valeurs successives d'une entrée
+    python -m cli_password_manager rollback 42 exemple.fr alice
+
+L'historique est un dossier à côté du coffre :
+
+    versions.log        en-tête (clé de l'historique enveloppée), puis une ligne chiffrée par version
+    objets/<nom>.bkh    contenu en clair d'un seau, compressé et chiffré ; <nom> : empreinte à clé du contenu
+
+Comme pour la réplication, les entrées sont réparties en seaux par une empreinte à clé
+du nom du site. Une version ne liste que les seaux qui ont changé depuis la précédente,
+avec le nom de leur nouvel objet ; la première ligne conservée donne la carte complète.
+Un seau inchangé n'est jamais réécrit, et un contenu déjà connu (retour à une valeur
+antérieure) réutilise son objet. Après une modification d'un coffre de 100 000 entrées,
+une version coûte un objet de quelques Ko et une ligne du journal.
+
+Retrouver une version ne déchiffre que les lignes du journal (petites) et les objets
+utiles : le seau du site pour une entrée, tous les seaux de la version pour le coffre
+entier. Au-delà de `VERSIONS_MAX` versions ou de `JOURS_MAX` jours, les plus anciennes
+sont fondues dans la première ligne et les objets qui ne servent plus sont supprimés.
+
+La clé de l'historique est tirée au hasard et enveloppée par une sous-clé de la clé de
+données : changer le mot de passe maître, ou faire tourner la clé, ne la réenveloppe
+que dans l'en-tête.
+"""
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import core_password_manager as core
+
+
+HISTORIQUE_DOSSIER = "passwords.history"
+JOURNAL_VERSIONS = "versions.log"
+DOSSIER_OBJETS = "objets"
+EXTENSION = ".bkh"
+FORMAT_HISTORIQUE = 1
+NB_SEAUX = 1024       # ~100 entrées par seau pour 100 000 entrées
+VERSIONS_MAX = 500    # Versions conservées...
+JOURS_MAX = 180       # ... et ancienneté maximale
+MARGE_ELAGAGE = 50    # Versions tolérées au-delà de VERSIONS_MAX avant de réécrire le journal
+
+Carte = Dict[int, List[str]] # seau -> [nom de l'objet, empreinte des valeurs scellées]
+
+
+class Version:
+    """Une version conservée : numéro, date, révision du coffre et seaux modifiés."""
+    __slots__ = ("numero", "horodatage", "revision", "seaux", "jeton")
+
+    def __init__(self, numero: int, horodatage: float, revision: int, seaux: Dict[int, Optional[List[str]]], jeton: bytes = b""):
+        self.numero = numero
+        self.horodatage = horodatage
+        self.revision = revision
+        self.seaux = seaux # seau -> [objet, empreinte scellée], ou None si le seau s'est vidé
+        self.jeton = jeton # Ligne chiffrée telle qu'écrite (recopiée telle quelle à l'élagage)
+
+    def __str__(self) -> str:
+        moment = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.horodatage))
+        return f"{self.numero:>6}  {moment}  révision {self.revision:<6} {len(self.seaux)} seau(x) modifié(s)"
+
+
+class HistoriqueCoffre:
+    """Historique d'un coffre déverrouillé, alimenté à chaque écriture de la session.
+
+    `SessionCoffre` appelle `enregistrer` après chaque écriture (sous `verrou_coffre`) ;
+    l'écouteur ne fait que marquer les seaux touchés, dans le thread des données. Les
+    autres processus ajoutent leurs versions au même journal : il est relu avant chaque ajout.
+    """
+    def __init__(self, session: core.SessionCoffre, dossier: str = HISTORIQUE_DOSSIER):
+        self.session = session
+        self.dossier = dossier
+        self._chemin = os.path.join(dossier, JOURNAL_VERSIONS)
+        self._cle = b""
+        self._fernet = None
+        self._cle_noms = b""
+        self._repartition = None
+        self._seaux_sites: Dict[str, int] = {}
+        self.versions: List[Version] = []
+        self._carte: Carte = {}
+        self._signature = None # (inode, taille lue) du journal des versions
+        self._sales: Dict[int, int] = {} # seau -> génération de sa dernière modification
+        self._verrou = threading.Lock()
+
+    # --- Ouverture ---
+
+    def _enveloppe(self, cle_donnees: bytes):
+        return core.Fernet(core.deriver_sous_cle(cle_donnees, b"historique"))
+
+    def _adopter_cle(self, cle: bytes):
+        self._cle = cle
+        self._fernet = core.Fernet(cle)
+        self._cle_noms = base64.urlsafe_b64decode(core.deriver_sous_cle(cle, b"noms"))
+        self._repartition = hashlib.blake2b(key=base64.urlsafe_b64decode(core.deriver_sous_cle(cle, b"seaux")), digest_size=4)
+
+    def ouvrir(self):
+        """Lit (ou crée) le journal des versions et suit les modifications des données.
+
+        Un historique vide reçoit tout de suite une première version : l'état chargé,
+        pour que la première modification soit déjà réversible.
+        """
+        with core.verrou_coffre():
+            if not os.path.exists(self._chemin):
+                os.makedirs(os.path.join(self.dossier, DOSSIER_OBJETS), exist_ok=True)
+                cle = core.Fernet.generate_key()
+                self._ecrire_journal(self._enveloppe(self.session.cle).encrypt(cle), [])
+            self._relire()
+            if not self.versions:
+                self._sales = dict.fromkeys(range(NB_SEAUX), 0)
+                self.enregistrer(self.session.passwords_data)
+        self.session.passwords_data.ecouteurs.append(self.ecouter)
+
+    def _relire(self):
+        """Charge les versions ajoutées depuis la dernière lecture (tout, si le journal a été réécrit)."""
+        stat = os.stat(self._chemin)
+        if self._signature is not None and self._signature[0] == stat.st_ino and self._signature[1] == stat.st_size:
+            return
+        with open(self._chemin, "rb") as f_versions:
+            if self._signature is None or self._signature[0] != stat.st_ino:
+                entete = json.loads(f_versions.readline())
+                if entete.get("format") != FORMAT_HISTORIQUE:
+                    raise ValueError(f"Format d'historique non pris en charge : {entete.get('format')}")
+                self._adopter_cle(self._deballer(entete))
+                self.versions, self._carte = [], {}
+            else:
+                f_versions.seek(self._signature[1])
+            position = f_versions.tell()
+            for ligne in f_versions:
+                try:
+                    contenu = json.loads(self._fernet.decrypt(ligne.rstrip(b"\n")))
+                except (core.InvalidToken, ValueError):
+                    break # Fin déchirée par une interruption : ignorée, puis tronquée au prochain ajout
+                self._appliquer(Version(contenu["v"], contenu["t"], contenu["r"],
+                                        {int(seau): objet for seau, objet in contenu["s"].items()}, ligne.rstrip(b"\n")))
+                position += len(ligne)
+        self._signature = (stat.st_ino, position)
+
+    def _deballer(self, entete: dict) -> bytes:
+        """Clé de l'historique, enveloppée par la clé de données (ou par celle d'une rotation interrompue après la bascule)."""
+        for champ in ("cle", "suivante"):
+            if champ in entete:
+                try:
+                    return self._enveloppe(self.session.cle).decrypt(entete[champ].encode('ascii'))
+                except core.InvalidToken:
+                    pass
+        raise ValueError(f"'{self._chemin}' n'appartient pas à ce coffre.")
+
+    def _appliquer(self, version: Version):
+        self.versions.append(version)
+        for seau, objet in version.seaux.items():
+            if objet is None:
+                self._carte.pop(seau, None)
+            else:
+                self._carte[seau] = objet
+
+    def _ecrire_journal(self, cle_enveloppee: bytes, lignes: List[bytes], cle_suivante: Optional[bytes] = None):
+        entete = {"format": FORMAT_HISTORIQUE, "cle": cle_enveloppee.decode('ascii')}
+        if cle_suivante is not None:
+            entete["suivante"] = cle_suivante.decode('ascii')
+        entete = json.dumps(entete).encode('utf-8')
+        core._ecrire_atomique(self._chemin, b"\n".join([entete] + lignes) + b"\n")
+
+    # --- Suivi des modifications ---
+
+    def _seau(self, site: str) -> int:
+        seau = self._seaux_sites.get(site)
+        if seau is None:
+            h = self._repartition.copy()
+            h.update(site.encode('utf-8'))
+            seau = self._seaux_sites[site] = int.from_bytes(h.digest(), "little") % NB_SEAUX
+        return seau
+
+    def ecouter(self, operation: str, nom_site: str, nom_utilisateur: Optional[str], mot_de_passe: Optional[str]):
+        """Écouteur de `DonneesCoffre` : marque le seau du site (tous après un lot)."""
+        generation = self.session.generation
+        with self._verrou:
+            if operation == "lot":
+                self._sales = dict.fromkeys(range(NB_SEAUX), generation)
+            else:
+                self._sales[self._seau(nom_site)] = generation
+
+    def _signature_scellee(self, sites: Dict[str, Dict[str, str]]) -> str:
+        lignes = "".join(f"{site}\0{utilisateur}\0{valeur}\n" for site in sorted(sites) for utilisateur, valeur in sorted(sites[site].items()))
+        return hashlib.blake2b(lignes.encode('utf-8'), key=self._cle_noms, digest_size=8).hexdigest()
+
+    # --- Écriture d'une version ---
+
+    @core.mesurer_operation("historique")
+    def enregistrer(self, passwords_data: core.PasswordData):
+        """Ajoute une version si des seaux ont changé depuis la précédente (appelé sous `verrou_coffre`)."""
+        with self._verrou:
+            sales = dict(self._sales)
+        if not sales:
+            return
+        generation = getattr(passwords_data, "generation", 0)
+        self._relire()
+        contenus: Dict[int, Dict[str, Dict[str, str]]] = {seau: {} for seau in sales}
+        for site in passwords_data:
+            contenu = contenus.get(self._seau(site))
+            if contenu is not None and passwords_data[site]:
+                contenu[site] = dict(passwords_data[site].items())
+        modifies: Dict[int, Optional[List[str]]] = {}
+        with core.mesurer_phase("objets") as phase:
+            ecrits = 0
+            for seau, sites in contenus.items():
+                actuel = self._carte.get(seau)
+                if not sites:
+                    if actuel is not None:
+                        modifies[seau] = None
+                    continue
+                signature = self._signature_scellee(sites)
+                if actuel is not None and actuel[1] == signature:
+                    continue
+                clair = json.dumps({site: {utilisateur: passwords_data.ouvrir(valeur) for utilisateur, valeur in utilisateurs.items()}
+                                    for site, utilisateurs in sites.items()}, sort_keys=True, separators=(",", ":")).encode('utf-8')
+                nom = hashlib.blake2b(clair, key=self._cle_noms, digest_size=16).hexdigest()
+                chemin = self._chemin_objet(nom)
+                if not os.path.exists(chemin): # Sinon contenu déjà connu (rescellé, ou valeur antérieure rétablie) : rien à écrire
+                    chiffre = self._fernet.encrypt(zlib.compress(clair))
+                    with open(chemin + ".tmp", "wb") as f_objet:
+                        f_objet.write(chiffre)
+                    os.replace(chemin + ".tmp", chemin)
+                    ecrits += len(chiffre)
+                modifies[seau] = [nom, signature]
+            phase["octets"] = ecrits
+        with self._verrou:
+            for seau, generation_sale in sales.items():
+                if generation_sale <= generation and self._sales.get(seau) == generation_sale:
+                    del self._sales[seau]
+        if not modifies:
+            return
+        numero = self.versions[-1].numero + 1 if self.versions else 1
+        seaux = modifies if self.versions else {seau: objet for seau, objet in modifies.items() if objet is not None}
+        version = Version(numero, time.time(), self.session.revision, seaux)
+        version.jeton = self._fernet.encrypt(json.dumps({"v": numero, "t": round(version.horodatage, 3), "r": version.revision,
+                                                         "s": {str(seau): objet for seau, objet in seaux.items()}}).encode('utf-8'))
+        with open(self._chemin, "r+b") as f_versions:
+            f_versions.truncate(self._signature[1]) # Fin déchirée éventuelle
+            f_versions.seek(self._signature[1])
+            f_versions.write(version.jeton + b"\n")
+        self._signature = (self._signature[0], self._signature[1] + len(version.jeton) + 1)
+        self._appliquer(version)
+        self._elaguer()
+
+    def _chemin_objet(self, nom: str) -> str:
+        return os.path.join(self.dossier, DOSSIER_OBJETS, nom + EXTENSION)
+
+    def _elaguer(self):
+        """Fond les versions les plus anciennes dans la première, puis supprime les objets orphelins."""
+        limite = time.time() - JOURS_MAX * 86400
+        trop = len(self.versions) - 1 - VERSIONS_MAX
+        if trop < MARGE_ELAGAGE and (len(self.versions) < 2 or self.versions[1].horodatage >= limite):
+            return
+        fondues = max(trop, 0)
+        while fondues + 1 < len(self.versions) - 1 and self.versions[fondues + 1].horodatage < limite:
+            fondues += 1
+        if not fondues:
+            return
+        carte: Carte = {}
+        for version in self.versions[:fondues + 1]:
+            for seau, objet in version.seaux.items():
+                if objet is None:
+                    carte.pop(seau, None)
+                else:
+                    carte[seau] = objet
+        derniere = self.versions[fondues]
+        base = Version(derniere.numero, derniere.horodatage, derniere.revision, carte)
+        base.jeton = self._fernet.encrypt(json.dumps({"v": base.numero, "t": base.horodatage, "r": base.revision,
+                                                      "s": {str(seau): objet for seau, objet in carte.items()}}).encode('utf-8'))
+        self.versions = [base] + self.versions[fondues + 1:]
+        self._ecrire_journal(self._enveloppe(self.session.cle).encrypt(self._cle), [version.jeton for version in self.versions])
+        stat = os.stat(self._chemin)
+        self._signature = (stat.st_ino, stat.st_size)
+        utiles = {objet[0] + EXTENSION for version in self.versions for objet in version.seaux.values() if objet is not None}
+        dossier_objets = os.path.join(self.dossier, DOSSIER_OBJETS)
+        for nom in os.listdir(dossier_objets):
+            if nom not in utiles and nom.endswith(EXTENSION):
+                os.remove(os.path.join(dossier_objets, nom))
+        print(f"Historique élagué : {fondues} version(s) fondue(s), {len(self.versions)} conservée(s).")
+
+    def preparer_rotation(self, nouvelle_cle: bytes):
+        """Enveloppe aussi la clé de l'historique par `nouvelle_cle`, avant la bascule d'une rotation.
+
+        Si la rotation s'interrompt après la bascule, l'historique reste lisible avec la
+        nouvelle clé ; `renvelopper` retire ensuite l'ancienne enveloppe.
+        """
+        self._relire()
+        self._ecrire_journal(self._enveloppe(self.session.cle).encrypt(self._cle), [version.jeton for version in self.versions],
+                             self._enveloppe(nouvelle_cle).encrypt(self._cle))
+        stat = os.stat(self._chemin)
+        self._signature = (stat.st_ino, stat.st_size)
+
+    def renvelopper(self):
+        """Réenveloppe la clé de l'historique avec la clé de données actuelle de la session (après une rotation)."""
+        self._relire()
+        self._ecrire_journal(self._enveloppe(self.session.cle).encrypt(self._cle), [version.jeton for version in self.versions])
+        stat = os.stat(self._chemin)
+        self._signature = (stat.st_ino, stat.st_size)
+
+    # --- Lecture ---
+
+    def _lire_objet(self, nom: str) -> Dict[str, Dict[str, str]]:
+        try:
+            with open(self._chemin_objet(nom), "rb") as f_objet:
+                return json.loads(zlib.decompress(self._fernet.decrypt(f_objet.read())))
+        except FileNotFoundError:
+            return {} # Objet perdu (interruption avant son écriture) : version incomplète
+
+    def version(self, numero: int) -> Version:
+        for version in self.versions:
+            if version.numero == numero:
+                return version
+        anciennes = f" (plus anciennes : fondues dans la version {self.versions[0].numero})" if self.versions else ""
+        raise ValueError(f"Version {numero} introuvable{anciennes}.")
+
+    def _carte_a(self, numero: int) -> Carte:
+        self.version(numero)
+        carte: Carte = {}
+        for version in self.versions:
+            if version.numero > numero:
+                break
+            for seau, objet in version.seaux.items():
+                if objet is None:
+                    carte.pop(seau, None)
+                else:
+                    carte[seau] = objet
+        return carte
+
+    def etat(self, numero: int, nom_site: Optional[str] = None) -> core.PasswordData:
+        """Contenu en clair du coffre (ou du seul site `nom_site`) à la version `numero`."""
+        carte = self._carte_a(numero)
+        if nom_site is not None:
+            objet = carte.get(self._seau(nom_site))
+            sites = self._lire_objet(objet[0]) if objet is not None else {}
+            return {nom_site: sites[nom_site]} if nom_site in sites else {}
+        etat: core.PasswordData = {}
+        for objet in carte.values():
+            etat.update(self._lire_objet(objet[0]))
+        return etat
+
+    def historique_entree(self, nom_site: str, nom_utilisateur: str) -> List[Tuple[Version, Optional[str]]]:
+        """Valeurs successives d'une entrée : [(version où elle a pris cette valeur, mot de passe ou None si absente)]."""
+        seau = self._seau(nom_site)
+        valeurs = []
+        precedente = None
+        for version in self.versions:
+            if seau not in version.seaux:
+                continue
+            objet = version.seaux[seau]
+            valeur = self._lire_objet(objet[0]).get(nom_site, {}).get(nom_utilisateur) if objet is not None else None
+            if valeur != precedente:
+                valeurs.append((version, valeur))
+            precedente = valeur
+        return valeurs
+
+
+def activer(session: core.SessionCoffre, dossier: str = HISTORIQUE_DOSSIER) -> HistoriqueCoffre:
+    """Attache un historique à la session : chaque écriture suivante devient une version."""
+    historique = HistoriqueCoffre(session, dossier)
+    historique.ouvrir()
+    session.historique = historique
+    return historique
+
+
+@core.mesurer_operation("restauration_version")
+def restaurer(session: core.SessionCoffre, numero: int, nom_site: Optional[str] = None, nom_utilisateur: Optional[str] = None) -> int:
+    """Ramène le coffre, un site ou une entrée à la version `numero`.
+
+    Modifie les données vivantes (les entrées identiques ne sont pas touchées), sans
+    les écrire : à l'appelant de persister. La restauration devient elle-même une
+    nouvelle version à la prochaine écriture. Seuls les seaux qui diffèrent de la
+    version sont déchiffrés. Retourne le nombre d'entrées modifiées.
+    """
+    historique: HistoriqueCoffre = session.historique
+    historique._relire()
+    carte = historique._carte_a(numero)
+    donnees = session.passwords_data
+    actuels: Dict[int, Dict[str, Dict[str, str]]] = {}
+    if nom_site is not None:
+        seaux = {historique._seau(nom_site)}
+        actuels[historique._seau(nom_site)] = {nom_site: donnees[nom_site]} if donnees.get(nom_site) else {}
+    else:
+        seaux = set(carte)
+        for site, utilisateurs in donnees.items():
+            if utilisateurs:
+                actuels.setdefault(historique._seau(site), {})[site] = utilisateurs
+        seaux.update(actuels)
+    a_supprimer, a_ecrire = [], []
+    for seau in seaux:
+        objet, courant, dernier = carte.get(seau), actuels.get(seau, {}), historique._carte.get(seau)
+        if objet is None and not courant:
+            continue
+        if (objet is not None and dernier is not None and objet[0] == dernier[0] and courant
+                and dernier[1] == historique._signature_scellee(courant)):
+            continue # Seau inchangé depuis la dernière version, qui a le même contenu que la version visée
+        cible = historique._lire_objet(objet[0]) if objet is not None else {}
+        if nom_site is not None:
+            cible = {nom_site: cible[nom_site]} if nom_site in cible else {}
+        if nom_utilisateur is not None:
+            cible = {site: {u: v for u, v in utilisateurs.items() if u == nom_utilisateur} for site, utilisateurs in cible.items()}
+            courant = {site: {u: v for u, v in utilisateurs.items() if u == nom_utilisateur} for site, utilisateurs in courant.items()}
+        a_supprimer += [(site, utilisateur) for site, utilisateurs in courant.items() for utilisateur in utilisateurs
+                        if utilisateur not in cible.get(site, {})]
+        a_ecrire += [(site, utilisateur, mot_de_passe) for site, utilisateurs in cible.items() for utilisateur, mot_de_passe in utilisateurs.items()
+                     if core.recuperer_entree(donnees, site, utilisateur) != mot_de_passe]
+    if not a_supprimer and not a_ecrire:
+        return 0
+    with donnees.lot():
+        for site, utilisateur in a_supprimer:
+            core.supprimer_entree(donnees, site, utilisateur)
+        for site, utilisateur, mot_de_passe in a_ecrire:
+            core.ajouter_ou_modifier_entree(donnees, site, utilisateur, mot_de_passe)
+    print(f"Version {numero} restaurée : {len(a_ecrire)} entrée(s) rétablie(s), {len(a_supprimer)} supprimée(s).")
+    return len(a_ecrire) + len(a_supprimer)
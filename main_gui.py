@@ -1,28 +1,278 @@
+from __future__ import annotations # Annotations non évaluées : `core` n'est importé qu'après l'affichage
+
+import time
+STARTED = time.perf_counter() # Origine des durées de démarrage
+
 import customtkinter as ctk
 import tkinter as tk 
-import pyperclip 
-from tkinter import messagebox 
+import tkinter.font as tkfont
+import io
+import os
+from tkinter import filedialog, messagebox 
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
 
-import core_password_manager as core
-from typing import Optional, Tuple
+# Importés en arrière-plan pendant la saisie du mot de passe maître (voir `_load_modules`)
+core = pyperclip = history_pm = pieces_pm = None
 
 # Configuration de l'apparence (à faire une seule fois)
 ctk.set_appearance_mode("System") 
 ctk.set_default_color_theme("blue")
 
 
-class LoginWindow(ctk.CTk):
-    """Fenêtre de connexion pour entrer le mot de passe maître."""
-    def __init__(self):
-        super().__init__()
+class VaultWorker:
+    """Exécute les opérations du coffre (déverrouillage, sauvegarde) hors du thread Tk.
+
+    Un seul thread de travail : les tâches sont exécutées dans l'ordre de soumission,
+    donc deux sauvegardes ne peuvent jamais s'exécuter en même temps. Les résultats
+    sont rapatriés dans le thread Tk en sondant les `Future` via `after()`.
+    """
+    POLL_MS = 50
+
+    def __init__(self, widget: tk.Misc):
+        self._widget = widget
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bigkey-io")
+        self._pending: List[Tuple[Future, Optional[Callable], Optional[Callable]]] = []
+        self._poll_id = None
+
+    @property
+    def busy(self) -> bool:
+        """Vrai tant qu'une tâche soumise n'a pas rendu son résultat au thread Tk."""
+        return bool(self._pending)
+
+    def submit(self, fn: Callable, *args, on_done: Optional[Callable] = None, on_error: Optional[Callable] = None) -> Future:
+        """Soumet `fn(*args)` ; `on_done(result)` / `on_error(exc)` sont appelés dans le thread Tk."""
+        future = self._executor.submit(fn, *args)
+        self._pending.append((future, on_done, on_error))
+        if self._poll_id is None:
+            self._poll_id = self._widget.after(self.POLL_MS, self._poll)
+        return future
+
+    def _poll(self):
+        self._poll_id = None
+        finished = [item for item in self._pending if item[0].done()]
+        self._pending = [item for item in self._pending if not item[0].done()]
+        for future, on_done, on_error in finished:
+            exc = future.exception()
+            if exc is not None:
+                if on_error:
+                    on_error(exc)
+                else:
+                    print(f"Erreur en arrière-plan: {exc}")
+            elif on_done:
+                on_done(future.result())
+        if self._pending and self._widget.winfo_exists():
+            self._poll_id = self._widget.after(self.POLL_MS, self._poll)
+
+    def shutdown(self, wait: bool = True):
+        """Arrête le thread de travail (attend la fin des tâches en cours par défaut)."""
+        if self._poll_id is not None:
+            self._widget.after_cancel(self._poll_id)
+            self._poll_id = None
+        self._executor.shutdown(wait=wait)
+
+
+class VirtualListbox(ctk.CTkFrame):
+    """Liste triée virtualisée : seules les lignes visibles du modèle sont rendues.
+
+    Le modèle est une `core.ListeTriee`. Les mises à jour se font par différences
+    (`insert_item`, `remove_item`, `move_item`), la position d'un élément est son
+    rang dans le modèle et le rendu ne lit que la tranche visible : rafraîchir après
+    une modification coûte O(log n) plus le rendu des lignes visibles, quelle que
+    soit la taille du modèle.
+    """
+    WHEEL_ROWS = 3
+
+    def __init__(self, master, on_select: Callable[[Optional[str]], None], **listbox_options):
+        super().__init__(master, fg_color="transparent")
+        self.grid_rowconfigure(0, weight=1)
+        self.grid_columnconfigure(0, weight=1)
 
-        self.title("Déverrouiller Big Key")
-        self.geometry("380x220")
-        self.resizable(False, False)
-        self.passwords_data = None
+        self._rows = core.ListeTriee()
+        self._top = 0
+        self._selected: Optional[str] = None
+        self._on_select = on_select
+
+        self.listbox = tk.Listbox(self, exportselection=False, activestyle="none", **listbox_options)
+        self.listbox.grid(row=0, column=0, sticky="nsew")
+        self.scrollbar = ctk.CTkScrollbar(self, command=self._on_scrollbar)
+        self.scrollbar.grid(row=0, column=1, sticky="ns")
+
+        self._row_height = tkfont.Font(font=self.listbox.cget("font")).metrics("linespace") + 1
+        self.listbox.bind("<<ListboxSelect>>", self._on_listbox_select)
+        self.listbox.bind("<Configure>", lambda event: self._render())
+        self.listbox.bind("<MouseWheel>", self._on_mousewheel)
+        self.listbox.bind("<Button-4>", lambda event: self.scroll(-self.WHEEL_ROWS))
+        self.listbox.bind("<Button-5>", lambda event: self.scroll(self.WHEEL_ROWS))
+        self.listbox.bind("<Up>", lambda event: self._select_relative(-1))
+        self.listbox.bind("<Down>", lambda event: self._select_relative(1))
+
+    # --- Modèle ---
+
+    @property
+    def selected(self) -> Optional[str]:
+        return self._selected
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, item: str) -> bool:
+        return item in self._rows
+
+    def index_of(self, item: str) -> Optional[int]:
+        """Position de `item` dans le modèle, ou None s'il n'y figure pas."""
+        return self._rows.rang(item)
+
+    def set_items(self, items: List[str]):
+        """Remplace tout le modèle (`items` doit être trié) ; la sélection est perdue."""
+        self._rows = core.ListeTriee(items, trie=True)
+        self._top = 0
+        self._selected = None
+        self._render()
+
+    def insert_item(self, item: str):
+        """Insère `item` à sa place dans l'ordre trié."""
+        if not self._rows.ajouter(item):
+            return
+        index = self._rows.rang(item)
+        if index < self._top:
+            self._top += 1 # Garde les mêmes lignes à l'écran
+        self._render()
+
+    def remove_item(self, item: str):
+        """Retire `item` (et la sélection s'il était sélectionné)."""
+        index = self.index_of(item)
+        if index is None:
+            return
+        self._rows.retirer(item)
+        if item == self._selected:
+            self._selected = None
+        if index < self._top:
+            self._top -= 1
+        self._render()
+
+    def move_item(self, old: str, new: str):
+        """Renomme une ligne en conservant la sélection."""
+        was_selected = old == self._selected
+        self.remove_item(old)
+        self.insert_item(new)
+        if was_selected:
+            self.select(new)
+
+    # --- Sélection et défilement ---
+
+    def select(self, item: str, see: bool = True):
+        """Sélectionne `item` sans déclencher `on_select`."""
+        index = self.index_of(item)
+        if index is None:
+            return
+        self._selected = item
+        if see:
+            self.see(index)
+        self._render()
+
+    def clear_selection(self):
+        self._selected = None
+        self.listbox.selection_clear(0, "end")
+
+    def see(self, index: int):
+        visible = self._visible_rows()
+        if index < self._top:
+            self._top = index
+        elif index >= self._top + visible:
+            self._top = index - visible + 1
+        self._clamp_top()
+
+    def scroll(self, delta: int):
+        self._top += delta
+        self._clamp_top()
+        self._render()
+        return "break"
+
+    def _visible_rows(self) -> int:
+        height = self.listbox.winfo_height()
+        if height <= 1: # Pas encore affiché
+            height = int(self.listbox.cget("height")) * self._row_height
+        return max(1, height // self._row_height)
+
+    def _clamp_top(self):
+        self._top = max(0, min(self._top, len(self._rows) - self._visible_rows()))
+
+    def _render(self):
+        """Ne rend que la fenêtre visible du modèle (une ligne de plus pour la ligne partielle)."""
+        self._clamp_top()
+        window = list(self._rows.tranche(self._top, self._top + self._visible_rows() + 1))
+        self.listbox.delete(0, "end")
+        if window:
+            self.listbox.insert("end", *window)
+        if self._selected is not None:
+            index = self.index_of(self._selected)
+            if index is not None and self._top <= index < self._top + len(window):
+                self.listbox.selection_set(index - self._top)
+        if self._rows:
+            self.scrollbar.set(self._top / len(self._rows), min(1.0, (self._top + len(window)) / len(self._rows)))
+        else:
+            self.scrollbar.set(0.0, 1.0)
+
+    def _on_scrollbar(self, action: str, value, unit: Optional[str] = None):
+        if action == "moveto":
+            self._top = int(float(value) * len(self._rows))
+        elif action == "scroll":
+            step = self._visible_rows() if unit == "pages" else self.WHEEL_ROWS
+            self._top += step if float(value) > 0 else -step
+        self._clamp_top()
+        self._render()
+
+    def _on_mousewheel(self, event):
+        return self.scroll(-self.WHEEL_ROWS if event.delta > 0 else self.WHEEL_ROWS)
+
+    def _on_listbox_select(self, event=None):
+        selected_indices = self.listbox.curselection()
+        self._selected = self._rows[self._top + selected_indices[0]] if selected_indices else None
+        self._on_select(self._selected)
+
+    def _select_relative(self, step: int):
+        if not self._rows:
+            return "break"
+        current = self.index_of(self._selected) if self._selected is not None else None
+        index = 0 if current is None else max(0, min(len(self._rows) - 1, current + step))
+        self.select(self._rows[index])
+        self._on_select(self._selected)
+        return "break"
+
+
+def _load_modules():
+    """Importe le cœur, `cryptography` et les modules de la fenêtre principale (thread de travail).
+
+    Rien de tout cela n'est nécessaire pour afficher la saisie du mot de passe maître :
+    ces imports se font pendant que l'utilisateur tape.
+    """
+    global core, pyperclip, history_pm, pieces_pm
+    import core_password_manager as core
+    core._charger_crypto()
+    import historique_password_manager as history_pm
+    import pieces_password_manager as pieces_pm
+    import pyperclip
+
+
+def _prefetch_vault() -> core.Prechargement:
+    """Exécuté dans le thread de travail dès l'affichage : modules, puis fichiers du coffre."""
+    started = time.perf_counter()
+    _load_modules()
+    core.initialiser_stockage() # Crée le fichier de sel si besoin
+    prefetch = core.precharger_stockage()
+    print(f"Préchargement terminé en {(time.perf_counter() - started) * 1000:.0f} ms.")
+    return prefetch
+
+
+class LoginFrame(ctk.CTkFrame):
+    """Saisie du mot de passe maître, affichée dans la fenêtre principale avant le déverrouillage."""
+    def __init__(self, parent, worker: VaultWorker, on_unlocked: Callable[[core.SessionCoffre], None]):
+        super().__init__(parent, fg_color="transparent")
+        self.worker = worker
+        self.on_unlocked = on_unlocked
         self.master_password = None
-
-        self._center_window()
+        self._unlocking = False
 
         self.grid_columnconfigure(0, weight=1)
 
@@ -40,21 +290,16 @@ class LoginWindow(ctk.CTk):
         self.status_label = ctk.CTkLabel(self, text="", text_color="red")
         self.status_label.grid(row=3, column=0, padx=20, pady=(0, 10))
 
-        # Initialiser le stockage (crée le fichier de sel si besoin)
-        try:
-            core.initialiser_stockage()
-        except Exception as e:
-            self.status_label.configure(text=f"Erreur init stockage: {e}")
-            self.login_button.configure(state="disabled") # Désactiver si erreur critique
+        self.progress_bar = ctk.CTkProgressBar(self, mode="indeterminate", width=300)
 
-    def _center_window(self):
-        """Centre la fenêtre sur l'écran."""
-        self.update_idletasks() # Assurer que les dimensions sont calculées
-        width = self.winfo_width()
-        height = self.winfo_height()
-        x = (self.winfo_screenwidth() // 2) - (width // 2)
-        y = (self.winfo_screenheight() // 2) - (height // 2)
-        self.geometry(f'{width}x{height}+{x}+{y}')
+        # Modules et fichiers du coffre chargés pendant la saisie ; le déverrouillage,
+        # soumis au même thread, passe forcément après.
+        self._prefetch = self.worker.submit(_prefetch_vault, on_error=self._on_prefetch_failed)
+        self.unlock_started: Optional[float] = None
+
+    def _on_prefetch_failed(self, e: Exception):
+        self.status_label.configure(text=f"Erreur init stockage: {e}")
+        self.login_button.configure(state="disabled") # Désactiver si erreur critique
 
     def _attempt_login(self, event=None):
         self.master_password = self.password_entry.get()
@@ -62,20 +307,52 @@ class LoginWindow(ctk.CTk):
             self.status_label.configure(text="Veuillez entrer un mot de passe.", text_color="orange")
             return
 
+        if self._unlocking:
+            return # Un déverrouillage est déjà en cours
+
+        self._unlocking = True
+        self.unlock_started = time.perf_counter()
+        self.status_label.configure(text="Déverrouillage...", text_color="gray")
+        self._set_busy(True)
+        self.worker.submit(self._unlock, self.master_password, self._prefetch,
+                           on_done=self._on_unlocked, on_error=self._on_unlock_failed)
+
+    @staticmethod
+    def _unlock(master_password: str, prefetch: Future) -> core.SessionCoffre:
+        """Exécuté dans le thread de travail : déverrouille (l'index de recherche attend la première recherche)."""
+        session = core.charger_ou_creer_stockage(master_password, prechargement=prefetch.result())
         try:
-            self.status_label.configure(text="Déverrouillage...", text_color="gray")
-            self.update_idletasks() # Mettre à jour l'UI
-            self.passwords_data = core.charger_ou_creer_stockage(self.master_password)
-            self.status_label.configure(text="Succès !", text_color="green")
-            self.after(500, self.destroy) # Fermer après un court délai
+            history_pm.activer(session) # Première ouverture : version initiale, encore sous la barre de progression
+        except (OSError, ValueError) as e:
+            print(f"AVERTISSEMENT: Historique indisponible : {e}")
+        return session
+
+    def _set_busy(self, busy: bool):
+        """Affiche la barre de progression et bloque la saisie pendant le déverrouillage."""
+        state = "disabled" if busy else "normal"
+        self.login_button.configure(state=state)
+        self.password_entry.configure(state=state)
+        if busy:
+            self.progress_bar.grid(row=4, column=0, padx=20, pady=(0, 10))
+            self.progress_bar.start()
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
+
+    def _on_unlocked(self, session: core.SessionCoffre):
+        self._set_busy(False)
+        self.on_unlocked(session)
 
-        except (ValueError, FileNotFoundError, IOError, Exception) as e:
-            error_message = str(e)
-            # Simplifier le message pour l'utilisateur si c'est une InvalidToken
-            if "Impossible de déchiffrer" in error_message:
-                 error_message = "Mot de passe incorrect ou données corrompues."
-            self.status_label.configure(text=error_message, text_color="red")
-            self.password_entry.delete(0, 'end') # Vider le champ
+    def _on_unlock_failed(self, e: Exception):
+        self._unlocking = False
+        self._set_busy(False)
+        error_message = str(e)
+        # Simplifier le message pour l'utilisateur si c'est une InvalidToken
+        if "Impossible de déchiffrer" in error_message:
+             error_message = "Mot de passe incorrect ou données corrompues."
+        self.status_label.configure(text=error_message, text_color="red")
+        self.password_entry.delete(0, 'end') # Vider le champ
+        self.password_entry.focus()
 
 
 class AddEditDialog(ctk.CTkToplevel):
@@ -181,12 +458,259 @@ class AddEditDialog(ctk.CTkToplevel):
         self.destroy()
 
 
+class NoteDialog(ctk.CTkToplevel):
+    """Saisie ou modification d'une note sécurisée (titre et texte libre)."""
+    def __init__(self, parent, title: str = "", text: str = "", callback: Optional[Callable[[str, str], None]] = None):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title(f"Note : {title}" if title else "Nouvelle note sécurisée")
+        self.geometry("480x380")
+        self.callback = callback
+        self.grid_columnconfigure(1, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+
+        ctk.CTkLabel(self, text="Titre:").grid(row=0, column=0, padx=(20, 5), pady=10, sticky="w")
+        self.title_entry = ctk.CTkEntry(self)
+        self.title_entry.grid(row=0, column=1, padx=(0, 20), pady=10, sticky="ew")
+        self.title_entry.insert(0, title)
+
+        self.textbox = ctk.CTkTextbox(self, wrap="word")
+        self.textbox.grid(row=1, column=0, columnspan=2, padx=20, pady=(0, 10), sticky="nsew")
+        self.textbox.insert("1.0", text)
+
+        button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        button_frame.grid(row=2, column=0, columnspan=2, pady=(0, 15))
+        ctk.CTkButton(button_frame, text="Sauvegarder", command=self._save).pack(side="left", padx=10)
+        ctk.CTkButton(button_frame, text="Annuler", command=self.destroy, fg_color="gray").pack(side="left", padx=10)
+        (self.textbox if title else self.title_entry).focus()
+        self.grab_set()
+
+    def _save(self):
+        title = self.title_entry.get().strip()
+        if not title:
+            messagebox.showwarning("Champ manquant", "Le titre de la note est requis.", parent=self)
+            return
+        if self.callback:
+            self.callback(title, self.textbox.get("1.0", "end-1c"))
+        self.destroy()
+
+
+class DiagnosticsWindow(ctk.CTkToplevel):
+    """Panneau de diagnostic : durées et tailles par phase des dernières opérations du coffre."""
+    REFRESH_MS = 1000
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title("Diagnostics")
+        self.geometry("640x420")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(1, weight=1)
+        self._shown_count = None
+        self._last_shown = None
+
+        top_frame = ctk.CTkFrame(self, fg_color="transparent")
+        top_frame.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.enabled_var = tk.BooleanVar(value=core.mesures_actives())
+        ctk.CTkSwitch(top_frame, text="Mesurer les opérations", variable=self.enabled_var,
+                      command=self._toggle_metrics).pack(side="left")
+        ctk.CTkButton(top_frame, text="Effacer", width=80, command=self._clear).pack(side="right")
+
+        self.textbox = ctk.CTkTextbox(self, font=("Courier", 12), wrap="none")
+        self.textbox.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="nsew")
+        self._refresh()
+
+    def _toggle_metrics(self):
+        if self.enabled_var.get():
+            core.activer_mesures(os.environ.get(core.METRIQUES_ENV))
+        else:
+            core.desactiver_mesures()
+        self._shown_count = None
+        self._refresh()
+
+    def _clear(self):
+        core.effacer_mesures()
+        self._shown_count = None
+        self._refresh()
+
+    def _refresh(self):
+        """Réaffiche l'historique s'il a changé, puis se replanifie tant que la fenêtre est ouverte."""
+        operations = core.dernieres_mesures()
+        if len(operations) != self._shown_count or (operations and operations[-1] is not self._last_shown):
+            self._shown_count = len(operations)
+            self._last_shown = operations[-1] if operations else None
+            self.textbox.configure(state="normal")
+            self.textbox.delete("1.0", "end")
+            self.textbox.insert("1.0", self._format(operations))
+            self.textbox.configure(state="disabled")
+        self.after(self.REFRESH_MS, self._refresh)
+
+    @staticmethod
+    def _format(operations: List[dict]) -> str:
+        if not core.mesures_actives() and not operations:
+            return (f"Mesures désactivées. Activez-les ci-dessus, ou lancez l'application avec "
+                    f"{core.METRIQUES_ENV}=<fichier.jsonl> pour inclure le déverrouillage.")
+        lines = []
+        for operation in reversed(operations): # Plus récente en premier
+            moment = time.strftime("%H:%M:%S", time.localtime(operation["horodatage"]))
+            lines.append(f"{moment}  {operation['operation']:<16}{operation['duree_ms']:>10.1f} ms"
+                         + (f"  ÉCHEC ({operation['erreur']})" if "erreur" in operation else ""))
+            for phase in operation["phases"]:
+                size = f"{phase['octets'] / 1024:>10.1f} Kio" if "octets" in phase else ""
+                lines.append(f"          {phase['phase']:<16}{phase['duree_ms']:>10.1f} ms{size}")
+        return "\n".join(lines)
+
+
+class AuditWindow(ctk.CTkToplevel):
+    """Résultats de l'audit (mots de passe faibles, réutilisés, compromis), mis à jour pendant l'analyse."""
+    REFRESH_MS = 500
+
+    def __init__(self, parent, audit, choose_breach_file: Callable[[], None]):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title("Audit des mots de passe")
+        self.geometry("680x460")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(2, weight=1)
+        self.audit = audit
+        self._shown_generation = None
+
+        top_frame = ctk.CTkFrame(self, fg_color="transparent")
+        top_frame.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="ew")
+        self.summary_label = ctk.CTkLabel(top_frame, text="", anchor="w")
+        self.summary_label.pack(side="left", fill="x", expand=True)
+        ctk.CTkButton(top_frame, text="Fichier de fuites...", width=140, command=choose_breach_file).pack(side="right")
+
+        self.progress_bar = ctk.CTkProgressBar(self)
+        self.progress_bar.grid(row=1, column=0, padx=10, pady=(0, 5), sticky="ew")
+        self.textbox = ctk.CTkTextbox(self, font=("Courier", 12), wrap="none")
+        self.textbox.grid(row=2, column=0, padx=10, pady=(0, 10), sticky="nsew")
+        self._refresh()
+
+    def _refresh(self):
+        """Réaffiche le rapport si l'audit a avancé, puis se replanifie tant que la fenêtre est ouverte."""
+        if self.audit.generation != self._shown_generation:
+            self._shown_generation = self.audit.generation
+            report = self.audit.rapport()
+            lines = str(report).split("\n")
+            self.summary_label.configure(text=lines[0])
+            self.progress_bar.set(report.analysees / report.total if report.total else 1)
+            self.textbox.configure(state="normal")
+            self.textbox.delete("1.0", "end")
+            self.textbox.insert("1.0", "\n".join(line.strip() for line in lines[1:]) or "Rien à signaler.")
+            self.textbox.configure(state="disabled")
+        self.after(self.REFRESH_MS, self._refresh)
+
+
+class HistoryWindow(ctk.CTkToplevel):
+    """Versions enregistrées d'une entrée, avec restauration de l'une d'elles."""
+
+    def __init__(self, parent, session: core.SessionCoffre, site: str, user: str, on_restore: Callable[[int, str, str], None]):
+        super().__init__(parent)
+        self.transient(parent)
+        self.title(f"Historique : {user} sur {site}")
+        self.geometry("520x360")
+        self.grid_columnconfigure(0, weight=1)
+        self.grid_rowconfigure(0, weight=1)
+        self.site, self.user = site, user
+        self.on_restore = on_restore
+        self.version_var = tk.IntVar(value=0)
+        self.password_visible = False
+
+        self.versions_frame = ctk.CTkScrollableFrame(self)
+        self.versions_frame.grid(row=0, column=0, padx=10, pady=(10, 5), sticky="nsew")
+        self.versions = session.historique.historique_entree(site, user)
+        self.radio_buttons = []
+        for version, value in reversed(self.versions): # Plus récente en premier
+            button = ctk.CTkRadioButton(self.versions_frame, text="", variable=self.version_var, value=version.numero)
+            button.pack(anchor="w", pady=2)
+            self.radio_buttons.append((button, version, value))
+        self._render()
+
+        button_frame = ctk.CTkFrame(self, fg_color="transparent")
+        button_frame.grid(row=1, column=0, padx=10, pady=(0, 10), sticky="ew")
+        ctk.CTkButton(button_frame, text="👁", width=30, command=self._toggle_passwords).pack(side="left")
+        ctk.CTkButton(button_frame, text="Restaurer cette version", command=self._restore).pack(side="right")
+
+    def _render(self):
+        for button, version, value in self.radio_buttons:
+            moment = time.strftime("%Y-%m-%d %H:%M", time.localtime(version.horodatage))
+            shown = "(supprimée)" if value is None else (value if self.password_visible else MainWindow.PASSWORD_PLACEHOLDER)
+            button.configure(text=f"{version.numero:>5}   {moment}   {shown}")
+
+    def _toggle_passwords(self):
+        self.password_visible = not self.password_visible
+        self._render()
+
+    def _restore(self):
+        version = self.version_var.get()
+        if not version:
+            return
+        self.on_restore(version, self.site, self.user)
+        self.destroy()
+
+
 class MainWindow(ctk.CTk):
     """Fenêtre principale du gestionnaire de mots de passe."""
-    def __init__(self, passwords_data: core.PasswordData, master_password: str):
+    AUTOSAVE_DELAY_MS = 1500      # Pause sans modification avant la sauvegarde automatique
+    AUTOSAVE_MAX_DELAY_MS = 10000 # Délai maximal pendant une longue rafale de modifications
+    EXTERNAL_CHECK_MS = 3000      # Intervalle de détection des écritures d'autres processus
+    EXTERNAL_CHECK_MAX_MS = 60000 # Intervalle maximal après des erreurs de lecture répétées
+
+    def __init__(self, session: Optional[core.SessionCoffre] = None, autosave_delay_ms: Optional[int] = None):
+        """Sans `session`, la fenêtre commence par la saisie du mot de passe maître (`LoginFrame`).
+
+        La même fenêtre Tk sert ensuite au coffre : rien n'est détruit ni recréé au déverrouillage.
+        """
         super().__init__()
-        self.passwords = passwords_data
-        self.master_password = master_password
+        self.autosave_delay_ms = self.AUTOSAVE_DELAY_MS if autosave_delay_ms is None else autosave_delay_ms
+        self.worker = VaultWorker(self)
+        self.session: Optional[core.SessionCoffre] = None
+        self._login_frame: Optional[LoginFrame] = None
+        if session is not None:
+            self._open_vault(session)
+            return
+
+        self.title("Déverrouiller Big Key")
+        self.geometry("380x220")
+        self.resizable(False, False)
+        self._center_window()
+        self.grid_columnconfigure(0, weight=1)
+        self._login_frame = LoginFrame(self, self.worker, self._open_vault)
+        self._login_frame.grid(row=0, column=0, sticky="nsew")
+        self.protocol("WM_DELETE_WINDOW", self._close_login)
+        self.after_idle(self._report_window_shown)
+
+    def _center_window(self):
+        """Centre la fenêtre sur l'écran."""
+        self.update_idletasks() # Assurer que les dimensions sont calculées
+        width = self.winfo_width()
+        height = self.winfo_height()
+        x = (self.winfo_screenwidth() // 2) - (width // 2)
+        y = (self.winfo_screenheight() // 2) - (height // 2)
+        self.geometry(f'{width}x{height}+{x}+{y}')
+
+    def _report_window_shown(self):
+        self._window_shown_ms = (time.perf_counter() - STARTED) * 1000
+        print(f"Fenêtre de connexion affichée en {self._window_shown_ms:.0f} ms.")
+
+    def _close_login(self):
+        self.worker.shutdown(wait=False)
+        self.destroy()
+
+    def _open_vault(self, session: core.SessionCoffre):
+        """Remplace la saisie du mot de passe par le contenu du coffre, dans la même fenêtre."""
+        unlock_started = unlock_done = None
+        if self._login_frame is not None:
+            unlock_started, unlock_done = self._login_frame.unlock_started, time.perf_counter()
+            self._login_frame.destroy()
+            self._login_frame = None
+            self.grid_columnconfigure(0, weight=0)
+            self.resizable(True, True)
+        self.session = session
+        self.passwords = session.passwords_data
+        self.attachments = pieces_pm.activer(session) # Aucune lecture : les pièces ne sont ouvertes qu'à la demande
+        self.attachment_worker = VaultWorker(self) # Pièces lues et écrites hors du thread des sauvegardes
 
         self.title("Big Key")
         self.geometry("900x600")
@@ -195,6 +719,11 @@ class MainWindow(ctk.CTk):
         self.selected_site: Optional[str] = None
         self.selected_user: Optional[str] = None
         self.password_visible = False
+        self._save_in_flight = False
+        self._save_requested = False
+        self._closing = False
+        self._autosave_after_id = None
+        self._dirty_since: Optional[float] = None
 
         # --- Configuration du Layout Principal (3 colonnes) ---
         self.grid_columnconfigure(0, weight=1, minsize=200) # Liste sites
@@ -208,17 +737,37 @@ class MainWindow(ctk.CTk):
         self._create_user_list_frame()
         self._create_details_frame()
         self._create_action_buttons()
+        self._create_status_bar()
 
         # --- Chargement initial ---
         self._populate_site_list()
+        if isinstance(self.passwords, core.DonneesCoffre):
+            self.passwords.ecouteurs.append(self._on_vault_changed) # Listes mises à jour par différence
 
         # --- Gestion de la fermeture ---
         self.protocol("WM_DELETE_WINDOW", self._on_closing)
+        self._external_check_ms = self.EXTERNAL_CHECK_MS # Allongé tant que la relecture échoue (OSError)
+        self._sync_error_reported = False
+        self._sync_stopped = False # La clé n'ouvre plus le coffre (rotation ailleurs) : plus de sondage
+        self.after(self._external_check_ms, self._check_external_changes)
+        if unlock_started is not None:
+            self.update_idletasks() # Liste des sites dessinée
+            self._report_unlocked(unlock_started, unlock_done, time.perf_counter())
+
+    def _report_unlocked(self, unlock_started: float, unlock_done: float, list_shown: float):
+        """Durées de démarrage : affichage de la connexion, déverrouillage, puis liste des sites."""
+        phases = {"fenetre": getattr(self, "_window_shown_ms", 0.0),
+                  "deverrouillage": (unlock_done - unlock_started) * 1000,
+                  "liste": (list_shown - unlock_done) * 1000}
+        print(f"Coffre affiché {(list_shown - unlock_started) * 1000:.0f} ms après la validation du mot de passe "
+              f"(déverrouillage {phases['deverrouillage']:.0f} ms, liste {phases['liste']:.0f} ms).")
+        core.noter_operation("demarrage_gui", phases)
 
     def _create_search_bar(self):
         """Crée la barre de recherche en haut."""
         self.search_var = tk.StringVar()
-        self.search_var.trace_add("write", lambda *args: self._filter_sites())
+        self._search_after_id = None
+        self.search_var.trace_add("write", lambda *args: self._schedule_filter())
         search_entry = ctk.CTkEntry(self, placeholder_text="Rechercher un site...", textvariable=self.search_var)
         search_entry.grid(row=0, column=0, padx=10, pady=10, sticky="ew")
 
@@ -229,12 +778,12 @@ class MainWindow(ctk.CTk):
         site_list_frame.grid_rowconfigure(0, weight=1)
         site_list_frame.grid_columnconfigure(0, weight=1)
 
-        self.site_listbox = tk.Listbox(site_list_frame, background=self._get_widget_bg_color(), fg=self._get_widget_fg_color(),
-                                       borderwidth=0, highlightthickness=0, exportselection=False,
-                                       selectbackground=ctk.ThemeManager.theme["CTkButton"]["fg_color"][0], # Utilise la couleur du bouton pour la sélection
-                                       selectforeground=ctk.ThemeManager.theme["CTkButton"]["text_color"][0])
-        self.site_listbox.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        self.site_listbox.bind("<<ListboxSelect>>", self._on_site_selected)
+        self.site_list = VirtualListbox(site_list_frame, on_select=self._on_site_selected,
+                                        background=self._get_widget_bg_color(), fg=self._get_widget_fg_color(),
+                                        borderwidth=0, highlightthickness=0,
+                                        selectbackground=ctk.ThemeManager.theme["CTkButton"]["fg_color"][0], # Utilise la couleur du bouton pour la sélection
+                                        selectforeground=ctk.ThemeManager.theme["CTkButton"]["text_color"][0])
+        self.site_list.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
         
 
     def _create_user_list_frame(self):
@@ -244,12 +793,12 @@ class MainWindow(ctk.CTk):
         user_list_frame.grid_rowconfigure(0, weight=1)
         user_list_frame.grid_columnconfigure(0, weight=1)
 
-        self.user_listbox = tk.Listbox(user_list_frame, background=self._get_widget_bg_color(), fg=self._get_widget_fg_color(),
-                                       borderwidth=0, highlightthickness=0, exportselection=False,
-                                       selectbackground=ctk.ThemeManager.theme["CTkButton"]["fg_color"][0],
-                                       selectforeground=ctk.ThemeManager.theme["CTkButton"]["text_color"][0])
-        self.user_listbox.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
-        self.user_listbox.bind("<<ListboxSelect>>", self._on_user_selected)
+        self.user_list = VirtualListbox(user_list_frame, on_select=self._on_user_selected,
+                                        background=self._get_widget_bg_color(), fg=self._get_widget_fg_color(),
+                                        borderwidth=0, highlightthickness=0,
+                                        selectbackground=ctk.ThemeManager.theme["CTkButton"]["fg_color"][0],
+                                        selectforeground=ctk.ThemeManager.theme["CTkButton"]["text_color"][0])
+        self.user_list.grid(row=0, column=0, sticky="nsew", padx=5, pady=5)
 
     def _create_details_frame(self):
         """Crée le cadre pour afficher les détails de l'entrée."""
@@ -286,25 +835,261 @@ class MainWindow(ctk.CTk):
         self.edit_button.pack(side="left", padx=10)
         self.delete_button = ctk.CTkButton(entry_action_frame, text="Supprimer", fg_color="#D32F2F", hover_color="#C62828", command=self._delete_selected_entry, state="disabled")
         self.delete_button.pack(side="left", padx=10)
+        self.history_button = ctk.CTkButton(entry_action_frame, text="Historique", fg_color="gray", command=self._open_history, state="disabled")
+        self.history_button.pack(side="left", padx=10)
+        self._history_window = None
+
+        # Pièces jointes : la liste vient des références du coffre, le contenu n'est lu qu'à l'ouverture
+        ctk.CTkLabel(self.details_frame, text="Pièces jointes:", anchor="w").grid(row=4, column=0, padx=10, pady=5, sticky="nw")
+        self.attachment_list = tk.Listbox(self.details_frame, height=5, activestyle="none", exportselection=False,
+                                          borderwidth=0, highlightthickness=0,
+                                          bg=self._get_widget_bg_color(), fg=self._get_widget_fg_color())
+        self.attachment_list.grid(row=4, column=1, columnspan=2, padx=(5, 10), pady=5, sticky="nsew")
+        self.attachment_list.bind("<Double-Button-1>", lambda _event: self._open_attachment())
+        self._attachments_shown: List[dict] = []
+        attachment_action_frame = ctk.CTkFrame(self.details_frame, fg_color="transparent")
+        attachment_action_frame.grid(row=5, column=0, columnspan=3, pady=(0, 10))
+        self.attach_file_button = ctk.CTkButton(attachment_action_frame, text="Joindre…", width=80, command=self._attach_file, state="disabled")
+        self.attach_file_button.pack(side="left", padx=5)
+        self.attach_note_button = ctk.CTkButton(attachment_action_frame, text="Note…", width=70, command=self._open_note_dialog, state="disabled")
+        self.attach_note_button.pack(side="left", padx=5)
+        self.open_attachment_button = ctk.CTkButton(attachment_action_frame, text="Ouvrir", width=70, command=self._open_attachment, state="disabled")
+        self.open_attachment_button.pack(side="left", padx=5)
+        self.detach_button = ctk.CTkButton(attachment_action_frame, text="Retirer", width=70, fg_color="gray", command=self._detach_attachment, state="disabled")
+        self.detach_button.pack(side="left", padx=5)
 
     def _create_action_buttons(self):
         """Crée les boutons d'action généraux (Ajouter)."""
         action_button_frame = ctk.CTkFrame(self, fg_color="transparent")
         action_button_frame.grid(row=0, column=1, columnspan=2, padx=10, pady=10, sticky="e")
 
+        self.diagnostics_button = ctk.CTkButton(action_button_frame, text="Diagnostics", width=100, fg_color="gray",
+                                                command=self._open_diagnostics)
+        self.diagnostics_button.pack(side="left", padx=(0, 10))
+        self.audit_button = ctk.CTkButton(action_button_frame, text="Audit", width=80, fg_color="gray",
+                                          command=self._open_audit)
+        self.audit_button.pack(side="left", padx=(0, 10))
         self.add_button = ctk.CTkButton(action_button_frame, text="＋ Ajouter une Entrée", command=self._open_add_dialog)
-        self.add_button.pack()
+        self.add_button.pack(side="left")
+        self._diagnostics_window = None
+        self._audit_window = None
+        self._audit = None
+
+    def _open_diagnostics(self):
+        """Ouvre le panneau de diagnostic (une seule instance)."""
+        if self._diagnostics_window is not None and self._diagnostics_window.winfo_exists():
+            self._diagnostics_window.focus()
+            return
+        self._diagnostics_window = DiagnosticsWindow(self)
+
+    def _open_audit(self):
+        """Ouvre les résultats de l'audit, démarré en arrière-plan à la première ouverture."""
+        if self._audit is None:
+            import audit_password_manager as audit_pm
+            breach_file = os.environ.get(audit_pm.FUITES_ENV)
+            self._start_audit(breach_file)
+        if self._audit_window is not None and self._audit_window.winfo_exists():
+            self._audit_window.focus()
+            return
+        self._audit_window = AuditWindow(self, self._audit, self._choose_breach_file)
 
-    
+    def _start_audit(self, breach_file: Optional[str]):
+        """(Re)démarre l'audit, avec le corpus de fuites `breach_file` s'il est lisible."""
+        import audit_password_manager as audit_pm
+        corpus = None
+        if breach_file:
+            try:
+                corpus = audit_pm.CorpusFuites(breach_file)
+            except (OSError, ValueError) as e:
+                messagebox.showwarning("Audit", f"Fuites non vérifiées : {e}", parent=self)
+        self._stop_audit()
+        self._audit = audit_pm.AuditCoffre(self.session.passwords_data, corpus)
+        self._audit.demarrer()
+
+    def _stop_audit(self):
+        if self._audit is not None:
+            self._audit.arreter()
+            if self._audit.corpus is not None:
+                self._audit.corpus.fermer()
+            self._audit = None
+
+    def _choose_breach_file(self):
+        breach_file = filedialog.askopenfilename(parent=self._audit_window, title="Fichier de fuites (format Big Key)")
+        if not breach_file:
+            return
+        self._start_audit(breach_file)
+        self._audit_window.audit = self._audit
+        self._audit_window.focus()
+
+
+    def _open_history(self):
+        """Ouvre les versions enregistrées de l'entrée sélectionnée."""
+        if not self.selected_site or not self.selected_user:
+            return
+        if self._history_window is not None and self._history_window.winfo_exists():
+            self._history_window.destroy()
+        self._history_window = HistoryWindow(self, self.session, self.selected_site, self.selected_user, self._restore_version)
+
+    def _restore_version(self, version: int, site: str, user: str):
+        try:
+            history_pm.restaurer(self.session, version, site, user)
+        except (OSError, ValueError) as e:
+            messagebox.showerror("Historique", f"Restauration impossible : {e}", parent=self)
+            return
+        self._save_storage_and_refresh(select_site=site, select_user=user)
+
+    def _create_status_bar(self):
+        """Crée la barre d'état (progression des sauvegardes en arrière-plan)."""
+        status_frame = ctk.CTkFrame(self, fg_color="transparent")
+        status_frame.grid(row=2, column=0, columnspan=3, padx=10, pady=(0, 10), sticky="ew")
+        status_frame.grid_columnconfigure(0, weight=1)
+
+        self.status_label = ctk.CTkLabel(status_frame, text="", anchor="w", text_color="gray")
+        self.status_label.grid(row=0, column=0, sticky="w")
+        self.progress_bar = ctk.CTkProgressBar(status_frame, mode="indeterminate", width=160)
+        self.progress_bar.grid(row=0, column=1, sticky="e")
+        self.progress_bar.grid_remove()
+
+    def _set_saving(self, saving: bool, message: str = ""):
+        """Affiche ou masque l'indicateur de sauvegarde."""
+        self.status_label.configure(text=message)
+        if saving:
+            self.progress_bar.grid()
+            self.progress_bar.start()
+        else:
+            self.progress_bar.stop()
+            self.progress_bar.grid_remove()
+
+    def _schedule_autosave(self):
+        """Sauvegarde différée : chaque modification repousse la sauvegarde.
+
+        Une rafale de modifications ne donne qu'une écriture, une fois
+        `autosave_delay_ms` écoulé sans nouvelle modification (au plus
+        `AUTOSAVE_MAX_DELAY_MS` après la première).
+        """
+        if self._autosave_after_id is not None:
+            self.after_cancel(self._autosave_after_id)
+        now = time.monotonic()
+        if self._dirty_since is None:
+            self._dirty_since = now
+        max_remaining_ms = self.AUTOSAVE_MAX_DELAY_MS - (now - self._dirty_since) * 1000
+        delay_ms = int(max(0, min(self.autosave_delay_ms, max_remaining_ms)))
+        self._autosave_after_id = self.after(delay_ms, self._autosave)
+        if not self._save_in_flight:
+            self.status_label.configure(text="Modifications non sauvegardées.")
+
+    def _cancel_autosave(self):
+        if self._autosave_after_id is not None:
+            self.after_cancel(self._autosave_after_id)
+            self._autosave_after_id = None
+        self._dirty_since = None
+
+    def _autosave(self):
+        self._autosave_after_id = None
+        self._dirty_since = None
+        self._request_save()
+
+    def _request_save(self):
+        """Lance une sauvegarde en arrière-plan (rien à faire si le coffre est propre).
+
+        En mode journal, seules les modifications sont ajoutées au journal ; un
+        instantané complet n'est pris que lorsque le journal doit être compacté.
+        Si une sauvegarde est déjà en cours, une seule nouvelle sauvegarde est
+        programmée pour son achèvement : elle écrira l'état le plus récent.
+        """
+        if self._save_in_flight:
+            self._save_requested = True
+            return
+        if not self.session.est_modifie:
+            self._on_save_done()
+            return
+        self._save_in_flight = True
+        self._save_requested = False
+        compacting = self.session.journal is None or self.session.doit_compacter()
+        # Jamais les données vivantes dans le thread de travail : la copie sert à l'historique,
+        # et d'instantané si un « lot » survenu entre-temps impose une réécriture complète.
+        copy = self.session.instantane()
+        self._set_saving(True, "Compaction..." if compacting and self.session.journal else "Sauvegarde...")
+        # Pas de fusion dans le thread de travail : un conflit revient ici (ConflitEcriture).
+        self.worker.submit(self.session.persister, copy if compacting else None, False, copy,
+                           on_done=self._on_save_done, on_error=self._on_save_failed)
+
+    def _on_save_done(self, _result=None):
+        self._save_in_flight = False
+        if self._save_requested:
+            self._request_save()
+        elif self._closing:
+            self._finish_closing()
+        else:
+            self._set_saving(False, "Sauvegardé.")
+
+    def _on_save_failed(self, e: Exception):
+        self._save_in_flight = False
+        if isinstance(e, core.ConflitEcriture) and self._merge_external_changes():
+            self._on_save_done() # La fusion a écrit le coffre
+            return
+        self._set_saving(False, "Échec de la sauvegarde.")
+        if self._closing:
+            if messagebox.askokcancel("Erreur de Sauvegarde", f"Impossible de sauvegarder les données avant de quitter:\n{e}\n\nVoulez-vous quitter quand même (les modifications non sauvegardées seront perdues) ?", parent=self):
+                self._finish_closing()
+            else:
+                self._closing = False
+                self.add_button.configure(state="normal")
+            return
+        messagebox.showerror("Erreur Sauvegarde", f"Une erreur est survenue lors de la sauvegarde: {e}", parent=self)
+        if self._save_requested:
+            self._request_save()
+
+    def _merge_external_changes(self) -> bool:
+        """Intègre les écritures d'un autre processus (dans le thread Tk). Retourne False en cas d'échec."""
+        if self._sync_stopped:
+            return False
+        try:
+            conflicts = self.session.synchroniser()
+        except ValueError as e:
+            self._sync_stopped = True
+            self._set_saving(False, "Synchronisation arrêtée.")
+            messagebox.showerror("Erreur Synchronisation", f"Le coffre a été modifié par un autre processus et ne s'ouvre plus avec la clé de cette session "
+                                 f"(mot de passe maître changé ?) : {e}\n\nFermez puis rouvrez le coffre.", parent=self)
+            return False
+        except Exception as e: # OSError le plus souvent : nouvel essai de plus en plus espacé, signalé une fois
+            self._external_check_ms = min(self._external_check_ms * 2, self.EXTERNAL_CHECK_MAX_MS)
+            if not self._sync_error_reported:
+                self._sync_error_reported = True
+                messagebox.showerror("Erreur Synchronisation", f"Impossible d'intégrer les modifications d'un autre processus: {e}", parent=self)
+            return False
+        self._external_check_ms = self.EXTERNAL_CHECK_MS
+        self._sync_error_reported = False
+        if conflicts:
+            names = "\n".join(f"{site} : {user} -> {copy}" for site, user, copy in conflicts)
+            messagebox.showwarning("Conflits", f"Des entrées ont été modifiées ailleurs en même temps. "
+                                   f"Votre version est gardée, l'autre est conservée sous un nouveau nom :\n{names}", parent=self)
+        self._set_saving(False, "Fusionné avec les modifications d'un autre processus.")
+        return True
+
+    def _check_external_changes(self):
+        """Sonde le disque : un coffre modifié ailleurs est relu (ou fusionné) sans attendre notre sauvegarde.
+
+        Rien n'est relu tant qu'une sauvegarde est programmée ou en cours : le thread de
+        travail peut écrire, et la sauvegarde fusionnera elle-même (ConflitEcriture).
+        """
+        if self._closing:
+            return
+        save_pending = self._save_in_flight or self._save_requested or self._autosave_after_id is not None
+        if not save_pending and self.session.disque_modifie():
+            self._merge_external_changes()
+        if not self._sync_stopped:
+            self.after(self._external_check_ms, self._check_external_changes)
 
     def _populate_site_list(self):
         """Remplit la liste des sites."""
-        self.site_listbox.delete(0, "end")
-        search_term = self.search_var.get().lower()
-        sites = core.lister_sites(self.passwords)
-        for site in sites:
-            if search_term in site.lower():
-                self.site_listbox.insert("end", site)
+        search_term = self.search_var.get()
+        if search_term:
+            sites = self.session.index_recherche.rechercher(search_term)
+        else:
+            sites = core.lister_sites(self.passwords)
+        self.site_list.set_items(sites)
+        self.selected_site = None
         self._clear_user_list()
         self._clear_details()
 
@@ -312,22 +1097,29 @@ class MainWindow(ctk.CTk):
         """Remplit la liste des utilisateurs pour le site sélectionné."""
         self._clear_user_list()
         if site:
-            users = core.recuperer_utilisateurs_pour_site(self.passwords, site)
-            for user in sorted(users):
-                self.user_listbox.insert("end", user)
+            self.user_list.set_items(core.recuperer_utilisateurs_pour_site(self.passwords, site)) # Déjà triés par l'index
         self._clear_details()
 
+    SEARCH_DEBOUNCE_MS = 120
+
+    def _schedule_filter(self):
+        """Diffère la recherche jusqu'à une pause de frappe ; annule la recherche précédente."""
+        if self._search_after_id is not None:
+            self.after_cancel(self._search_after_id)
+        self._search_after_id = self.after(self.SEARCH_DEBOUNCE_MS, self._filter_sites)
+
     def _filter_sites(self):
         """Met à jour la liste des sites basée sur la recherche."""
+        self._search_after_id = None
         self._populate_site_list()
 
     def _clear_site_selection(self):
-        self.site_listbox.selection_clear(0, 'end')
+        self.site_list.clear_selection()
         self.selected_site = None
         self._clear_user_list()
 
     def _clear_user_list(self):
-        self.user_listbox.delete(0, 'end')
+        self.user_list.set_items([])
         self.selected_user = None
         self._clear_details()
 
@@ -351,11 +1143,17 @@ class MainWindow(ctk.CTk):
         self.reveal_pass_button.configure(state="disabled")
         self.edit_button.configure(state="disabled")
         self.delete_button.configure(state="disabled")
+        self.history_button.configure(state="disabled")
+        self._show_attachments(None, None)
+
+    PASSWORD_PLACEHOLDER = "••••••••"
 
     def _show_entry_details(self, site: str, user: str):
-        """Affiche les détails de l'entrée sélectionnée."""
-        password = core.recuperer_entree(self.passwords, site, user)
-        if password is None:
+        """Affiche les détails de l'entrée sélectionnée.
+
+        Le mot de passe reste scellé : il n'est déchiffré qu'à l'affichage ou à la copie.
+        """
+        if not core.entree_existe(self.passwords, site, user):
             self._clear_details()
             return
 
@@ -366,10 +1164,12 @@ class MainWindow(ctk.CTk):
         self.user_details_entry.insert(0, user)
         self.user_details_entry.configure(state="readonly")
 
+        self.password_visible = False
+        self.reveal_pass_button.configure(text="👁")
         self.pass_details_entry.configure(state="normal")
         self.pass_details_entry.delete(0, "end")
-        self.pass_details_entry.insert(0, password)
-        self.pass_details_entry.configure(show="*" if not self.password_visible else "", state="readonly")
+        self.pass_details_entry.insert(0, self.PASSWORD_PLACEHOLDER)
+        self.pass_details_entry.configure(show="*", state="readonly")
 
         
         self.copy_user_button.configure(state="normal")
@@ -377,31 +1177,151 @@ class MainWindow(ctk.CTk):
         self.reveal_pass_button.configure(state="normal")
         self.edit_button.configure(state="normal")
         self.delete_button.configure(state="normal")
+        self.history_button.configure(state="normal" if self.session.historique is not None else "disabled")
+        self._show_attachments(site, user)
+
+    # --- Pièces jointes ---
+
+    def _show_attachments(self, site: Optional[str], user: Optional[str]):
+        """Liste les pièces jointes de l'entrée d'après ses références (aucune pièce n'est lue)."""
+        self._attachments_shown = core.recuperer_pieces_entree(self.passwords, site, user) if user else []
+        self.attachment_list.delete(0, "end")
+        for attachment in self._attachments_shown:
+            icon = "📝" if attachment["type"] == "note" else "📎"
+            self.attachment_list.insert("end", f"{icon} {attachment['nom']}  ({pieces_pm.formater_taille(attachment['taille'])})")
+        state = "normal" if user else "disabled"
+        self.attach_file_button.configure(state=state)
+        self.attach_note_button.configure(state=state)
+        state = "normal" if self._attachments_shown else "disabled"
+        self.open_attachment_button.configure(state=state)
+        self.detach_button.configure(state=state)
+
+    def _selected_attachment(self) -> Optional[dict]:
+        selection = self.attachment_list.curselection()
+        if not selection and len(self._attachments_shown) == 1:
+            return self._attachments_shown[0]
+        return self._attachments_shown[selection[0]] if selection else None
+
+    def _attach_file(self):
+        """Chiffre un fichier en arrière-plan, puis l'attache à l'entrée sélectionnée."""
+        if not self.selected_site or not self.selected_user:
+            return
+        path = filedialog.askopenfilename(parent=self, title="Joindre un fichier")
+        if path:
+            self._store_attachment(self.selected_site, self.selected_user, os.path.basename(path), "fichier", path)
+
+    def _open_note_dialog(self, attachment: Optional[dict] = None, text: str = ""):
+        """Nouvelle note sécurisée, ou affichage/modification d'une note existante."""
+        if not self.selected_site or not self.selected_user:
+            return
+        site, user = self.selected_site, self.selected_user
+        NoteDialog(self, title=attachment["nom"] if attachment else "", text=text,
+                   callback=lambda title, body: self._store_attachment(site, user, title, "note", body.encode('utf-8')))
+
+    def _store_attachment(self, site: str, user: str, name: str, kind: str, source):
+        """`source` : chemin d'un fichier, ou contenu (note). Seul le rattachement passe par le thread Tk."""
+        def store():
+            if isinstance(source, bytes):
+                return self.attachments.ajouter(io.BytesIO(source))
+            with open(source, "rb") as f_source:
+                return self.attachments.ajouter(f_source)
+
+        def attach(stored: dict):
+            try:
+                self.attachments.attacher(site, user, stored, name, kind)
+            except ValueError as e: # Entrée supprimée entre-temps
+                messagebox.showerror("Pièces jointes", str(e), parent=self)
+                return
+            self._set_saving(False)
+            self._save_storage_and_refresh(select_site=site, select_user=user)
+
+        self._set_saving(True, f"Chiffrement de « {name} »...")
+        self.attachment_worker.submit(store, on_done=attach, on_error=self._on_attachment_failed)
+
+    def _open_attachment(self):
+        """Note : déchiffrée en arrière-plan puis affichée. Fichier : déchiffré vers l'emplacement choisi."""
+        attachment = self._selected_attachment()
+        if attachment is None:
+            return
+        if attachment["type"] == "note":
+            self.attachment_worker.submit(self.attachments.lire_note, attachment,
+                                          on_done=lambda text: self._open_note_dialog(attachment, text),
+                                          on_error=self._on_attachment_failed)
+            return
+        path = filedialog.asksaveasfilename(parent=self, title="Enregistrer la pièce jointe", initialfile=attachment["nom"])
+        if not path:
+            return
+        self._set_saving(True, f"Déchiffrement de « {attachment['nom']} »...")
+        self.attachment_worker.submit(self.attachments.extraire, attachment["objet"], path,
+                                      on_done=lambda _size: self._set_saving(False, f"« {attachment['nom']} » enregistré."),
+                                      on_error=self._on_attachment_failed)
+
+    def _detach_attachment(self):
+        attachment = self._selected_attachment()
+        if attachment is None or not self.selected_site or not self.selected_user:
+            return
+        if not messagebox.askyesno("Confirmation", f"Retirer la pièce jointe « {attachment['nom']} » ?", parent=self):
+            return
+        site, user = self.selected_site, self.selected_user
+        if self.attachments.detacher(site, user, attachment["nom"]):
+            self._save_storage_and_refresh(select_site=site, select_user=user)
+
+    def _on_attachment_failed(self, e: Exception):
+        self._set_saving(False)
+        messagebox.showerror("Pièces jointes", f"Opération impossible : {e}", parent=self)
 
    
 
-    def _on_site_selected(self, event=None):
+    def _on_site_selected(self, site: Optional[str]):
         """Appelé quand un site est sélectionné dans la liste."""
-        selected_indices = self.site_listbox.curselection()
-        if not selected_indices:
+        if not site:
             self.selected_site = None
             self._clear_user_list()
             return
 
-        self.selected_site = self.site_listbox.get(selected_indices[0])
+        self.selected_site = site
         self._populate_user_list(self.selected_site)
 
-    def _on_user_selected(self, event=None):
+    def _on_user_selected(self, user: Optional[str]):
         """Appelé quand un utilisateur est sélectionné dans la liste."""
-        selected_indices = self.user_listbox.curselection()
-        if not selected_indices or not self.selected_site:
+        if not user or not self.selected_site:
             self.selected_user = None
             self._clear_details()
             return
             
-        self.selected_user = self.user_listbox.get(selected_indices[0])
+        self.selected_user = user
         self._show_entry_details(self.selected_site, self.selected_user)
 
+    def _matches_search(self, site: str) -> bool:
+        search_term = self.search_var.get().casefold()
+        return not search_term or search_term in site.casefold()
+
+    def _on_vault_changed(self, operation: str, site: str, user: Optional[str], _value: Optional[str]):
+        """Écouteur des données : applique la modification aux listes par différence."""
+        if operation == "lot": # Import en masse ou fusion : une seule reconstruction des listes
+            site, user = self.selected_site, self.selected_user
+            self._populate_site_list()
+            if site in self.site_list: # Garde la sélection si elle existe encore
+                self.site_list.select(site)
+                self._on_site_selected(site)
+                if user in self.user_list:
+                    self.user_list.select(user)
+                    self._on_user_selected(user)
+            return
+        if site in self.passwords:
+            if site not in self.site_list and self._matches_search(site):
+                self.site_list.insert_item(site)
+        elif site in self.site_list:
+            self.site_list.remove_item(site)
+
+        if site == self.selected_site:
+            if operation == "ajout":
+                self.user_list.insert_item(user)
+            elif operation == "suppression":
+                self.user_list.remove_item(user)
+            elif operation == "suppression_site":
+                self.user_list.set_items([])
+
 
     def _toggle_password_visibility(self):
         """Affiche ou masque le mot de passe dans le champ de détails."""
@@ -409,9 +1329,19 @@ class MainWindow(ctk.CTk):
             return
             
         self.password_visible = not self.password_visible
-        new_show = "" if self.password_visible else "*"
+        if self.password_visible:
+            try:
+                shown = core.recuperer_entree(self.passwords, self.selected_site, self.selected_user) or ""
+            except ValueError as e:
+                self.password_visible = False
+                messagebox.showerror("Erreur", str(e), parent=self)
+                return
+        else:
+            shown = self.PASSWORD_PLACEHOLDER # Ne garde pas le mot de passe en clair dans le widget
         self.pass_details_entry.configure(state="normal") 
-        self.pass_details_entry.configure(show=new_show)
+        self.pass_details_entry.delete(0, "end")
+        self.pass_details_entry.insert(0, shown)
+        self.pass_details_entry.configure(show="" if self.password_visible else "*")
         self.pass_details_entry.configure(state="readonly")
         
         self.reveal_pass_button.configure(text="🙈" if self.password_visible else "👁")
@@ -431,8 +1361,12 @@ class MainWindow(ctk.CTk):
     def _copy_password(self):
         """Copie le mot de passe dans le presse-papiers."""
         if self.selected_user and self.pass_details_entry.cget("state") != "disabled":
-            # Récupérer le mot de passe réel depuis les données, pas seulement l'affichage
-            password = core.recuperer_entree(self.passwords, self.selected_site, self.selected_user)
+            # Déchiffrer le mot de passe réel à la demande, pas seulement l'affichage
+            try:
+                password = core.recuperer_entree(self.passwords, self.selected_site, self.selected_user)
+            except ValueError as e:
+                messagebox.showerror("Erreur", str(e), parent=self)
+                return
             if password:
                 try:
                     pyperclip.copy(password)
@@ -455,7 +1389,7 @@ class MainWindow(ctk.CTk):
             site, username, password = result
             try:
                 # Vérifier si l'entrée existe déjà
-                if core.recuperer_entree(self.passwords, site, username) is not None:
+                if core.entree_existe(self.passwords, site, username):
                     if not messagebox.askyesno("Entrée existante", f"Une entrée pour '{username}' sur '{site}' existe déjà.\nVoulez-vous l'écraser ?", parent=self):
                         return # Annuler si l'utilisateur refuse
 
@@ -493,16 +1427,18 @@ class MainWindow(ctk.CTk):
                 
                 if entry_changed:
                     # Vérifier si la nouvelle combinaison existe déjà (et n'est pas l'entrée originale)
-                    existing_pass = core.recuperer_entree(self.passwords, new_site, new_username)
-                    if existing_pass is not None :
+                    if core.entree_existe(self.passwords, new_site, new_username):
                          if not messagebox.askyesno("Conflit d'entrée", f"Une entrée pour '{new_username}' sur '{new_site}' existe déjà.\nVoulez-vous l'écraser ?", parent=self):
                              return # Annuler si l'utilisateur refuse
                              
                     # Supprimer l'ancienne entrée avant d'ajouter la nouvelle pour éviter les conflits temporaires
+                    moved_attachments = core.recuperer_pieces_entree(self.passwords, original_site, original_user)
                     core.supprimer_entree(self.passwords, original_site, original_user)
 
                 # Ajouter/Mettre à jour avec les nouvelles informations
                 core.ajouter_ou_modifier_entree(self.passwords, new_site, new_username, new_password)
+                if entry_changed and moved_attachments: # Les pièces jointes suivent l'entrée renommée
+                    core.definir_pieces_entree(self.passwords, new_site, new_username, moved_attachments)
                 self._save_storage_and_refresh(select_site=new_site, select_user=new_username)
                 print("Entrée modifiée sauvegardée.")
             except Exception as e:
@@ -525,30 +1461,28 @@ class MainWindow(ctk.CTk):
                 messagebox.showerror("Erreur Suppression", f"Impossible de supprimer l'entrée: {e}", parent=self)
 
     def _save_storage_and_refresh(self, select_site: Optional[str] = None, select_user: Optional[str] = None):
-        """Sauvegarde le stockage et rafraîchit l'interface."""
+        """Programme la sauvegarde (différée, en arrière-plan) et rafraîchit l'interface.
+
+        Les listes ont déjà été mises à jour par différence (`_on_vault_changed`) :
+        il ne reste qu'à rétablir la sélection.
+        """
         try:
-            core.sauvegarder_stockage(self.passwords, self.master_password)
-            self._populate_site_list()
-            
-            if select_site and select_site in core.lister_sites(self.passwords):
-                try:
-                    site_index = list(self.site_listbox.get(0, 'end')).index(select_site)
-                    self.site_listbox.selection_set(site_index)
-                    self.site_listbox.activate(site_index)
+            self._schedule_autosave()
+
+            if select_site and select_site in self.site_list:
+                self.site_list.select(select_site)
+                if select_site != self.selected_site:
                     self.selected_site = select_site
                     self._populate_user_list(select_site)
 
-                    if select_user and select_user in core.recuperer_utilisateurs_pour_site(self.passwords, select_site):
-                         user_index = list(self.user_listbox.get(0, 'end')).index(select_user)
-                         self.user_listbox.selection_set(user_index)
-                         self.user_listbox.activate(user_index)
-                         self.selected_user = select_user
-                         self._show_entry_details(select_site, select_user)
-                    else:
-                         self._clear_details() #
-                except ValueError:
-                     print("Info: Impossible de re-sélectionner l'entrée après rafraîchissement.")
-                     self._clear_site_selection() 
+                if select_user and select_user in self.user_list:
+                    self.user_list.select(select_user)
+                    self.selected_user = select_user
+                    self._show_entry_details(select_site, select_user)
+                else:
+                    self.user_list.clear_selection()
+                    self.selected_user = None
+                    self._clear_details()
             else:
                  self._clear_site_selection() 
 
@@ -558,15 +1492,27 @@ class MainWindow(ctk.CTk):
 
     def _on_closing(self):
         """Appelé lorsque l'utilisateur essaie de fermer la fenêtre."""
-       
-        print("Sauvegarde avant fermeture...")
-        try:
-            core.sauvegarder_stockage(self.passwords, self.master_password)
-        except Exception as e:
-             
-             if not messagebox.askokcancel("Erreur de Sauvegarde", f"Impossible de sauvegarder les données avant de quitter:\n{e}\n\nVoulez-vous quitter quand même (les modifications non sauvegardées seront perdues) ?", parent=self):
-                 return 
-        self.destroy() 
+        if self._closing:
+            return # Fermeture déjà en cours
+        self._cancel_autosave()
+        self._closing = True
+        self.add_button.configure(state="disabled")
+        self._clear_details()
+        if self.session.est_modifie or self._save_in_flight:
+            print("Sauvegarde avant fermeture...")
+        self._request_save() # Passe après une éventuelle sauvegarde en cours ; ferme directement si rien à écrire
+
+    def _finish_closing(self):
+        self._stop_audit()
+        self.attachment_worker.shutdown()
+        self.worker.shutdown()
+        # Après un échec de sauvegarde, le coffre sur disque peut encore référencer des pièces retirées.
+        if not self.session.est_modifie:
+            try:
+                self.attachments.nettoyer(self.passwords) # Coffre écrit : les pièces retirées peuvent disparaître
+            except OSError as e:
+                print(f"AVERTISSEMENT: Pièces jointes non nettoyées : {e}")
+        self.destroy()
 
    
     def _get_widget_bg_color(self):
@@ -587,13 +1533,7 @@ class MainWindow(ctk.CTk):
 
 # --- Point d'Entrée Principal ---
 if __name__ == "__main__":
-    login_app = LoginWindow()
-    login_app.mainloop() 
-
-    
-    if login_app.passwords_data is not None and login_app.master_password is not None:
-        print("Connexion réussie. Lancement de l'application principale...")
-        main_app = MainWindow(login_app.passwords_data, login_app.master_password)
-        main_app.mainloop() 
-    else:
+    app = MainWindow() # Connexion, puis coffre, dans la même fenêtre
+    app.mainloop()
+    if app.session is None:
         print("\nConnexion échouée ou annulée. Fermeture.")
\ No newline at end of file
@@ -0,0 +1,323 @@
+"""Pièces jointes et notes sécurisées : contenus chiffrés rangés à côté du coffre, par empreinte.
+
+    python -m cli_password_manager attach exemple.fr alice cle.pem
+    printf '%s' "$NOTE" | python -m cli_password_manager attach exemple.fr alice --note "Codes de secours"
+    python -m cli_password_manager attachments exemple.fr alice                  # liste
+    python -m cli_password_manager attachments exemple.fr alice cle.pem -o cle.pem
+    python -m cli_password_manager detach exemple.fr alice cle.pem
+
+Le coffre ne garde, pour chaque entrée, que des références (voir `DonneesCoffre.pieces`) :
+{"nom", "type" ("fichier" ou "note"), "taille", "objet", "ajout"}. Déverrouiller ou
+sauvegarder le coffre ne lit ni n'écrit jamais une pièce, quelle que soit leur taille.
+Les pièces sont dans un dossier à côté du coffre :
+
+    cle                 clé des pièces, enveloppée par une sous-clé de la clé de données
+    objets/<objet>.bkp  contenu chiffré, découpé en blocs
+
+<objet> est une empreinte à clé (BLAKE2b) du contenu en clair : un même fichier joint à
+plusieurs entrées n'est stocké qu'une fois, et le nom ne révèle rien du contenu sans la clé.
+Un objet est une suite de blocs de `TAILLE_BLOC` octets au plus, chacun chiffré en un jeton
+Fernet précédé de sa taille ; le clair d'un bloc commence par son numéro et un drapeau
+« dernier bloc ». Écriture et lecture se font bloc par bloc, sans jamais tenir une pièce
+entière en mémoire ; l'empreinte est revérifiée à la fin de chaque lecture.
+
+Comme pour l'historique, la clé des pièces est tirée au hasard : changer le mot de passe
+maître ne touche pas aux pièces, et une rotation de la clé de données ne réenveloppe que
+le fichier `cle`.
+"""
+import base64
+import hashlib
+import io
+import json
+import os
+import struct
+import threading
+import time
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+import core_password_manager as core
+
+
+PIECES_DOSSIER = "passwords.attachments"
+FICHIER_CLE = "cle"
+DOSSIER_OBJETS = "objets"
+EXTENSION = ".bkp"
+FORMAT_PIECES = 1
+MAGIC_OBJET = b"BKP"
+VERSION_OBJET = 1
+TAILLE_BLOC = 1024 * 1024   # Clair d'un bloc : mémoire utilisée par une lecture ou une écriture
+DELAI_NETTOYAGE = 3600      # Âge (s) en dessous duquel un objet non référencé est gardé (ajout d'un autre processus pas encore sauvegardé)
+TYPES_PIECES = ("fichier", "note")
+
+_ENTETE_BLOC = struct.Struct("<IB") # numéro du bloc, dernier bloc (0/1)
+_TAILLE_JETON = struct.Struct("<I")
+
+
+class ObjetCorrompu(ValueError):
+    """Objet illisible : tronqué, modifié, ou chiffré avec une autre clé."""
+
+
+class CoffrePieces:
+    """Pièces jointes d'un coffre déverrouillé.
+
+    Rien n'est lu à la création : la clé n'est chargée qu'au premier ajout ou à la
+    première lecture d'une pièce (voir `ouvrir`).
+    """
+    def __init__(self, session: core.SessionCoffre, dossier: str = PIECES_DOSSIER):
+        self.session = session
+        self.dossier = dossier
+        self._chemin_cle = os.path.join(dossier, FICHIER_CLE)
+        self._cle = b""
+        self._fernet = None
+        self._empreinte = None # BLAKE2b à clé, copié pour chaque objet
+        self._verrou = threading.Lock()
+
+    # --- Clé ---
+
+    def _enveloppe(self, cle_donnees: bytes):
+        return core.Fernet(core.deriver_sous_cle(cle_donnees, b"pieces"))
+
+    def _adopter_cle(self, cle: bytes):
+        self._cle = cle
+        self._fernet = core.Fernet(cle)
+        self._empreinte = hashlib.blake2b(key=base64.urlsafe_b64decode(core.deriver_sous_cle(cle, b"objets")), digest_size=16)
+
+    def _ecrire_cle(self, cle_suivante: Optional[bytes] = None):
+        contenu = {"format": FORMAT_PIECES, "cle": self._enveloppe(self.session.cle).encrypt(self._cle).decode('ascii')}
+        if cle_suivante is not None: # Rotation en cours : aussi enveloppée par la future clé de données
+            contenu["suivante"] = self._enveloppe(cle_suivante).encrypt(self._cle).decode('ascii')
+        core._ecrire_atomique(self._chemin_cle, json.dumps(contenu).encode('utf-8'))
+
+    def ouvrir(self, creer: bool = False) -> bool:
+        """Charge la clé des pièces (la crée si `creer`). Retourne False s'il n'y a pas encore de pièces."""
+        with self._verrou:
+            if self._fernet is not None:
+                return True
+            if not os.path.exists(self._chemin_cle):
+                if not creer:
+                    return False
+                with core.verrou_coffre():
+                    if not os.path.exists(self._chemin_cle): # Un autre processus a pu la créer entre-temps
+                        os.makedirs(os.path.join(self.dossier, DOSSIER_OBJETS), exist_ok=True)
+                        self._cle = core.Fernet.generate_key()
+                        self._ecrire_cle()
+            with open(self._chemin_cle, "rb") as f_cle:
+                contenu = json.loads(f_cle.read())
+            if contenu.get("format") != FORMAT_PIECES:
+                raise ValueError(f"Format de pièces jointes non pris en charge : {contenu.get('format')}")
+            for champ in ("cle", "suivante"): # "suivante" : rotation interrompue après la bascule
+                if champ in contenu:
+                    try:
+                        self._adopter_cle(self._enveloppe(self.session.cle).decrypt(contenu[champ].encode('ascii')))
+                        return True
+                    except core.InvalidToken:
+                        pass
+            raise ValueError(f"'{self._chemin_cle}' n'appartient pas à ce coffre.")
+
+    def preparer_rotation(self, nouvelle_cle: bytes):
+        """Enveloppe aussi la clé des pièces par `nouvelle_cle`, avant la bascule d'une rotation."""
+        if self._fernet is not None:
+            self._ecrire_cle(nouvelle_cle)
+
+    def renvelopper(self):
+        """Réenveloppe la clé des pièces avec la clé de données actuelle de la session (après une rotation)."""
+        if self._fernet is not None:
+            self._ecrire_cle()
+
+    # --- Objets ---
+
+    def _chemin_objet(self, objet: str) -> str:
+        if len(objet) != 32 or not all(c in "0123456789abcdef" for c in objet):
+            raise ValueError(f"Nom d'objet invalide : {objet!r}")
+        return os.path.join(self.dossier, DOSSIER_OBJETS, objet + EXTENSION)
+
+    def _empreinte_flux(self, flux: BinaryIO) -> str:
+        empreinte = self._empreinte.copy()
+        for bloc in iter(lambda: flux.read(TAILLE_BLOC), b""):
+            empreinte.update(bloc)
+        return empreinte.hexdigest()
+
+    @core.mesurer_operation("piece_ajout")
+    def ajouter(self, flux: BinaryIO) -> Dict[str, object]:
+        """Chiffre le contenu de `flux` bloc par bloc. Retourne {"objet", "taille"}.
+
+        Un flux rembobinable est d'abord seulement haché : si son contenu est déjà
+        stocké, rien n'est chiffré ni écrit. Sinon l'objet est écrit dans un fichier
+        temporaire, renommé à la fin d'après l'empreinte du contenu.
+        """
+        self.ouvrir(creer=True)
+        if flux.seekable():
+            debut = flux.tell()
+            objet = self._empreinte_flux(flux)
+            chemin = self._chemin_objet(objet)
+            with core.verrou_coffre(): # Pas de `nettoyer` entre la vérification et la date rafraîchie
+                try:
+                    os.utime(chemin) # Objet de nouveau référencé : récent aux yeux de `nettoyer`
+                    return {"objet": objet, "taille": flux.tell() - debut}
+                except FileNotFoundError:
+                    pass
+            flux.seek(debut)
+        temporaire = os.path.join(self.dossier, DOSSIER_OBJETS, f".{os.getpid()}-{threading.get_ident()}.tmp")
+        empreinte = self._empreinte.copy()
+        taille = ecrits = 0
+        with core.mesurer_phase("chiffrement") as phase, open(temporaire, "wb") as f_objet:
+            f_objet.write(MAGIC_OBJET + bytes((VERSION_OBJET,)))
+            bloc, numero = flux.read(TAILLE_BLOC), 0
+            while True:
+                suivant = flux.read(TAILLE_BLOC) if bloc else b"" # Lu d'avance : le dernier bloc est marqué
+                jeton = self._fernet.encrypt(_ENTETE_BLOC.pack(numero, not suivant) + bloc)
+                f_objet.write(_TAILLE_JETON.pack(len(jeton)) + jeton)
+                empreinte.update(bloc)
+                taille += len(bloc)
+                ecrits += _TAILLE_JETON.size + len(jeton)
+                if not suivant:
+                    break
+                bloc, numero = suivant, numero + 1
+            f_objet.flush()
+            os.fsync(f_objet.fileno())
+            phase["octets"] = ecrits
+        objet = empreinte.hexdigest()
+        chemin = self._chemin_objet(objet)
+        if os.path.exists(chemin):
+            os.remove(temporaire) # Contenu déjà stocké
+        else:
+            os.replace(temporaire, chemin)
+        return {"objet": objet, "taille": taille}
+
+    def lire(self, objet: str) -> Iterator[bytes]:
+        """Contenu en clair d'un objet, bloc par bloc. Lève ObjetCorrompu (à la fin si l'empreinte diffère)."""
+        if not self.ouvrir():
+            raise FileNotFoundError(f"Aucune pièce jointe dans '{self.dossier}'.")
+        empreinte = self._empreinte.copy()
+        with open(self._chemin_objet(objet), "rb") as f_objet:
+            if f_objet.read(len(MAGIC_OBJET) + 1) != MAGIC_OBJET + bytes((VERSION_OBJET,)):
+                raise ObjetCorrompu(f"Objet {objet} : en-tête inconnu.")
+            numero, dernier = 0, False
+            while not dernier:
+                taille = f_objet.read(_TAILLE_JETON.size)
+                if len(taille) != _TAILLE_JETON.size:
+                    raise ObjetCorrompu(f"Objet {objet} tronqué.")
+                try:
+                    clair = self._fernet.decrypt(f_objet.read(_TAILLE_JETON.unpack(taille)[0]))
+                except core.InvalidToken:
+                    raise ObjetCorrompu(f"Objet {objet} : bloc {numero} illisible.")
+                numero_lu, dernier = _ENTETE_BLOC.unpack_from(clair)
+                if numero_lu != numero:
+                    raise ObjetCorrompu(f"Objet {objet} : blocs manquants ou réordonnés.")
+                bloc = clair[_ENTETE_BLOC.size:]
+                empreinte.update(bloc)
+                yield bloc
+                numero += 1
+            if f_objet.read(1):
+                raise ObjetCorrompu(f"Objet {objet} : données après le dernier bloc.")
+        if empreinte.hexdigest() != objet:
+            raise ObjetCorrompu(f"Objet {objet} : contenu différent de son empreinte.")
+
+    @core.mesurer_operation("piece_lecture")
+    def extraire(self, objet: str, destination: str) -> int:
+        """Déchiffre un objet dans le fichier `destination`, qui n'est créé qu'une fois l'objet vérifié."""
+        temporaire = destination + ".tmp"
+        taille = 0
+        try:
+            with open(temporaire, "wb") as f_sortie:
+                for bloc in self.lire(objet):
+                    f_sortie.write(bloc)
+                    taille += len(bloc)
+            os.replace(temporaire, destination)
+        except BaseException:
+            if os.path.exists(temporaire):
+                os.remove(temporaire)
+            raise
+        return taille
+
+    def lire_tout(self, objet: str) -> bytes:
+        """Contenu entier d'un objet (pour une note : les fichiers passent par `extraire`)."""
+        return b"".join(self.lire(objet))
+
+    def nettoyer(self, passwords_data: core.PasswordData) -> int:
+        """Supprime les objets qu'aucune entrée ne référence plus. Retourne leur nombre.
+
+        Les objets récents (moins de `DELAI_NETTOYAGE`) sont gardés : un autre processus
+        peut les avoir ajoutés sans avoir encore sauvegardé sa référence.
+        """
+        dossier_objets = os.path.join(self.dossier, DOSSIER_OBJETS)
+        if not os.path.isdir(dossier_objets):
+            return 0
+        utiles = {reference["objet"] + EXTENSION for _site, _utilisateur, pieces in passwords_data.toutes_pieces() for reference in pieces}
+        limite = time.time() - DELAI_NETTOYAGE
+        supprimes = 0
+        with core.verrou_coffre():
+            for entree in os.scandir(dossier_objets):
+                if entree.name.endswith(EXTENSION) and entree.name not in utiles and entree.stat().st_mtime < limite:
+                    os.remove(entree.path)
+                    supprimes += 1
+        if supprimes:
+            print(f"Pièces jointes : {supprimes} objet(s) orphelin(s) supprimé(s).")
+        return supprimes
+
+    # --- Références des entrées ---
+
+    def joindre(self, nom_site: str, nom_utilisateur: str, flux: BinaryIO, nom: str, type_piece: str = "fichier") -> dict:
+        """Stocke le contenu de `flux` et l'attache à l'entrée sous `nom` (voir `attacher`)."""
+        self._verifier(nom_site, nom_utilisateur, nom, type_piece)
+        return self.attacher(nom_site, nom_utilisateur, self.ajouter(flux), nom, type_piece)
+
+    def _verifier(self, nom_site: str, nom_utilisateur: str, nom: str, type_piece: str):
+        if type_piece not in TYPES_PIECES:
+            raise ValueError(f"Type de pièce inconnu : {type_piece}")
+        if not nom:
+            raise ValueError("Le nom de la pièce jointe ne peut pas être vide.")
+        if not core.entree_existe(self.session.passwords_data, nom_site, nom_utilisateur):
+            raise ValueError(f"Entrée '{nom_utilisateur}' introuvable pour '{nom_site}'.")
+
+    def attacher(self, nom_site: str, nom_utilisateur: str, stockee: Dict[str, object], nom: str, type_piece: str = "fichier") -> dict:
+        """Attache à l'entrée un objet déjà stocké (résultat de `ajouter`), sous `nom`.
+
+        Une pièce du même nom est remplacée. Modifie les données vivantes sans les écrire :
+        à l'appelant de persister (et, dans l'interface, de l'appeler depuis le thread Tk).
+        """
+        self._verifier(nom_site, nom_utilisateur, nom, type_piece)
+        donnees = self.session.passwords_data
+        reference = dict(stockee, nom=nom, type=type_piece, ajout=int(time.time()))
+        pieces = [piece for piece in donnees.pieces(nom_site, nom_utilisateur) if piece["nom"] != nom] + [reference]
+        core.definir_pieces_entree(donnees, nom_site, nom_utilisateur, pieces)
+        return reference
+
+    def joindre_fichier(self, nom_site: str, nom_utilisateur: str, chemin: str, nom: Optional[str] = None) -> dict:
+        with open(chemin, "rb") as f_piece:
+            return self.joindre(nom_site, nom_utilisateur, f_piece, nom or os.path.basename(chemin))
+
+    def joindre_note(self, nom_site: str, nom_utilisateur: str, titre: str, texte: str) -> dict:
+        return self.joindre(nom_site, nom_utilisateur, io.BytesIO(texte.encode('utf-8')), titre, "note")
+
+    def detacher(self, nom_site: str, nom_utilisateur: str, nom: str) -> bool:
+        """Retire la pièce `nom` de l'entrée (l'objet est supprimé par `nettoyer` s'il ne sert plus)."""
+        donnees = self.session.passwords_data
+        pieces = donnees.pieces(nom_site, nom_utilisateur)
+        restantes = [piece for piece in pieces if piece["nom"] != nom]
+        if len(restantes) == len(pieces):
+            return False
+        core.definir_pieces_entree(donnees, nom_site, nom_utilisateur, restantes)
+        return True
+
+    def lire_note(self, reference: dict) -> str:
+        return self.lire_tout(reference["objet"]).decode('utf-8')
+
+
+def activer(session: core.SessionCoffre, dossier: str = PIECES_DOSSIER) -> CoffrePieces:
+    """Attache les pièces jointes à la session (sans rien lire sur disque)."""
+    if session.pieces is None:
+        session.pieces = CoffrePieces(session, dossier)
+    return session.pieces
+
+
+def trouver_piece(pieces: List[dict], nom: str) -> Optional[dict]:
+    """Référence de la pièce `nom` parmi `pieces`, ou None."""
+    return next((piece for piece in pieces if piece["nom"] == nom), None)
+
+
+def formater_taille(octets: int) -> str:
+    for unite in ("o", "Ko", "Mo", "Go"):
+        if octets < 1024 or unite == "Go":
+            return f"{octets:.0f} {unite}" if unite == "o" else f"{octets:.1f} {unite}"
+        octets /= 1024
@@ -0,0 +1,328 @@
+"""Réplication incrémentale du coffre vers un second emplacement (dossier local ou partage monté).
+
+    python -m cli_password_manager replicate /mnt/sauvegarde/big-key   # pousse les modifications
+    python -m cli_password_manager restore /mnt/sauvegarde/big-key     # reconstruit ou met à jour le coffre local
+
+Une réplique est un dossier :
+
+    manifest.json       identifiant, séquence, en-tête du coffre (clé enveloppée), empreinte de chaque seau
+    seaux/NNNN.bkr      entrées du seau : [site, utilisateur, version, valeur scellée ou None]
+    deltas/SSSSSSSS.bkr entrées changées à la séquence SSSSSSSS (les `DELTAS_GARDES` derniers)
+
+Chaque entrée porte une version : la séquence de la réplique à laquelle elle a changé
+pour la dernière fois. Une entrée supprimée reste sous forme de pierre tombale (valeur
+None), pour que les lecteurs, même en retard, l'appliquent aussi. `repliquer` fait de la
+réplique le miroir du coffre local ; `tirer` applique au coffre local les changements de
+la réplique (écrits par un autre poste) sans toucher à ses entrées propres.
+
+Les entrées sont réparties en seaux par une empreinte à clé du nom du site, et
+l'empreinte d'un seau résume ses entrées vivantes. Pour répliquer, on compare les empreintes
+locales à celles du manifeste : seuls les seaux qui diffèrent sont relus et réécrits, et
+le delta de la nouvelle séquence ne contient que les entrées changées. Après une
+modification, un coffre de 100 000 entrées ne déplace qu'un seau, le delta et le manifeste.
+Les empreintes utilisent une sous-clé du coffre (elles ne révèlent rien des noms) et les
+seaux et deltas sont chiffrés avec la clé du coffre, comme `passwords.enc`.
+"""
+import base64
+import hashlib
+import json
+import os
+import uuid
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import core_password_manager as core
+
+
+MANIFESTE = "manifest.json"
+DOSSIER_SEAUX = "seaux"
+DOSSIER_DELTAS = "deltas"
+VERROU_REPLIQUE = "replique.lock"
+EXTENSION = ".bkr"
+VERSION_REPLIQUE = 1
+NB_SEAUX = 1024         # ~100 entrées par seau pour 100 000 entrées
+DELTAS_GARDES = 1000    # Un lecteur plus en retard compare les seaux au lieu de rejouer les deltas
+TAILLE_EMPREINTE = 8
+ETAT_FILENAME = "passwords.replication.json" # Séquence déjà tirée de chaque réplique (à côté du coffre)
+
+Entree = Tuple[str, str, int, Optional[str]] # (site, utilisateur, version, valeur scellée ou None)
+
+
+class RapportReplication:
+    """Bilan d'une réplication : séquence atteinte, entrées transférées, seaux comparés et octets écrits."""
+    def __init__(self, sequence: int = 0):
+        self.sequence = sequence
+        self.modifiees = 0
+        self.supprimees = 0
+        self.seaux_differents = 0
+        self.deltas_rejoues = 0
+        self.octets_ecrits = 0
+
+    def __str__(self) -> str:
+        if not self.modifiees and not self.supprimees:
+            return f"Réplique à jour (séquence {self.sequence})."
+        return (f"Séquence {self.sequence} : {self.modifiees} entrée(s) modifiée(s), {self.supprimees} supprimée(s), "
+                f"{self.seaux_differents} seau(x) différent(s), {self.deltas_rejoues} delta(s) rejoué(s), "
+                f"{self.octets_ecrits / 1024:.1f} Ko écrits.")
+
+
+# --- Empreintes ---
+
+def _cle_empreinte(session: core.SessionCoffre) -> bytes:
+    return base64.urlsafe_b64decode(core.deriver_sous_cle(session.cle, b"replication"))
+
+class _Repartiteur:
+    """Seau d'un site : empreinte à clé du nom (tous les utilisateurs d'un site partagent un seau)."""
+    def __init__(self, cle: bytes, nb_seaux: int):
+        self._base = hashlib.blake2b(key=cle, digest_size=4) # Copier l'état évite de retraiter la clé à chaque nom
+        self._nb_seaux = nb_seaux
+
+    def seau(self, site: str) -> int:
+        h = self._base.copy()
+        h.update(site.encode('utf-8'))
+        return int.from_bytes(h.digest(), "little") % self._nb_seaux
+
+def _empreinte_seau(cle: bytes, entrees: List[Tuple[str, str, str]]) -> str:
+    """Empreinte des entrées vivantes (site, utilisateur, valeur) d'un seau, indépendante de l'ordre. "" si vide."""
+    if not entrees:
+        return ""
+    lignes = "".join(f"{site}\0{utilisateur}\0{valeur}\n" for site, utilisateur, valeur in sorted(entrees))
+    return hashlib.blake2b(lignes.encode('utf-8'), key=cle, digest_size=TAILLE_EMPREINTE).hexdigest()
+
+def _controle(cle: bytes) -> str:
+    """Valeur de contrôle du manifeste : vérifie que la réplique appartient à ce coffre."""
+    return hashlib.blake2b(b"big-key replique", key=cle, digest_size=TAILLE_EMPREINTE).hexdigest()
+
+def _seaux_locaux(cle: bytes, passwords_data: core.PasswordData, nb_seaux: int) -> List[List[Tuple[str, str, str]]]:
+    seaux = [[] for _ in range(nb_seaux)]
+    repartiteur = _Repartiteur(cle, nb_seaux)
+    for entree in core.entrees_stockees(passwords_data):
+        seaux[repartiteur.seau(entree[0])].append(entree)
+    return seaux
+
+
+# --- Dossier de réplique ---
+
+class Replique:
+    """Accès au dossier d'une réplique, avec la clé de la session."""
+    def __init__(self, dossier: str, session: core.SessionCoffre):
+        self.dossier = dossier
+        self._session = session
+        self.cle = _cle_empreinte(session)
+        self.octets_ecrits = 0
+
+    def _chemin(self, *parties: str) -> str:
+        return os.path.join(self.dossier, *parties)
+
+    def _ecrire(self, chemin: str, contenu: bytes):
+        core._ecrire_atomique(chemin, contenu)
+        self.octets_ecrits += len(contenu)
+
+    def _lire_chiffre(self, chemin: str):
+        with open(chemin, "rb") as f:
+            return json.loads(self._session.dechiffrer(f.read()).decode('utf-8'))
+
+    def _ecrire_chiffre(self, chemin: str, contenu):
+        self._ecrire(chemin, self._session.chiffrer(json.dumps(contenu, separators=(",", ":")).encode('utf-8')))
+
+    def lire_manifeste(self) -> Optional[dict]:
+        """Manifeste de la réplique (None si le dossier n'en est pas encore une). Lève ValueError pour un autre coffre."""
+        try:
+            with open(self._chemin(MANIFESTE), encoding="utf-8") as f:
+                manifeste = json.load(f)
+        except FileNotFoundError:
+            return None
+        if manifeste.get("version") != VERSION_REPLIQUE:
+            raise ValueError(f"Version de réplique non prise en charge : {manifeste.get('version')}")
+        if manifeste.get("controle") != _controle(self.cle):
+            raise ValueError(f"La réplique '{self.dossier}' appartient à un autre coffre.")
+        return manifeste
+
+    def nouveau_manifeste(self) -> dict:
+        return {"version": VERSION_REPLIQUE, "id": uuid.uuid4().hex, "controle": _controle(self.cle),
+                "sequence": 0, "premier_delta": 1, "nb_seaux": NB_SEAUX, "seaux": [""] * NB_SEAUX, "entete": None}
+
+    def ecrire_manifeste(self, manifeste: dict):
+        """Écrit le manifeste : c'est le point de validation d'une réplication."""
+        contenu = json.dumps(manifeste, separators=(",", ":")).encode('utf-8')
+        self._ecrire(self._chemin(MANIFESTE), contenu)
+
+    def lire_seau(self, indice: int) -> Dict[Tuple[str, str], list]:
+        """{(site, utilisateur): [version, valeur ou None]} pour un seau (vide s'il n'existe pas)."""
+        try:
+            entrees = self._lire_chiffre(self._chemin(DOSSIER_SEAUX, f"{indice:04d}{EXTENSION}"))
+        except FileNotFoundError:
+            return {}
+        return {(site, utilisateur): [version, valeur] for site, utilisateur, version, valeur in entrees}
+
+    def ecrire_seau(self, indice: int, entrees: Dict[Tuple[str, str], list]):
+        self._ecrire_chiffre(self._chemin(DOSSIER_SEAUX, f"{indice:04d}{EXTENSION}"),
+                             [[site, utilisateur, version, valeur] for (site, utilisateur), (version, valeur) in entrees.items()])
+
+    def lire_delta(self, sequence: int) -> List[Entree]:
+        delta = self._lire_chiffre(self._chemin(DOSSIER_DELTAS, f"{sequence:08d}{EXTENSION}"))
+        if delta.get("sequence") != sequence:
+            raise ValueError(f"Delta {sequence} de la réplique '{self.dossier}' corrompu.")
+        return [tuple(entree) for entree in delta["entrees"]]
+
+    def ecrire_delta(self, sequence: int, entrees: List[Entree]):
+        self._ecrire_chiffre(self._chemin(DOSSIER_DELTAS, f"{sequence:08d}{EXTENSION}"),
+                             {"sequence": sequence, "entrees": [list(entree) for entree in entrees]})
+
+    def supprimer_deltas(self, premier: int, jusqu_a: int):
+        """Supprime les deltas de `premier` (inclus) à `jusqu_a` (exclu)."""
+        for sequence in range(premier, jusqu_a):
+            try:
+                os.remove(self._chemin(DOSSIER_DELTAS, f"{sequence:08d}{EXTENSION}"))
+            except FileNotFoundError:
+                pass
+
+
+# --- Pousser vers la réplique ---
+
+@core.mesurer_operation("replication")
+def repliquer(session: core.SessionCoffre, dossier: str) -> RapportReplication:
+    """Pousse vers `dossier` les modifications du coffre depuis l'état connu de la réplique.
+
+    Crée la réplique au premier appel. Seuls les seaux dont l'empreinte diffère de
+    celle du manifeste sont relus, comparés entrée par entrée et réécrits.
+    """
+    os.makedirs(os.path.join(dossier, DOSSIER_SEAUX), exist_ok=True)
+    os.makedirs(os.path.join(dossier, DOSSIER_DELTAS), exist_ok=True)
+    replique = Replique(dossier, session)
+    with core.verrou_fichier(os.path.join(dossier, VERROU_REPLIQUE)):
+        manifeste = replique.lire_manifeste() or replique.nouveau_manifeste()
+        nb_seaux = manifeste["nb_seaux"]
+        with core.mesurer_phase("comparaison"):
+            locaux = _seaux_locaux(replique.cle, session.passwords_data, nb_seaux)
+            empreintes = [_empreinte_seau(replique.cle, entrees) for entrees in locaux]
+            differents = [i for i in range(nb_seaux) if empreintes[i] != manifeste["seaux"][i]]
+
+        sequence = manifeste["sequence"] + 1
+        premier_delta = max(manifeste["premier_delta"], sequence - DELTAS_GARDES + 1)
+        rapport = RapportReplication(manifeste["sequence"])
+        rapport.seaux_differents = len(differents)
+        changements: List[Entree] = []
+        seaux_modifies = {}
+        for i in differents:
+            distant = replique.lire_seau(i)
+            local = {(site, utilisateur): valeur for site, utilisateur, valeur in locaux[i]}
+            for cle_entree, valeur in local.items():
+                actuel = distant.get(cle_entree)
+                if actuel is None or actuel[1] != valeur:
+                    distant[cle_entree] = [sequence, valeur]
+                    changements.append((*cle_entree, sequence, valeur))
+                    rapport.modifiees += 1
+            for cle_entree, (_version, valeur) in list(distant.items()):
+                if valeur is not None and cle_entree not in local: # Supprimée localement : pierre tombale
+                    distant[cle_entree] = [sequence, None]
+                    changements.append((*cle_entree, sequence, None))
+                    rapport.supprimees += 1
+            seaux_modifies[i] = distant
+
+        if not differents:
+            return rapport
+        with core.mesurer_phase("ecriture") as phase:
+            if changements:
+                if sequence > 1: # Un lecteur qui part de zéro compare les seaux : pas de delta initial
+                    replique.ecrire_delta(sequence, changements)
+                else:
+                    premier_delta = 2
+                manifeste["sequence"] = sequence
+                replique.supprimer_deltas(manifeste["premier_delta"], premier_delta)
+                manifeste["premier_delta"] = premier_delta
+            for i, entrees in seaux_modifies.items():
+                replique.ecrire_seau(i, entrees)
+                manifeste["seaux"][i] = empreintes[i]
+            manifeste["entete"] = session.entete
+            replique.ecrire_manifeste(manifeste)
+            phase["octets"] = replique.octets_ecrits
+    rapport.sequence = manifeste["sequence"]
+    rapport.octets_ecrits = replique.octets_ecrits
+    print(f"Réplication vers '{dossier}' : {rapport}")
+    return rapport
+
+
+# --- Tirer depuis la réplique ---
+
+def _lire_etat() -> dict:
+    try:
+        with open(ETAT_FILENAME, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def _ecrire_etat(etat: dict):
+    core._ecrire_atomique(ETAT_FILENAME, json.dumps(etat, indent=2).encode('utf-8'))
+
+def _appliquer(passwords_data: core.PasswordData, site: str, utilisateur: str, valeur: Optional[str], rapport: RapportReplication):
+    if valeur is None:
+        if core.supprimer_entree(passwords_data, site, utilisateur):
+            rapport.supprimees += 1
+    elif passwords_data.get(site, {}).get(utilisateur) != valeur:
+        core._inserer_entree(passwords_data, site, utilisateur, valeur)
+        rapport.modifiees += 1
+
+def _iterer_deltas(replique: Replique, depuis: int, jusqu_a: int) -> Iterator[Entree]:
+    for sequence in range(depuis + 1, jusqu_a + 1):
+        yield from replique.lire_delta(sequence)
+
+@core.mesurer_operation("mise_a_jour_replique")
+def tirer(session: core.SessionCoffre, dossier: str) -> RapportReplication:
+    """Applique au coffre les changements de la réplique depuis la dernière séquence tirée.
+
+    Rejoue les deltas manquants s'ils sont encore conservés, sinon compare les seaux.
+    Les entrées modifiées seulement en local sont gardées. Sauvegarde le coffre.
+    """
+    replique = Replique(dossier, session)
+    with core.verrou_fichier(os.path.join(dossier, VERROU_REPLIQUE), exclusif=False):
+        manifeste = replique.lire_manifeste()
+        if manifeste is None:
+            raise FileNotFoundError(f"Aucune réplique dans '{dossier}'.")
+        etat = _lire_etat()
+        connue = etat.get(manifeste["id"], {}).get("sequence", 0)
+        rapport = RapportReplication(manifeste["sequence"])
+        donnees = session.passwords_data
+        if 0 < connue and connue + 1 >= manifeste["premier_delta"]:
+            # Quelques entrées : journalisées une à une plutôt que de réécrire l'instantané
+            for site, utilisateur, _version, valeur in _iterer_deltas(replique, connue, manifeste["sequence"]):
+                _appliquer(donnees, site, utilisateur, valeur, rapport)
+            rapport.deltas_rejoues = manifeste["sequence"] - connue
+        else:
+            with donnees.lot():
+                nb_seaux = manifeste["nb_seaux"]
+                locaux = _seaux_locaux(replique.cle, donnees, nb_seaux)
+                for i in range(nb_seaux):
+                    if _empreinte_seau(replique.cle, locaux[i]) == manifeste["seaux"][i]:
+                        continue
+                    rapport.seaux_differents += 1
+                    distant = replique.lire_seau(i)
+                    for (site, utilisateur), (_version, valeur) in distant.items():
+                        _appliquer(donnees, site, utilisateur, valeur, rapport)
+    session.persister()
+    etat[manifeste["id"]] = {"sequence": manifeste["sequence"], "dossier": os.path.abspath(dossier)}
+    _ecrire_etat(etat)
+    print(f"Mise à jour depuis '{dossier}' : {rapport}")
+    return rapport
+
+def restaurer(dossier: str, mot_passe_maitre: str) -> RapportReplication:
+    """Reconstruit le coffre du répertoire courant depuis une réplique.
+
+    Le manifeste porte l'en-tête du coffre : le mot de passe maître suffit à retrouver la clé.
+    """
+    if os.path.exists(core.STORAGE_FILENAME):
+        raise FileExistsError(f"'{core.STORAGE_FILENAME}' existe déjà : utiliser `tirer` pour le mettre à jour.")
+    try:
+        with open(os.path.join(dossier, MANIFESTE), encoding="utf-8") as f:
+            entete = json.load(f).get("entete")
+    except FileNotFoundError:
+        raise FileNotFoundError(f"Aucune réplique dans '{dossier}'.")
+    if entete is None:
+        raise ValueError(f"La réplique '{dossier}' ne porte pas d'en-tête de coffre.")
+    core._charger_crypto()
+    cle, salt, _duree = core._ouvrir_cle(mot_passe_maitre, entete)
+    session = core.SessionCoffre(core.DonneesCoffre(), salt, cle, entete)
+    session.passwords_data.scelleur = session.scelleur
+    rapport = tirer(session, dossier)
+    if not os.path.exists(core.STORAGE_FILENAME): # Réplique vide : rien n'a été sauvegardé
+        session.sauvegarder()
+    return rapport
@@ -0,0 +1,48 @@
+"""Tests de `audit_password_manager` : recherche dans le fichier binaire des fuites."""
+import hashlib
+
+import pytest
+
+import audit_password_manager as audit
+
+
+def _corpus(tmp_path, empreintes: dict) -> audit.CorpusFuites:
+    """Convertit {empreinte: occurrences} (liste HIBP triée) et ouvre le fichier binaire."""
+    source, destination = tmp_path / "fuites.txt", tmp_path / "fuites.bin"
+    source.write_text("".join(f"{empreinte.hex().upper()}:{nombre}\n" for empreinte, nombre in sorted(empreintes.items())))
+    assert audit.convertir_hibp(str(source), str(destination)) == len(empreintes)
+    return audit.CorpusFuites(str(destination))
+
+
+@pytest.mark.parametrize("repartition", ["uniforme", "groupee"])
+def test_recherche_aux_deux_extremites(tmp_path, repartition):
+    empreintes = {hashlib.sha1(str(i).encode()).digest(): i + 1 for i in range(500)}
+    if repartition == "groupee": # Empreintes non uniformes : l'interpolation doit se rabattre sur la dichotomie
+        empreintes = {b"\x00" * 12 + empreinte[:8]: nombre for empreinte, nombre in empreintes.items()}
+        empreintes[b"\xf0" * 20] = 7
+    triees = sorted(empreintes)
+    suivante = lambda empreinte: (int.from_bytes(empreinte, "big") + 1).to_bytes(20, "big")
+    with _corpus(tmp_path, empreintes) as corpus:
+        assert corpus.nombre == len(empreintes)
+        for empreinte in (triees[0], triees[1], triees[len(triees) // 2], triees[-2], triees[-1]):
+            assert corpus.rechercher(empreinte) == empreintes[empreinte]
+        assert corpus.rechercher(b"\x00" * 20) == 0 # Avant la première
+        assert corpus.rechercher(b"\xff" * 20) == 0 # Après la dernière
+        for absente in (suivante(triees[0]), suivante(triees[len(triees) // 2]), suivante(triees[-2])):
+            assert absente not in empreintes and corpus.rechercher(absente) == 0
+        assert all(corpus.rechercher(empreinte) == nombre for empreinte, nombre in empreintes.items())
+
+
+def test_occurrences_d_un_mot_de_passe(tmp_path):
+    with _corpus(tmp_path, {audit.hacher_sha1("motdepasse"): 42, audit.hacher_sha1("autre"): 1}) as corpus:
+        assert corpus.occurrences("motdepasse") == 42
+        assert corpus.occurrences("absent") == 0
+
+
+def test_corpus_vide_ou_invalide(tmp_path):
+    with _corpus(tmp_path, {}) as corpus:
+        assert corpus.rechercher(b"\x00" * 20) == 0
+    invalide = tmp_path / "invalide.bin"
+    invalide.write_bytes(b"pas un corpus")
+    with pytest.raises(ValueError):
+        audit.CorpusFuites(str(invalide))
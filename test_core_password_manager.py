@@ -0,0 +1,285 @@
+"""Tests de `core_password_manager` (coffres dans un répertoire temporaire, voir conftest.py)."""
+import json
+import os
+import struct
+
+import pytest
+from cryptography.fernet import Fernet
+
+import core_password_manager as core
+from conftest import KDF_TEST, MAITRE
+
+
+def _lire(chemin: str) -> bytes:
+    with open(chemin, "rb") as f:
+        return f.read()
+
+
+# --- Coffre au format initial ---
+
+def _ecrire_coffre_initial(donnees: dict):
+    """Coffre tel que l'écrivait la première version : sel à part, jeton Fernet d'un JSON en clair."""
+    sel = os.urandom(16)
+    with open(core.SALT_FILENAME, "wb") as f_sel:
+        f_sel.write(sel)
+    jeton = Fernet(core.deriver_cle(MAITRE.encode('utf-8'), sel)).encrypt(json.dumps(donnees, indent=4).encode('utf-8'))
+    with open(core.STORAGE_FILENAME, "wb") as f_coffre:
+        f_coffre.write(jeton)
+
+
+def test_coffre_initial_migre_au_deverrouillage(coffre):
+    _ecrire_coffre_initial({"exemple.fr": {"alice": "secret", "bob": "autre"}, "test.org": {"carol": "mdp"}})
+
+    session = core.charger_ou_creer_stockage(MAITRE)
+    assert core.recuperer_entree(session.passwords_data, "exemple.fr", "alice") == "secret"
+    assert session.passwords_data.scelleur is not None # Format 2 : mots de passe scellés un par un
+
+    contenu = _lire(core.STORAGE_FILENAME)
+    assert contenu.startswith(core.MAGIC_FICHIER)
+    assert core._version_fichier(contenu) == core.VERSION_FICHIER
+    entete, _prefixe, _corps = core._decouper_fichier(contenu)
+    assert entete["kdf"] == KDF_TEST
+
+    relue = core.charger_ou_creer_stockage(MAITRE)
+    assert sorted(core.entrees_stockees(relue.passwords_data)) == sorted(core.entrees_stockees(session.passwords_data))
+    assert core.recuperer_entree(relue.passwords_data, "test.org", "carol") == "mdp"
+    assert _lire(core.STORAGE_FILENAME) == contenu # Déjà migré : rien à réécrire
+    with pytest.raises(ValueError):
+        core.charger_ou_creer_stockage("mauvais mot de passe")
+
+
+def test_coffre_initial_lu_sans_ecriture_en_lecture_seule(coffre):
+    _ecrire_coffre_initial({"exemple.fr": {"alice": "secret"}})
+    avant = _lire(core.STORAGE_FILENAME)
+
+    session = core.charger_ou_creer_stockage(MAITRE, journal=False)
+    assert core.recuperer_entree(session.passwords_data, "exemple.fr", "alice") == "secret"
+    assert _lire(core.STORAGE_FILENAME) == avant
+    assert not os.path.exists(core.JOURNAL_FILENAME)
+
+
+# --- Journal ---
+
+def _entete_journal(session: core.SessionCoffre) -> dict:
+    return json.loads(session.dechiffrer(_lire(core.JOURNAL_FILENAME).split(b"\n")[0]))
+
+
+def test_journal_rejoue_sans_reecrire_un_journal_coherent(session):
+    core.ajouter_ou_modifier_entree(session.passwords_data, "exemple.fr", "alice", "secret")
+    core.ajouter_ou_modifier_entree(session.passwords_data, "exemple.fr", "bob", "autre")
+    assert session.persister()
+    etat_journal = os.stat(core.JOURNAL_FILENAME)
+
+    relue = core.charger_ou_creer_stockage(MAITRE)
+    assert core.recuperer_entree(relue.passwords_data, "exemple.fr", "bob") == "autre"
+    assert relue.journal.position == 2
+    etat_relu = os.stat(core.JOURNAL_FILENAME)
+    assert (etat_relu.st_ino, etat_relu.st_mtime_ns) == (etat_journal.st_ino, etat_journal.st_mtime_ns)
+    assert not session.disque_modifie() # Ouvrir le coffre ailleurs n'est pas une écriture
+
+    core.ajouter_ou_modifier_entree(relue.passwords_data, "test.org", "carol", "mdp")
+    relue.persister()
+    assert core.lister_sites(core.charger_ou_creer_stockage(MAITRE).passwords_data) == ["exemple.fr", "test.org"]
+
+
+def test_compaction_rebase_le_journal_sur_l_instantane(session):
+    for i in range(5):
+        core.ajouter_ou_modifier_entree(session.passwords_data, f"site{i}.fr", "alice", f"mdp{i}")
+    session.persister()
+    session.sauvegarder() # Compaction
+
+    assert _entete_journal(session) == {"instantane": core._empreinte(_lire(core.STORAGE_FILENAME)), "base": 5}
+    assert _lire(core.JOURNAL_FILENAME).count(b"\n") == 1 # En-tête seul
+    core.supprimer_entree(session.passwords_data, "site0.fr", "alice")
+    session.persister()
+
+    relue = core.charger_ou_creer_stockage(MAITRE)
+    assert relue.journal.position == 6
+    assert core.lister_sites(relue.passwords_data) == [f"site{i}.fr" for i in range(1, 5)]
+
+
+def test_journal_perime_ignore_et_reinitialise(session):
+    core.ajouter_ou_modifier_entree(session.passwords_data, "exemple.fr", "alice", "secret")
+    session.persister()
+    # Compaction interrompue : nouvel instantané (qui inclut tout) écrit, journal encore lié à l'ancien.
+    instantane = core._ecrire_stockage(session, session.passwords_data)
+
+    relue = core.charger_ou_creer_stockage(MAITRE)
+    assert not relue.journal.propre
+    assert core.recuperer_entree(relue.passwords_data, "exemple.fr", "alice") == "secret"
+    assert _entete_journal(relue) == {"instantane": core._empreinte(instantane), "base": 0}
+    assert relue.journal.vide
+
+
+def test_ligne_tronquee_du_journal_ecartee(session):
+    core.ajouter_ou_modifier_entree(session.passwords_data, "exemple.fr", "alice", "secret")
+    session.persister()
+    with open(core.JOURNAL_FILENAME, "ab") as f_journal:
+        f_journal.write(b"gAAAAAB-ecriture-interrompue") # Sans fin de ligne
+
+    relue = core.charger_ou_creer_stockage(MAITRE)
+    assert not relue.journal.propre
+    assert core.recuperer_entree(relue.passwords_data, "exemple.fr", "alice") == "secret"
+    assert _lire(core.JOURNAL_FILENAME).endswith(b"\n")
+    core.ajouter_ou_modifier_entree(relue.passwords_data, "exemple.fr", "bob", "autre")
+    relue.persister()
+    assert core.recuperer_utilisateurs_pour_site(core.charger_ou_creer_stockage(MAITRE).passwords_data, "exemple.fr") == ["alice", "bob"]
+
+
+# --- Fusion des écritures concurrentes ---
+
+def test_fusion_garde_la_version_locale_et_copie_la_distante():
+    locales = core.DonneesCoffre({"a.fr": {"alice": "locale", "bob": "b0"}, "b.fr": {"carol": "nouvelle"}})
+    del locales["a.fr"]["bob"] # Suppression locale
+    ancetres = {("a.fr", "alice"): "v0", ("a.fr", "bob"): "b0", ("b.fr", "carol"): None}
+    distantes = core.DonneesCoffre({"a.fr": {"alice": "distante", "bob": "b0"}, "c.fr": {"dave": "d1"}})
+
+    conflits = core.fusionner_modifications(locales, ancetres, distantes)
+
+    assert conflits == [("a.fr", "alice", "alice (2)")]
+    assert {site: dict(locales[site]) for site in locales} == {
+        "a.fr": {"alice": "locale", "alice (2)": "distante"}, # Modifiée des deux côtés : les deux gardées
+        "b.fr": {"carol": "nouvelle"},                        # Ajout local
+        "c.fr": {"dave": "d1"},                               # Ajout distant
+    }
+
+
+def test_deux_sessions_fusionnent_leurs_ecritures(session):
+    core.ajouter_ou_modifier_entree(session.passwords_data, "a.fr", "alice", "v0")
+    session.persister()
+    autre = core.charger_ou_creer_stockage(MAITRE)
+    core.ajouter_ou_modifier_entree(autre.passwords_data, "a.fr", "alice", "autre processus")
+    core.ajouter_ou_modifier_entree(autre.passwords_data, "c.fr", "dave", "d1")
+    autre.persister()
+
+    core.ajouter_ou_modifier_entree(session.passwords_data, "a.fr", "alice", "cette session")
+    assert session.disque_modifie()
+    session.persister() # Fusionne avant d'écrire
+
+    relue = core.charger_ou_creer_stockage(MAITRE).passwords_data
+    assert core.recuperer_entree(relue, "a.fr", "alice") == "cette session"
+    assert core.recuperer_entree(relue, "a.fr", "alice (2)") == "autre processus"
+    assert core.recuperer_entree(relue, "c.fr", "dave") == "d1"
+    assert not session.est_modifie and not session.disque_modifie()
+
+
+# --- Rotation de la clé de données ---
+
+class _Interruption(Exception):
+    pass
+
+
+def test_rotation_interrompue_reprise(session, monkeypatch):
+    monkeypatch.setattr(core, "ROTATION_LOT", 2)
+    for i in range(10):
+        core.ajouter_ou_modifier_entree(session.passwords_data, f"site{i}.fr", "alice", f"mdp{i}")
+    session.sauvegarder()
+    ancienne_cle = session.cle
+    resceller = core._resceller
+
+    def interrompu(ancienne, nouvelle, a_faire, processus):
+        for i, lot in enumerate(resceller(ancienne, nouvelle, a_faire, processus)):
+            if i == 2:
+                raise _Interruption()
+            yield lot
+    monkeypatch.setattr(core, "_resceller", interrompu)
+    with pytest.raises(_Interruption):
+        core.changer_mot_passe_maitre(session, MAITRE, "nouveau", pivoter_cle=True, processus=1)
+    assert os.path.exists(core.ROTATION_FILENAME)
+
+    # Nouveau processus : le coffre est intact, la rotation reprend après les 2 lots écrits.
+    repris = []
+    def suivi(ancienne, nouvelle, a_faire, processus):
+        repris.extend(indice for indice, _lot in a_faire)
+        return resceller(ancienne, nouvelle, a_faire, processus)
+    monkeypatch.setattr(core, "_resceller", suivi)
+    reprise = core.charger_ou_creer_stockage(MAITRE)
+    core.changer_mot_passe_maitre(reprise, MAITRE, "nouveau", pivoter_cle=True, processus=1)
+
+    assert repris == [2, 3, 4]
+    assert not os.path.exists(core.ROTATION_FILENAME)
+    assert reprise.cle != ancienne_cle
+    with pytest.raises(ValueError):
+        core.charger_ou_creer_stockage(MAITRE)
+    relue = core.charger_ou_creer_stockage("nouveau")
+    assert relue.cle == reprise.cle
+    assert [core.recuperer_entree(relue.passwords_data, f"site{i}.fr", "alice") for i in range(10)] == [f"mdp{i}" for i in range(10)]
+
+
+# --- Codec du contenu ---
+
+def _sites(donnees) -> dict:
+    return {site: dict(donnees[site].items()) for site in donnees}
+
+
+@pytest.mark.parametrize("compression", list(core.COMPRESSIONS))
+def test_codec_aller_retour(compression):
+    donnees = core.DonneesCoffre()
+    donnees.ecrire("exemple.fr", "alice", "secret", date=1700000100, creation=1700000000)
+    donnees.ecrire("exemple.fr", "bob", "éà ✓")
+    donnees.ecrire("vide.org", "alice", "")
+    donnees.definir_pieces("exemple.fr", "alice", [{"nom": "note", "objet": "ab" * 32}])
+
+    sites, extras = core.decoder_contenu(core.encoder_contenu(donnees, {"format": 2}, compression))
+
+    assert extras == {"format": 2}
+    assert _sites(sites) == _sites(donnees)
+    assert sites.dates("exemple.fr", "alice") == (1700000000, 1700000100)
+    assert sites.pieces("exemple.fr", "alice") == [{"nom": "note", "objet": "ab" * 32}]
+
+
+def test_codec_lit_les_anciens_contenus():
+    sites = {"exemple.fr": {"alice": "secret"}, "test.org": {"bob": "mdp", "carol": "x"}}
+    # Format 1 : le JSON est directement {site: {utilisateur: mot de passe}}
+    assert core.decoder_contenu(json.dumps(sites, indent=4).encode('utf-8')) == (sites, {})
+    # JSON avec extras (aussi le repli d'un nom contenant un caractère NUL)
+    assert core.decoder_contenu(json.dumps({"format": 2, "sites": sites}).encode('utf-8')) == (sites, {"format": 2})
+    nul = {"a\0b": {"alice": "secret"}}
+    assert core.decoder_contenu(core.encoder_contenu(nul, {"format": 2})) == (nul, {"format": 2})
+    # Version 1 du codec binaire : utilisateurs et valeurs alternés, sans dates
+    texte = "\0".join(["exemple.fr", "test.org", "alice", "secret", "bob", "mdp", "carol", "x"])
+    corps = struct.pack("<II", 2, 2) + b"{}" + struct.pack("<II", 1, 2) + texte.encode('utf-8')
+    donnees, extras = core.decoder_contenu(core.MAGIC_CONTENU + bytes((1, 0)) + corps)
+    assert (_sites(donnees), extras) == (sites, {})
+
+
+# --- Import ---
+
+def test_import_annule_si_le_fichier_est_illisible():
+    donnees = core.DonneesCoffre()
+    donnees.ecrire("exemple.fr", "alice", "ancien", date=1700000100, creation=1700000000)
+    avant = _sites(donnees)
+
+    def lignes():
+        yield "exemple.fr", "alice", "nouveau" # Écrasée
+        yield "exemple.fr", "bob", "ajoute"    # Ajoutée
+        raise ValueError("Document JSON invalide")
+    with pytest.raises(ValueError):
+        core.importer_entrees(donnees, lignes(), politique="ecraser")
+
+    assert _sites(donnees) == avant
+    assert donnees.dates("exemple.fr", "alice") == (1700000000, 1700000100)
+
+
+def test_import_json_en_flux_et_lignes_invalides(coffre):
+    session = core.charger_ou_creer_stockage(MAITRE)
+    core.ajouter_ou_modifier_entree(session.passwords_data, "exemple.fr", "alice", "ancien")
+    session.persister()
+    objets = [{"name": "exemple.fr", "login": {"username": "alice", "password": "nouveau"}},
+              {"name": "exemple.fr", "login": {"username": "", "password": "sans utilisateur"}},
+              {"name": "test.org", "login": {"username": "bob", "password": "mdp", "uris": [{"uri": "https://test.org"}]}}]
+    with open("export.json", "w", encoding="utf-8") as f_export:
+        json.dump({"encrypted": False, "folders": [], "items": objets}, f_export)
+
+    rapport = core.importer_fichier(session, "export.json", politique="renommer")
+    assert (rapport.ajoutees, rapport.renommees, rapport.invalides) == (1, 1, 1)
+    relue = core.charger_ou_creer_stockage(MAITRE).passwords_data
+    assert core.recuperer_utilisateurs_pour_site(relue, "exemple.fr") == ["alice", "alice (2)"]
+    assert core.recuperer_entree(relue, "test.org", "bob") == "mdp"
+
+    with open("tronque.json", "w", encoding="utf-8") as f_export:
+        f_export.write(json.dumps(objets)[:-40])
+    with pytest.raises(ValueError):
+        core.importer_fichier(session, "tronque.json", politique="ecraser")
+    assert core.recuperer_entree(session.passwords_data, "exemple.fr", "alice") == "ancien"
+    assert core.recuperer_utilisateurs_pour_site(session.passwords_data, "exemple.fr") == ["alice", "alice (2)"]